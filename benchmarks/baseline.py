@@ -0,0 +1,54 @@
+"""Import sndict as of another git revision, so that benchmarks can time the
+current code against it in the same process"""
+import atexit
+import importlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+# Last revision before the performance work
+BASELINE_REV = "55671a8"
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_EXTRACT_DIR = None
+
+
+def import_at_revision(module_name, rev=BASELINE_REV):
+    """Import a module of sndict as of git revision rev
+
+    The package is extracted with git archive and imported under the name
+    sndict_<rev>, alongside the current sndict
+
+    Parameters
+    ----------
+    module_name: str
+        Module name, e.g. "sndict.structurednesteddict"
+    rev: str
+        Git revision
+
+    Returns
+    -------
+    module
+    """
+    global _EXTRACT_DIR
+    if _EXTRACT_DIR is None:
+        _EXTRACT_DIR = tempfile.mkdtemp(prefix="sndict_bench_")
+        atexit.register(shutil.rmtree, _EXTRACT_DIR, True)
+        sys.path.insert(0, _EXTRACT_DIR)
+
+    package_name = "sndict_{}".format(rev.replace("~", "_").replace("^", "_"))
+    package_dir = os.path.join(_EXTRACT_DIR, package_name)
+    if not os.path.exists(package_dir):
+        archive = subprocess.check_output(
+            ["git", "archive", "--format=tar",
+             "--prefix={}/".format(package_name), rev + ":sndict"],
+            cwd=_REPO_ROOT)
+        with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+            tar.extractall(_EXTRACT_DIR)
+
+    return importlib.import_module(
+        package_name + module_name[len("sndict"):])
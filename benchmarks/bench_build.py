@@ -0,0 +1,70 @@
+"""Benchmark building and transforming StructuredNestedDicts, which maintain
+cached dimensions, against the baseline revision, which recomputed them on
+every access of dim
+
+Usage, from the repository root:
+
+    python -m benchmarks.bench_build [baseline revision]
+"""
+from __future__ import print_function
+
+import sys
+import timeit
+
+from sndict.structurednesteddict import StructuredNestedDict
+from benchmarks.baseline import import_at_revision, BASELINE_REV
+
+
+def build_flat(branching):
+    """Build a flat dict of 3-tuple keys"""
+    return dict(
+        ((i, j, k), float(i + j + k))
+        for i in range(branching)
+        for j in range(branching)
+        for k in range(branching)
+    )
+
+
+def build_by_nested_set(sndict_class, flat):
+    new_dict = sndict_class(levels=3)
+    for key_tup, val in flat.items():
+        new_dict.nested_set(list(key_tup), val)
+    return new_dict
+
+
+def get_benchmarks(sndict_class, flat):
+    sndict = sndict_class.groupby(flat, by=lambda key_tup: key_tup,
+                                  levels=3)
+    return [
+        ("nested_set", lambda: build_by_nested_set(sndict_class, flat)),
+        ("groupby", lambda: sndict_class.groupby(
+            flat, by=lambda key_tup: key_tup, levels=3)),
+        ("map_values", lambda: sndict.map_values(lambda x: x + 1)),
+        ("filter_values", lambda: sndict.filter_values(lambda x: x > 1)),
+        ("filter_key", lambda: sndict.filter_key(
+            [slice(None), lambda k: k % 2, slice(None)])),
+        ("swap_levels", lambda: sndict.swap_levels(0, 2)),
+        ("dim", lambda: sndict.dim),
+    ]
+
+
+def main(baseline_rev=BASELINE_REV, branching=37, number=3):
+    flat = build_flat(branching)
+    baseline_class = import_at_revision(
+        "sndict.structurednesteddict", baseline_rev).StructuredNestedDict
+    print("{} leaves, baseline {}".format(branching ** 3, baseline_rev))
+    print("{:>14} {:>12} {:>12} {:>8}".format(
+        "operation", "baseline", "current", "speedup"))
+    for (name, baseline_func), (_, current_func) in zip(
+            get_benchmarks(baseline_class, flat),
+            get_benchmarks(StructuredNestedDict, flat)):
+        t_baseline = min(timeit.repeat(baseline_func, number=number,
+                                       repeat=5)) / number
+        t_current = min(timeit.repeat(current_func, number=number,
+                                      repeat=5)) / number
+        print("{:>14} {:>11.4f}s {:>11.4f}s {:>7.2f}x".format(
+            name, t_baseline, t_current, t_baseline / t_current))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
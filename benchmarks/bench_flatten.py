@@ -0,0 +1,54 @@
+"""Benchmark NestedDict.flatten against the previous recursive generator
+
+Usage, from the repository root:
+
+    python -m benchmarks.bench_flatten
+"""
+from __future__ import print_function
+
+import timeit
+
+import six
+
+from sndict.nesteddict import NestedDict
+
+
+def recursive_iterflatten(dictionary, max_depth=None, depth=1):
+    """Recursive-generator flattening, as used before the stack-based engine"""
+    for key, val in six.iteritems(dictionary):
+        if isinstance(val, dict) \
+                and (max_depth is None or depth < max_depth):
+            for partial_key_tup, sub_val in recursive_iterflatten(
+                    val, max_depth=max_depth, depth=depth+1):
+                yield (key,) + partial_key_tup, sub_val
+        else:
+            yield (key, ), val
+
+
+def build_tree(depth, branching):
+    """Build a full NestedDict of given depth and branching factor"""
+    if depth == 0:
+        return 0
+    return NestedDict(
+        (i, build_tree(depth - 1, branching)) for i in range(branching)
+    )
+
+
+def main(number=3):
+    print("{:>6} {:>10} {:>12} {:>12} {:>8}".format(
+        "depth", "leaves", "recursive", "stack", "speedup"))
+    for depth, branching in [(2, 256), (4, 16), (8, 4), (12, 2), (16, 2)]:
+        tree = build_tree(depth, branching)
+        n_leaves = branching ** depth
+        t_recursive = min(timeit.repeat(
+            lambda: list(recursive_iterflatten(tree)),
+            number=number, repeat=3))
+        t_stack = min(timeit.repeat(
+            lambda: list(tree.iterflatten()),
+            number=number, repeat=3))
+        print("{:>6} {:>10} {:>11.4f}s {:>11.4f}s {:>7.2f}x".format(
+            depth, n_leaves, t_recursive, t_stack, t_recursive / t_stack))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark pickling of StructuredNestedDict, as one compact columnar
+payload, and of NestedDict, with default pickling (kept, as it runs
+entirely in C and a Python-level compact format measured slower), against
+the baseline revision
+
+Usage, from the repository root:
+
+    python -m benchmarks.bench_pickle [baseline revision]
+"""
+from __future__ import print_function
+
+import pickle
+import sys
+import timeit
+
+from sndict.nesteddict import NestedDict
+from sndict.structurednesteddict import StructuredNestedDict
+from benchmarks.baseline import import_at_revision, BASELINE_REV
+
+
+def dumps(obj):
+    return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+
+def build_tree(ndict_class, depth, branching):
+    """Build a full NestedDict of given depth and branching factor"""
+    if depth == 0:
+        return 0.5
+    return ndict_class(
+        ("key{}".format(i), build_tree(ndict_class, depth - 1, branching))
+        for i in range(branching)
+    )
+
+
+def main(baseline_rev=BASELINE_REV, number=3):
+    baseline_ndict_class = import_at_revision(
+        "sndict.nesteddict", baseline_rev).NestedDict
+    baseline_sndict_class = import_at_revision(
+        "sndict.structurednesteddict", baseline_rev).StructuredNestedDict
+    print("baseline {}".format(baseline_rev))
+    print("{:>8} {:>6} {:>10} {:>12} {:>12} {:>12} {:>12} {:>8}".format(
+        "type", "depth", "leaves", "base bytes", "new bytes",
+        "base time", "new time", "speedup"))
+    for depth, branching in [(2, 256), (3, 40), (4, 16), (8, 4)]:
+        baseline_tree = build_tree(baseline_ndict_class, depth, branching)
+        tree = build_tree(NestedDict, depth, branching)
+        for name, baseline_obj, obj in [
+            ("ndict", baseline_tree, tree),
+            ("sndict",
+             baseline_sndict_class(baseline_tree, levels=depth),
+             StructuredNestedDict(tree, levels=depth)),
+        ]:
+            assert pickle.loads(dumps(obj)) == obj
+            t_baseline = min(timeit.repeat(
+                lambda: pickle.loads(dumps(baseline_obj)),
+                number=number, repeat=3))
+            t_new = min(timeit.repeat(
+                lambda: pickle.loads(dumps(obj)),
+                number=number, repeat=3))
+            print("{:>8} {:>6} {:>10} {:>12} {:>12} {:>11.4f}s {:>11.4f}s "
+                  "{:>7.2f}x".format(
+                      name, depth, branching ** depth,
+                      len(dumps(baseline_obj)), len(dumps(obj)),
+                      t_baseline, t_new, t_baseline / t_new))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
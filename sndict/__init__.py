@@ -2,11 +2,17 @@ from __future__ import absolute_import
 
 from .nesteddict import NestedDict, ndict
 from .structurednesteddict import StructuredNestedDict, sndict
+from .columnar import ColumnarStructuredNestedDict, csndict
+from .sqlitebacked import SQLiteStructuredNestedDict, sqlsndict
+from .frozen import FrozenStructuredNestedDict, open_frozen
 from . import app
 
 __version__ = '0.1.2'
 __all__ = (
     'ndict', 'NestedDict',
     'sn_dict', 'StructuredNestedDict',
+    'csndict', 'ColumnarStructuredNestedDict',
+    'sqlsndict', 'SQLiteStructuredNestedDict',
+    'FrozenStructuredNestedDict', 'open_frozen',
     'app',
 )
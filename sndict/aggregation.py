@@ -0,0 +1,191 @@
+import collections as col
+import functools
+
+
+# ==== Accumulators ==== #
+
+class SumAccumulator(object):
+    __slots__ = ("total",)
+
+    def __init__(self):
+        """Running sum"""
+        self.total = 0
+
+    def add(self, value):
+        self.total += value
+
+    def result(self):
+        return self.total
+
+
+class CountAccumulator(object):
+    __slots__ = ("count",)
+
+    def __init__(self):
+        """Running count"""
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+
+    def result(self):
+        return self.count
+
+
+class MinAccumulator(object):
+    __slots__ = ("value", "is_set")
+
+    def __init__(self):
+        """Running minimum"""
+        self.value = None
+        self.is_set = False
+
+    def add(self, value):
+        if not self.is_set or value < self.value:
+            self.value = value
+            self.is_set = True
+
+    def result(self):
+        return self.value
+
+
+class MaxAccumulator(object):
+    __slots__ = ("value", "is_set")
+
+    def __init__(self):
+        """Running maximum"""
+        self.value = None
+        self.is_set = False
+
+    def add(self, value):
+        if not self.is_set or value > self.value:
+            self.value = value
+            self.is_set = True
+
+    def result(self):
+        return self.value
+
+
+class MeanAccumulator(object):
+    __slots__ = ("count", "total")
+
+    def __init__(self):
+        """Running mean"""
+        self.count = 0
+        self.total = 0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+
+    def result(self):
+        if self.count == 0:
+            return float("nan")
+        return self.total / float(self.count)
+
+
+class VarAccumulator(object):
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self):
+        """Running sample variance (Welford's algorithm)"""
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def result(self):
+        if self.count < 2:
+            return float("nan")
+        return self.m2 / (self.count - 1)
+
+
+class FunctionAccumulator(object):
+    __slots__ = ("func", "values")
+
+    def __init__(self, func):
+        """Collects values, and applies func to the list of values. Unlike the
+        other accumulators, this keeps every value of the group in memory
+
+        Parameters
+        ----------
+        func: function
+            Function applied to list of values
+        """
+        self.func = func
+        self.values = []
+
+    def add(self, value):
+        self.values.append(value)
+
+    def result(self):
+        return self.func(self.values)
+
+
+ACCUMULATORS = col.OrderedDict([
+    ("sum", SumAccumulator),
+    ("count", CountAccumulator),
+    ("min", MinAccumulator),
+    ("max", MaxAccumulator),
+    ("mean", MeanAccumulator),
+    ("var", VarAccumulator),
+])
+
+BUILTIN_ACCUMULATORS = {
+    sum: SumAccumulator,
+    len: CountAccumulator,
+    min: MinAccumulator,
+    max: MaxAccumulator,
+}
+
+
+def get_accumulator_factory(func):
+    """Resolve an aggregation function to a 0-argument accumulator factory
+
+    Parameters
+    ----------
+    func: str or function
+        One of "sum", "count", "min", "max", "mean", "var", one of the
+        builtins sum/len/min/max, or a function applied to the list of
+        values in each group
+
+    Returns
+    -------
+    function
+    """
+    if func in BUILTIN_ACCUMULATORS:
+        return BUILTIN_ACCUMULATORS[func]
+    elif callable(func):
+        return lambda: FunctionAccumulator(func)
+    elif func in ACCUMULATORS:
+        return ACCUMULATORS[func]
+    else:
+        raise KeyError("Unknown aggregation function: {}".format(func))
+
+
+def get_func_name(func):
+    """Name used to label the result of an aggregation function
+
+    Parameters
+    ----------
+    func: str or function
+
+    Returns
+    -------
+    str
+    """
+    if not callable(func):
+        return func
+    name = getattr(func, "__name__", None)
+    if name is not None:
+        return name
+    elif isinstance(func, functools.partial):
+        # Different partials of the same function need different names
+        return repr(func)
+    # Callable instance
+    return type(func).__name__
@@ -1,29 +1,794 @@
+import collections as col
+import fnmatch
+import functools
+import hashlib
+import heapq
 import os
+import time
+import six
 
-from .utils import split_path
+from .compat import import_futures, import_scandir
 from .nesteddict import NestedDict
 from .structurednesteddict import StructuredNestedDict
 
+FileInfo = col.namedtuple("FileInfo", ["path", "size", "mtime"])
+DirectoryTreeDiff = col.namedtuple("DirectoryTreeDiff", ["added", "removed"])
+DirectoryStats = col.namedtuple("DirectoryStats", ["size", "count", "mtime"])
+HASH_CHUNK_SIZE = 1 << 20
 
-def directory_tree(base_path):
+_clock = getattr(time, "monotonic", time.time)
+
+
+def directory_tree(base_path, workers=None, stat=False, max_depth=None,
+                   include=None, exclude=None, follow_symlinks=False):
     """Compute directory tree as NestedDict
 
+    Directories are scanned with os.scandir, and the NestedDict is built as
+    they are scanned. Keys are sorted at every level, and directories without
+    any (included) files are dropped.
+
     Parameters
     ----------
     base_path: Starting path directory Tree
+    workers: int, optional
+        Number of threads scanning directories concurrently. Defaults to
+        scanning in the current thread
+    stat: bool
+        Whether values are FileInfo(path, size, mtime) rather than paths
+    max_depth: int, optional
+        Maximum depth of files, e.g. 1 for only files directly in base_path.
+        Deeper directories are not scanned
+    include: list, optional
+        Glob patterns. If given, only files whose name or path relative to
+        base_path matches one of them are kept
+    exclude: list, optional
+        Glob patterns. Files and directories whose name or path relative to
+        base_path matches one of them are dropped, without scanning the
+        directories
+    follow_symlinks: bool
+        Whether to descend into symlinked directories
 
     Returns
     -------
     NestedDict
     """
-    path_ndict_data = []
-
-    path_stub_len = len(split_path(base_path))
-    for dirpath, dirnames, filenames in list(os.walk(base_path)):
-        dir_stub_tup = tuple(split_path(dirpath)[path_stub_len:])
-        for filename in filenames:
-            path_ndict_data.append(
-                (dir_stub_tup + (filename,), os.path.join(dirpath, filename))
+    tree = NestedDict()
+    if max_depth is not None and max_depth < 1:
+        return tree
+    scan_func = functools.partial(
+        _scan_directory, scandir=import_scandir(), stat=stat,
+        max_depth=max_depth, include=include, exclude=exclude,
+        follow_symlinks=follow_symlinks,
+    )
+    _walk([(tree, base_path, ())], scan_func, _attach_entries, workers)
+    _drop_empty(tree)
+    return tree
+
+
+def directory_rollup(tree, workers=None):
+    """Compute du-style cumulative statistics of every directory of a tree
+    from directory_tree, in a single bottom-up pass
+
+    Parameters
+    ----------
+    tree: NestedDict
+        Tree from directory_tree, with paths or FileInfos as values. Paths
+        are stat-ed, and files that cannot be stat-ed are skipped
+    workers: int, optional
+        Number of threads stat-ing files concurrently
+
+    Returns
+    -------
+    OrderedDict
+        DirectoryStats(size, count, mtime) of the total size, number of
+        files and latest mtime of all files below each directory, keyed by
+        relative path tuple (with () for the base directory), in DFS order
+    """
+    file_items = list(tree.iterflatten())
+    values = [value for _, value in file_items]
+    if not values or isinstance(values[0], FileInfo):
+        file_stats = [(value.size, value.mtime) for value in values]
+    else:
+        file_stats = _map_threaded(_stat_file, values, workers)
+    file_stats_dict = dict(
+        (key, stats) for (key, _), stats in zip(file_items, file_stats)
+    )
+
+    directories = []
+    stack = [((), tree)]
+    while stack:
+        rel_path, node = stack.pop()
+        directories.append((rel_path, node))
+        for name, value in reversed(list(node.items())):
+            if isinstance(value, dict):
+                stack.append((rel_path + (name,), value))
+
+    rollup = col.OrderedDict((rel_path, None) for rel_path, _ in directories)
+    # Children come after their parents, so reverse to roll up bottom-up
+    for rel_path, node in reversed(directories):
+        size, count, mtime = 0, 0, None
+        for name, value in node.items():
+            key_tup = rel_path + (name,)
+            if isinstance(value, dict):
+                sub_size, sub_count, sub_mtime = rollup[key_tup]
+            elif file_stats_dict[key_tup] is not None:
+                sub_size, sub_mtime = file_stats_dict[key_tup]
+                sub_count = 1
+            else:
+                continue
+            size += sub_size
+            count += sub_count
+            if sub_mtime is not None and (mtime is None or sub_mtime > mtime):
+                mtime = sub_mtime
+        rollup[rel_path] = DirectoryStats(size=size, count=count, mtime=mtime)
+    return rollup
+
+
+def largest_directories(rollup, n=10, by="size", max_depth=None):
+    """Largest directories of a rollup from directory_rollup
+
+    Parameters
+    ----------
+    rollup: OrderedDict
+        Rollup from directory_rollup
+    n: int
+        Number of directories
+    by: ["size", "count", "mtime"]
+        Statistic to rank directories by
+    max_depth: int, optional
+        Only consider directories at most max_depth levels below the base
+        directory
+
+    Returns
+    -------
+    list
+        List of (relative path tuple, DirectoryStats), largest first
+    """
+    field_index = DirectoryStats._fields.index(by)
+    candidates = [
+        (rel_path, stats) for rel_path, stats in rollup.items()
+        if (max_depth is None or len(rel_path) <= max_depth)
+        and stats[field_index] is not None
+    ]
+    return heapq.nlargest(n, candidates, key=lambda item: item[1][field_index])
+
+
+def find_duplicates(tree, workers=None, algorithm="sha256",
+                    prefix_size=None, chunk_size=HASH_CHUNK_SIZE):
+    """Find files with identical contents in a tree from directory_tree
+
+    Only files whose sizes collide are hashed. If prefix_size is given, the
+    first prefix_size bytes of those files are hashed first, and only files
+    whose prefix digests also collide are hashed fully.
+
+    Parameters
+    ----------
+    tree: NestedDict
+        Tree from directory_tree, with paths or FileInfos as values. Files
+        that cannot be read are skipped
+    workers: int, optional
+        Number of threads reading files concurrently
+    algorithm: str
+        Name of hashlib algorithm
+    prefix_size: int, optional
+        Number of bytes to hash before hashing whole files
+    chunk_size: int
+        Number of bytes read at a time
+
+    Returns
+    -------
+    StructuredNestedDict
+        Sizes of duplicate files, keyed by (digest, path), with levels
+        "digest" and "path", sorted by digest and path
+    """
+    values = list(tree.iterflatten_values())
+    if values and isinstance(values[0], FileInfo):
+        size_ls = [(value.path, value.size) for value in values]
+    else:
+        size_ls = [
+            (path, stats[0]) for path, stats
+            in zip(values, _map_threaded(_stat_file, values, workers))
+            if stats is not None
+        ]
+    candidates = _collided([((size,), path, size) for path, size in size_ls])
+
+    if prefix_size is not None:
+        prefix_digest_func = functools.partial(
+            _hash_file, algorithm=algorithm, chunk_size=chunk_size,
+            max_bytes=prefix_size,
+        )
+        prefix_digests = _map_threaded(
+            prefix_digest_func, [path for _, path, _ in candidates], workers)
+        candidates = _collided([
+            (group_key + (digest,), path, size)
+            for (group_key, path, size), digest
+            in zip(candidates, prefix_digests)
+            if digest is not None
+        ])
+
+    digest_func = functools.partial(
+        _hash_file, algorithm=algorithm, chunk_size=chunk_size)
+    digests = [
+        group_key[1] if prefix_size is not None and size <= prefix_size
+        else None
+        for group_key, _, size in candidates
+    ]
+    to_hash = [i for i, digest in enumerate(digests) if digest is None]
+    for i, digest in zip(to_hash, _map_threaded(
+            digest_func, [candidates[i][1] for i in to_hash], workers)):
+        digests[i] = digest
+    duplicates = _collided(sorted(
+        (digest, path, size)
+        for (_, path, size), digest in zip(candidates, digests)
+        if digest is not None
+    ))
+
+    return StructuredNestedDict.from_records(
+        duplicates, by=[0, 1], value=2, level_names=["digest", "path"],
+    )
+
+
+class DirectoryTreeSnapshot(object):
+
+    def __init__(self, base_path, workers=None, stat=False, max_depth=None,
+                 include=None, exclude=None, follow_symlinks=False):
+        """Directory tree (see directory_tree) that can be refreshed
+        incrementally
+
+        The mtime of every scanned directory is remembered. On refresh, every
+        directory is stat-ed, but only directories whose mtime changed are
+        listed again, and the tree is patched in place. Since a directory's
+        mtime only changes when entries are added, removed or renamed, files
+        whose contents change are not detected (though with stat=True, their
+        FileInfo is updated whenever their directory is listed again).
+
+        Parameters
+        ----------
+        base_path: str
+            Starting path directory Tree
+        workers: int, optional
+            Number of threads scanning and stat-ing directories concurrently
+        stat, max_depth, include, exclude, follow_symlinks:
+            See directory_tree
+        """
+        self.base_path = base_path
+        self.workers = workers
+        self.tree = NestedDict()
+        # Listing of each scanned directory, keyed by relative path:
+        #   [mtime, {file name: value}, set of subdirectory names]
+        self._listings = {}
+        self._scan_func = functools.partial(
+            _scan_directory_with_mtime, scandir=import_scandir(), stat=stat,
+            max_depth=max_depth, include=include, exclude=exclude,
+            follow_symlinks=follow_symlinks,
+        )
+
+        if max_depth is None or max_depth >= 1:
+            touched = set()
+            self._scan_subtrees([(base_path, ())], [], touched)
+            self._sort_nodes(touched)
+
+    def refresh(self):
+        """Re-list directories whose mtime changed, and patch tree in place
+
+        Returns
+        -------
+        DirectoryTreeDiff
+            Sorted lists of paths of added and removed files
+        """
+        added, removed = [], []
+        touched = set()
+        new_roots = []
+        # Parents first, so that removed subdirectories are skipped
+        for rel_path in sorted(self._find_changed_directories(), key=len):
+            if rel_path not in self._listings:
+                continue
+            mtime, entries = self._scan_func(self._get_path(rel_path),
+                                             rel_path)
+            if mtime is None:
+                self._remove_directory(rel_path, removed)
+                continue
+
+            listing = self._listings[rel_path]
+            old_files, old_subdirs = listing[1], listing[2]
+            new_files = col.OrderedDict()
+            new_subdirs = set()
+            for name, value, is_dir in entries:
+                if not is_dir:
+                    new_files[name] = value
+                    if old_files.get(name) != value:
+                        self._set_file(rel_path + (name,), value,
+                                       touched, added, name not in old_files)
+                else:
+                    new_subdirs.add(name)
+                    if name not in old_subdirs:
+                        new_roots.append((value, rel_path + (name,)))
+            for name in old_files:
+                if name not in new_files:
+                    self._remove_file(rel_path + (name,), removed)
+            for name in old_subdirs - new_subdirs:
+                self._remove_directory(rel_path + (name,), removed)
+            self._listings[rel_path] = [mtime, new_files, new_subdirs]
+
+        self._scan_subtrees(new_roots, added, touched)
+        self._sort_nodes(touched)
+        return DirectoryTreeDiff(added=sorted(added), removed=sorted(removed))
+
+    def _find_changed_directories(self):
+        """Relative paths of directories whose mtime changed"""
+        rel_paths = list(self._listings)
+        dir_paths = [self._get_path(rel_path) for rel_path in rel_paths]
+        if self.workers is None:
+            mtimes = [_get_mtime(dir_path) for dir_path in dir_paths]
+        else:
+            futures = import_futures()
+            with futures.ThreadPoolExecutor(
+                    max_workers=self.workers) as executor:
+                mtimes = list(executor.map(_get_mtime, dir_paths))
+        return [
+            rel_path for rel_path, mtime in zip(rel_paths, mtimes)
+            if mtime is None or mtime != self._listings[rel_path][0]
+        ]
+
+    def _scan_subtrees(self, roots, added, touched):
+        """Scan new directories and everything below them"""
+        def visit(_, rel_path, result):
+            mtime, entries = result
+            files = col.OrderedDict()
+            subdirs = []
+            for name, value, is_dir in entries:
+                if is_dir:
+                    subdirs.append((None, value, rel_path + (name,)))
+                else:
+                    files[name] = value
+                    self._set_file(rel_path + (name,), value,
+                                   touched, added, True)
+            self._listings[rel_path] = [
+                mtime, files, set(subdir[2][-1] for subdir in subdirs)]
+            return subdirs
+
+        _walk([(None, dir_path, rel_path) for dir_path, rel_path in roots],
+              self._scan_func, visit, self.workers)
+
+    def _set_file(self, key_tup, value, touched, added, is_new):
+        self.tree.nested_set(key_tup, value, dict_type="ndict")
+        if is_new:
+            added.append(self._get_path(key_tup))
+            for i in range(len(key_tup)):
+                touched.add(key_tup[:i])
+
+    def _remove_file(self, key_tup, removed):
+        """Remove file from tree, along with directories left empty"""
+        node_ls = [self.tree]
+        for key in key_tup[:-1]:
+            node_ls.append(node_ls[-1][key])
+        del node_ls[-1][key_tup[-1]]
+        for i in range(len(key_tup) - 1, 0, -1):
+            if node_ls[i]:
+                break
+            del node_ls[i - 1][key_tup[i - 1]]
+        removed.append(self._get_path(key_tup))
+
+    def _remove_directory(self, rel_path, removed):
+        """Remove a directory, and everything below it"""
+        stack = [rel_path]
+        while stack:
+            dir_rel_path = stack.pop()
+            _, files, subdirs = self._listings.pop(dir_rel_path)
+            for name in files:
+                self._remove_file(dir_rel_path + (name,), removed)
+            stack.extend(dir_rel_path + (name,) for name in subdirs)
+        if not rel_path:
+            # Keep checking base_path, in case it is created again
+            self._listings[rel_path] = [None, col.OrderedDict(), set()]
+        elif rel_path[:-1] in self._listings:
+            self._listings[rel_path[:-1]][2].discard(rel_path[-1])
+
+    def _sort_nodes(self, touched):
+        """Restore sorted key order of nodes that had keys added"""
+        for rel_path in touched:
+            try:
+                node = self.tree.nested_get(rel_path) if rel_path \
+                    else self.tree
+            except KeyError:
+                continue
+            items = sorted(node.items(), key=lambda item: item[0])
+            node.clear()
+            node.update(items)
+
+    def _get_path(self, rel_path):
+        return os.path.join(self.base_path, *rel_path)
+
+
+def lazy_directory_tree(base_path, stat=False, max_depth=None, include=None,
+                        exclude=None, follow_symlinks=False, ttl=None):
+    """Directory tree as a LazyDirectoryTree, which only lists each directory
+    when it is first accessed
+
+    Parameters
+    ----------
+    base_path: Starting path directory Tree
+    stat: bool
+        Whether values are FileInfo(path, size, mtime) rather than paths
+    max_depth: int, optional
+        Maximum depth of files. See directory_tree
+    include: list, optional
+        Glob patterns of files to keep. See directory_tree
+    exclude: list, optional
+        Glob patterns of files and directories to drop. See directory_tree
+    follow_symlinks: bool
+        Whether to descend into symlinked directories
+    ttl: float, optional
+        Seconds after which a directory listing is stale, and is listed again
+        on the next access. Defaults to caching listings until invalidate()
+
+    Returns
+    -------
+    LazyDirectoryTree
+    """
+    scan_func = functools.partial(
+        _scan_directory, scandir=import_scandir(), stat=stat,
+        max_depth=max_depth, include=include, exclude=exclude,
+        follow_symlinks=follow_symlinks,
+    )
+    return LazyDirectoryTree(base_path, scan_func, ttl=ttl)
+
+
+class LazyDirectoryTree(NestedDict):
+
+    def __init__(self, path, scan_func, rel_path=(), ttl=None):
+        """NestedDict of a directory, which is listed on first access
+
+        Every read (indexing, nested_get, ix, iteration, len, etc.) lists the
+        directory first if it has not been listed yet, or if its listing is
+        older than ttl. Subdirectories are unlisted LazyDirectoryTrees, so
+        only the directories along accessed paths are ever listed. Unlike
+        directory_tree, directories without files are kept, as empty nodes.
+
+        When a directory is listed again, subdirectories that still exist keep
+        their nodes, along with their own cached listings. Since listings
+        mirror the file system, the tree is read-only, and derived trees
+        (e.g. from map_values, filter_values or copy) are plain NestedDicts.
+        Code that reads dicts directly at the C level, such as json.dumps,
+        sees unlisted nodes as empty, so use convert() first.
+
+        Use lazy_directory_tree to construct.
+
+        Parameters
+        ----------
+        path: str
+            Path of directory
+        scan_func: function
+            _scan_directory, with options bound
+        rel_path: tuple
+            Path relative to the base directory
+        ttl: float, optional
+            Seconds after which the listing is stale
+        """
+        col.OrderedDict.__init__(self)
+        self.path = path
+        self.rel_path = rel_path
+        self.ttl = ttl
+        self._scan_func = scan_func
+        self._listed_at = None
+
+    @property
+    def is_listed(self):
+        """Whether the directory has a listing that is not stale
+
+        Returns
+        -------
+        bool
+        """
+        return self._listed_at is not None and (
+            self.ttl is None or _clock() - self._listed_at < self.ttl)
+
+    def invalidate(self):
+        """Mark the listing of this directory and all listed subdirectories
+        as stale"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            node._listed_at = None
+            stack.extend(
+                child for child in col.OrderedDict.values(node)
+                if isinstance(child, LazyDirectoryTree)
             )
 
-    return NestedDict.from_flat(sorted(path_ndict_data))
+    def _ensure_listed(self):
+        if self.is_listed:
+            return
+        listed_at = _clock()
+        old_children = dict(col.OrderedDict.items(self))
+        col.OrderedDict.clear(self)
+        for name, value, is_dir in self._scan_func(self.path, self.rel_path):
+            if is_dir:
+                child = old_children.get(name)
+                if not isinstance(child, LazyDirectoryTree):
+                    child = self.__class__(
+                        value, self._scan_func,
+                        rel_path=self.rel_path + (name,), ttl=self.ttl,
+                    )
+                value = child
+            col.OrderedDict.__setitem__(self, name, value)
+        self._listed_at = listed_at
+
+    # ==== Listed Reads ==== #
+
+    def __getitem__(self, key):
+        self._ensure_listed()
+        return col.OrderedDict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        self._ensure_listed()
+        return col.OrderedDict.__contains__(self, key)
+
+    def __iter__(self):
+        self._ensure_listed()
+        return col.OrderedDict.__iter__(self)
+
+    def __len__(self):
+        self._ensure_listed()
+        return col.OrderedDict.__len__(self)
+
+    def get(self, key, default=None):
+        self._ensure_listed()
+        return col.OrderedDict.get(self, key, default)
+
+    def keys(self):
+        self._ensure_listed()
+        return col.OrderedDict.keys(self)
+
+    def values(self):
+        self._ensure_listed()
+        return col.OrderedDict.values(self)
+
+    def items(self):
+        self._ensure_listed()
+        return col.OrderedDict.items(self)
+
+    if six.PY2:
+        def iterkeys(self):
+            self._ensure_listed()
+            return col.OrderedDict.iterkeys(self)
+
+        def itervalues(self):
+            self._ensure_listed()
+            return col.OrderedDict.itervalues(self)
+
+        def iteritems(self):
+            self._ensure_listed()
+            return col.OrderedDict.iteritems(self)
+
+    def __eq__(self, other):
+        self._ensure_listed()
+        if isinstance(other, LazyDirectoryTree):
+            other._ensure_listed()
+        return col.OrderedDict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    # ==== Read-only ==== #
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("{} is read-only".format(self.__class__.__name__))
+
+    __setitem__ = __delitem__ = _read_only
+    pop = popitem = setdefault = update = clear = move_to_end = _read_only
+
+    # ==== Other ==== #
+
+    def _new_empty(self):
+        return NestedDict()
+
+    def copy(self):
+        """Shallow copy, as a NestedDict
+
+        Returns
+        -------
+        NestedDict
+        """
+        return NestedDict(self.items())
+
+    def __reduce__(self):
+        # Pickled unlisted, so that it is listed again where it is loaded
+        return self.__class__, (
+            self.path, self._scan_func, self.rel_path, self.ttl,
+        )
+
+    def __repr__(self):
+        # Does not list anything, unlike NestedDict.__repr__
+        if not self.is_listed:
+            return "{}({!r}, unlisted)".format(
+                self.__class__.__name__, self.path)
+        return "{}({!r}, keys={!r})".format(
+            self.__class__.__name__, self.path,
+            list(col.OrderedDict.keys(self)),
+        )
+
+
+def _walk(roots, scan_func, visit, workers=None):
+    """Scan directories, starting from roots, optionally on a thread pool
+
+    Parameters
+    ----------
+    roots: list
+        List of (context, directory path, relative path) to scan
+    scan_func: function
+        Called as scan_func(directory path, relative path) to scan a
+        directory
+    visit: function
+        Called as visit(context, relative path, scan result) in the calling
+        thread, as each scan completes. Returns a list of
+        (context, directory path, relative path) of subdirectories to scan
+    workers: int, optional
+        Number of threads scanning directories concurrently. Defaults to
+        scanning in the calling thread
+    """
+    if workers is None:
+        stack = list(reversed(roots))
+        while stack:
+            context, dir_path, rel_path = stack.pop()
+            result = scan_func(dir_path, rel_path)
+            stack.extend(reversed(visit(context, rel_path, result)))
+        return
+
+    futures = import_futures()
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = dict(
+            (executor.submit(scan_func, dir_path, rel_path),
+             (context, rel_path))
+            for context, dir_path, rel_path in roots
+        )
+        while pending:
+            done, _ = futures.wait(
+                pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                context, rel_path = pending.pop(future)
+                for child_context, dir_path, child_rel_path in visit(
+                        context, rel_path, future.result()):
+                    pending[executor.submit(
+                        scan_func, dir_path, child_rel_path,
+                    )] = (child_context, child_rel_path)
+
+
+def _scan_directory(dir_path, rel_path, scandir, stat, max_depth,
+                    include, exclude, follow_symlinks):
+    """Scan a single directory, returning a list of (name, value, is_dir),
+    sorted by name. For directories, value is the path to scan. Unreadable
+    directories and files are skipped, as in os.walk"""
+    try:
+        dir_entries = list(scandir(dir_path))
+    except OSError:
+        return []
+
+    descend = max_depth is None or len(rel_path) + 1 < max_depth
+    entries = []
+    for dir_entry in dir_entries:
+        entry_rel_path = rel_path + (dir_entry.name,)
+        if exclude and _matches_any(entry_rel_path, exclude):
+            continue
+        try:
+            if dir_entry.is_dir(follow_symlinks=follow_symlinks):
+                if descend:
+                    entries.append((dir_entry.name, dir_entry.path, True))
+                continue
+            elif dir_entry.is_dir():
+                # Symlinked directory that is not followed
+                continue
+            if include and not _matches_any(entry_rel_path, include):
+                continue
+            if stat:
+                stat_result = dir_entry.stat(follow_symlinks=follow_symlinks)
+                value = FileInfo(dir_entry.path, stat_result.st_size,
+                                 stat_result.st_mtime)
+            else:
+                value = dir_entry.path
+        except OSError:
+            continue
+        entries.append((dir_entry.name, value, False))
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+def _scan_directory_with_mtime(dir_path, rel_path, **kwargs):
+    """Scan directory, returning (mtime, entries). The mtime is read before
+    listing, so that changes made during the scan are caught on refresh"""
+    mtime = _get_mtime(dir_path)
+    if mtime is None:
+        return None, []
+    return mtime, _scan_directory(dir_path, rel_path, **kwargs)
+
+
+def _collided(rows):
+    """Keep (group key, path, size) rows whose group key is shared with
+    another row"""
+    counts = col.Counter(group_key for group_key, _, _ in rows)
+    return [row for row in rows if counts[row[0]] > 1]
+
+
+def _map_threaded(func, args, workers=None):
+    """map func over args, on a thread pool if workers is given"""
+    if workers is None:
+        return [func(arg) for arg in args]
+    futures = import_futures()
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, args))
+
+
+def _hash_file(path, algorithm, chunk_size, max_bytes=None):
+    """Hex digest of the contents of file (or of its first max_bytes
+    bytes), or None if it cannot be read"""
+    hasher = hashlib.new(algorithm)
+    remaining = max_bytes
+    try:
+        with open(path, "rb") as f:
+            while remaining is None or remaining > 0:
+                read_size = chunk_size if remaining is None \
+                    else min(chunk_size, remaining)
+                chunk = f.read(read_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+    except (IOError, OSError):
+        return None
+    return hasher.hexdigest()
+
+
+def _stat_file(path):
+    """(size, mtime) of file, or None if it cannot be stat-ed"""
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    return stat_result.st_size, stat_result.st_mtime
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _attach_entries(node, rel_path, entries):
+    """Add scanned entries to node, with an empty NestedDict for each
+    directory, and return (child, path, relative path) of directories"""
+    subdirs = []
+    for name, value, is_dir in entries:
+        if is_dir:
+            child = NestedDict()
+            node[name] = child
+            subdirs.append((child, value, rel_path + (name,)))
+        else:
+            node[name] = value
+    return subdirs
+
+
+def _matches_any(rel_path, patterns):
+    """Whether the name or the relative path matches any glob pattern"""
+    name = rel_path[-1]
+    joined_path = "/".join(rel_path)
+    return any(
+        fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(joined_path, pattern)
+        for pattern in patterns
+    )
+
+
+def _drop_empty(tree):
+    """Remove NestedDicts that are empty, or only contain empty NestedDicts"""
+    nodes = []
+    stack = [(None, None, tree)]
+    while stack:
+        parent, name, node = stack.pop()
+        nodes.append((parent, name, node))
+        for child_name, child in node.items():
+            if isinstance(child, NestedDict):
+                stack.append((node, child_name, child))
+    # Children are visited after their parents, so reverse to remove bottom-up
+    for parent, name, node in reversed(nodes):
+        if parent is not None and not node:
+            del parent[name]
@@ -0,0 +1,58 @@
+"""Asyncio-based mapping over values. Requires Python 3.5+, so this module is
+only imported by the methods that use it."""
+import asyncio
+import inspect
+
+
+async def map_pairs(coro_func, pairs, concurrency, callback=None):
+    """Await coro_func(value) for the values of (key-tuple, value) pairs, with
+    at most concurrency running at a time
+
+    Parameters
+    ----------
+    coro_func: function
+        Coroutine function applied to each value
+    pairs: list
+        List of (key-tuple, value) pairs
+    concurrency: int
+        Maximum number of coro_func calls awaited at a time
+    callback: function, optional
+        Called as callback(key-tuple, new value) as each call completes. If
+        it returns an awaitable, it is awaited
+
+    Returns
+    -------
+    list
+        New values, in the order of pairs
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    results = [None] * len(pairs)
+    # Shared by the workers, so that each pair is taken exactly once
+    indexed_pairs = iter(enumerate(pairs))
+
+    async def worker():
+        for i, (key, val) in indexed_pairs:
+            new_val = await coro_func(val)
+            results[i] = new_val
+            if callback is not None:
+                callback_result = callback(key, new_val)
+                if inspect.isawaitable(callback_result):
+                    await callback_result
+
+    tasks = [asyncio.ensure_future(worker())
+             for _ in range(min(concurrency, len(pairs)))]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return results
+
+
+async def map_values(pairs, coro_func, concurrency, callback, build):
+    """Map values with map_pairs, then build the result from the
+    (key-tuple, new value) pairs with build"""
+    new_values = await map_pairs(coro_func, pairs, concurrency, callback)
+    return build(zip([key for key, _ in pairs], new_values))
@@ -0,0 +1,840 @@
+import array
+import bisect
+import collections as col
+import six
+
+from .nesteddict import NestedDict
+from .exceptions import LevelError
+from .shared import get_filter_func
+from .structurednesteddict import (
+    StructuredNestedDict,
+    FLATTENED_LEVEL_NAME_SEPARATOR, get_key_tuple_class,
+    _wrap_level, _is_criteria,
+)
+from .utils import (
+    GetSetAmbiguousTupleFunctionClass, GetSetFunctionClass,
+    list_is_unique,
+)
+
+CODE_TYPECODE = "l"
+
+
+class ColumnarStructuredNestedDict(object):
+
+    def __init__(self, data=None, levels=None, level_names=None):
+        """Read-only StructuredNestedDict stored as columns
+
+        Each level is stored as an array of integer codes into a per-level
+        table of unique keys, alongside a single list of values. Rows are kept
+        in DFS order, so every subtree is a contiguous range of rows, and
+        subtrees are exposed as views over that range rather than as
+        separate dictionaries. The start row of every subtree is indexed
+        when the columns are built, so looking up a key, len and dim do not
+        scan rows.
+
+        Note: Empty nested dictionaries have no rows, and are dropped.
+
+        Parameters
+        ----------
+        data: StructuredNestedDict, or dict
+            Nested dictionary
+        levels: int
+            Number of levels. Defaults to that of data if data is a
+            StructuredNestedDict
+        level_names: list
+            List of level names
+        """
+        if isinstance(data, StructuredNestedDict):
+            if levels is None:
+                levels = data.levels
+            if level_names is None and data._level_names_is_set:
+                level_names = data.level_names
+        elif levels is None:
+            levels = len(level_names) if level_names is not None else 1
+
+        self._init_columns(levels, level_names)
+        self._encode(_iter_rows(data or {}, levels))
+        self._index_groups()
+
+    @classmethod
+    def from_flat(cls, data, levels=None, level_names=None):
+        """Initialize from a dict keyed by tuples, or an iterable of
+        (key-tuple, value) pairs. Entries do not need to be grouped.
+
+        Parameters
+        ----------
+        data: dict, or iterable
+            Flat data keyed by tuples
+        levels: int
+            Number of levels. Defaults to length of level_names
+        level_names: list
+            List of level names
+
+        Returns
+        -------
+        ColumnarStructuredNestedDict
+        """
+        if levels is None:
+            if level_names is None:
+                raise LevelError("Supply either levels or level_names")
+            levels = len(level_names)
+        if isinstance(data, dict):
+            data = six.iteritems(data)
+
+        new_obj = cls.__new__(cls)
+        new_obj._init_columns(levels, level_names)
+        new_obj._encode(data)
+        new_obj._group_rows()
+        return new_obj
+
+    @classmethod
+    def _from_columns(cls, level_keys, key_codes, codes, values,
+                      level_names, start=0, stop=None, group_index=None):
+        """Build a view directly from existing columns, without copying. The
+        group index is built unless it is given, as
+        (group_starts, group_lookup, parent_group)"""
+        new_obj = cls.__new__(cls)
+        new_obj._levels = len(codes)
+        new_obj._level_names_is_set = level_names is not None
+        new_obj._level_names = level_names
+        new_obj._level_keys = level_keys
+        new_obj._key_codes = key_codes
+        new_obj._codes = codes
+        new_obj._values = values
+        new_obj._start = start
+        new_obj._stop = len(values) if stop is None else stop
+        if group_index is None:
+            new_obj._index_groups()
+        else:
+            (new_obj._group_starts, new_obj._group_lookup,
+             new_obj._parent_group) = group_index
+        return new_obj
+
+    def _init_columns(self, levels, level_names):
+        """Set up empty columns"""
+        self._levels = levels
+        if level_names is None:
+            self._level_names_is_set = False
+            self._level_names = None
+        else:
+            assert len(level_names) == levels
+            assert list_is_unique(level_names)
+            self._level_names_is_set = True
+            self._level_names = tuple(level_names)
+        self._level_keys = [[] for _ in range(levels)]
+        self._key_codes = [{} for _ in range(levels)]
+        self._codes = [array.array(CODE_TYPECODE) for _ in range(levels)]
+        self._values = []
+        self._start = 0
+        self._stop = 0
+        self._group_starts = [array.array(CODE_TYPECODE, [0])
+                              for _ in range(levels)]
+        self._group_lookup = [{} for _ in range(levels)]
+        self._parent_group = 0
+
+    def _encode(self, rows):
+        """Append (key-tuple, value) rows, dictionary-encoding each key"""
+        level_keys = self._level_keys
+        key_codes = self._key_codes
+        codes = self._codes
+        values = self._values
+        for key_tup, val in rows:
+            if len(key_tup) != self._levels:
+                raise LevelError("Key {} does not have {} levels".format(
+                    key_tup, self._levels))
+            for i, key in enumerate(key_tup):
+                code = key_codes[i].get(key)
+                if code is None:
+                    code = key_codes[i][key] = len(level_keys[i])
+                    level_keys[i].append(key)
+                codes[i].append(code)
+            values.append(val)
+        self._stop = len(values)
+
+    def _group_rows(self):
+        """Reorder rows so every subtree is contiguous, keeping first-insertion
+        order at every level. Repeated keys keep the last value."""
+        prefix_ranks = [{} for _ in range(self._levels)]
+        final_rows = {}
+        for row in range(len(self._values)):
+            prefix = ()
+            rank_tup = ()
+            for i in range(self._levels):
+                prefix += (self._codes[i][row],)
+                rank = prefix_ranks[i].setdefault(prefix,
+                                                  len(prefix_ranks[i]))
+                rank_tup += (rank,)
+            final_rows[rank_tup[-1]] = rank_tup, row
+
+        order = [row for _, row in sorted(six.itervalues(final_rows))]
+        self._codes = [
+            array.array(CODE_TYPECODE, [codes[row] for row in order])
+            for codes in self._codes
+        ]
+        self._values = [self._values[row] for row in order]
+        self._stop = len(self._values)
+        self._index_groups()
+
+    def _index_groups(self):
+        """Index the rows of every subtree, for rows in DFS order.
+
+        For each level, group_starts holds the start row of every group of
+        rows sharing their codes up to that level, followed by the number of
+        rows, and group_lookup maps (index of the group in the level above,
+        code) to the index of the group."""
+        num_rows = len(self._values)
+        group_starts_ls = []
+        group_lookup_ls = []
+        parent_starts = [0] if num_rows else []
+        for codes in self._codes:
+            group_starts = array.array(CODE_TYPECODE)
+            group_lookup = {}
+            parent = -1
+            for row in range(num_rows):
+                if parent + 1 < len(parent_starts) \
+                        and parent_starts[parent + 1] == row:
+                    parent += 1
+                elif codes[row] == codes[row - 1]:
+                    continue
+                group_lookup[(parent, codes[row])] = len(group_starts)
+                group_starts.append(row)
+            parent_starts = group_starts[:]
+            group_starts.append(num_rows)
+            group_starts_ls.append(group_starts)
+            group_lookup_ls.append(group_lookup)
+        self._group_starts = group_starts_ls
+        self._group_lookup = group_lookup_ls
+        self._parent_group = 0
+
+    def _view(self, start, stop, drop_levels=0):
+        """View over the row range of a group, optionally dropping top
+        levels"""
+        if self._level_names_is_set:
+            level_names = self._level_names[drop_levels:]
+        else:
+            level_names = None
+        if drop_levels:
+            parent_group = bisect.bisect_left(
+                self._group_starts[drop_levels - 1], start)
+        else:
+            parent_group = self._parent_group
+        return self._from_columns(
+            self._level_keys[drop_levels:], self._key_codes[drop_levels:],
+            self._codes[drop_levels:], self._values,
+            level_names, start, stop,
+            group_index=(self._group_starts[drop_levels:],
+                         self._group_lookup[drop_levels:], parent_group),
+        )
+
+    def _replace_rows(self, rows):
+        """New ColumnarStructuredNestedDict with a subset of rows, sharing key
+        tables"""
+        return self._from_columns(
+            self._level_keys, self._key_codes,
+            [array.array(CODE_TYPECODE, [codes[row] for row in rows])
+             for codes in self._codes],
+            [self._values[row] for row in rows],
+            self._level_names,
+        )
+
+    def _iter_groups(self, levels):
+        """Iterate over (start, stop) row ranges of contiguous rows sharing
+        their first levels+1 codes"""
+        group_starts = self._group_starts[levels]
+        for i in range(*self._get_group_range(levels)):
+            yield group_starts[i], group_starts[i + 1]
+
+    def _get_group_range(self, level):
+        """Range of indices of the groups of a level within the view"""
+        group_starts = self._group_starts[level]
+        return (bisect.bisect_left(group_starts, self._start),
+                bisect.bisect_left(group_starts, self._stop))
+
+    # ==== Properties ==== #
+
+    @property
+    def dim(self):
+        """Dimensions of whole ColumnarStructuredNestedDict
+
+        Returns
+        -------
+        tuple:
+            Tuple of widths of nested dictionaries, one per level
+        """
+        dim_ls = []
+        for level in range(self._levels):
+            start, stop = self._get_group_range(level)
+            dim_ls.append(stop - start)
+        return tuple(dim_ls)
+
+    @property
+    def levels(self):
+        """Number of levels
+
+        Returns
+        -------
+        int
+        """
+        return self._levels
+
+    @property
+    def level_names(self):
+        """Names of levels. Defaults to ["level0", "level1", ...] is no names
+        are provided
+
+        Returns
+        -------
+        list
+        """
+        if self._level_names_is_set:
+            return tuple(self._level_names)
+        else:
+            return ["level{i}".format(i=i) for i in range(self._levels)]
+
+    @property
+    def dim_dict(self):
+        """Dimensions of whole ColumnarStructuredNestedDict as dict
+
+        Returns
+        -------
+        dict
+            Dimensions keyed by level name
+        """
+        return dict(zip(self.level_names, self.dim))
+
+    # ==== Dict-like Access ==== #
+
+    def keys(self):
+        """Top-level keys, in order
+
+        Returns
+        -------
+        list
+        """
+        level_keys = self._level_keys[0]
+        codes = self._codes[0]
+        return [level_keys[codes[start]] for start, _ in self._iter_groups(0)]
+
+    def values(self):
+        """Top-level values (or subtree views), in order
+
+        Returns
+        -------
+        list
+        """
+        return [val for _, val in self.items()]
+
+    def items(self):
+        """Top-level (key, value) pairs, in order
+
+        Returns
+        -------
+        list
+        """
+        return [(key_tup[0], val) for key_tup, val
+                in self.iterflatten(levels=0, named=False)]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        start, stop = self._get_group_range(0)
+        return stop - start
+
+    def __contains__(self, key):
+        try:
+            self._locate(key)
+            return True
+        except KeyError:
+            return False
+
+    def __getitem__(self, key):
+        start, stop = self._locate(key)
+        if self._levels == 1:
+            return self._values[start]
+        return self._view(start, stop, drop_levels=1)
+
+    def _locate(self, key):
+        """Row range of a top-level key"""
+        code = self._key_codes[0].get(key)
+        group = self._group_lookup[0].get((self._parent_group, code))
+        if group is None:
+            raise KeyError(key)
+        group_starts = self._group_starts[0]
+        return group_starts[group], group_starts[group + 1]
+
+    # ==== Iterators ==== #
+
+    def iterflatten(self, levels=-1, named=True):
+        """Returns an iterator with multiple levels flattened. If not all
+        levels are flattened, values are views of the remaining levels
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+            Defaults to flattening all levels.
+        named: bool
+            Whether output key-tuples are namedtuples
+
+        Returns
+        -------
+        iterator
+        """
+        levels = self._wrap_level(levels)
+        key_tup_class = get_key_tuple_class(self.level_names[:levels + 1]) \
+            if named else tuple
+
+        level_keys_ls = self._level_keys[:levels + 1]
+        codes_ls = self._codes[:levels + 1]
+        if levels == self._levels - 1:
+            for row in range(self._start, self._stop):
+                yield tuple.__new__(key_tup_class, [
+                    level_keys[codes[row]]
+                    for level_keys, codes in zip(level_keys_ls, codes_ls)
+                ]), self._values[row]
+        else:
+            for start, stop in self._iter_groups(levels):
+                yield tuple.__new__(key_tup_class, [
+                    level_keys[codes[start]]
+                    for level_keys, codes in zip(level_keys_ls, codes_ls)
+                ]), self._view(start, stop, drop_levels=levels + 1)
+
+    def iterflatten_keys(self, levels=-1, named=True):
+        """Returns an iterator with of keys of flattened dict
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+        named: bool
+            Whether output key-tuples are namedtuples
+
+        Returns
+        -------
+        iterator
+        """
+        for key, _ in self.iterflatten(levels=levels, named=named):
+            yield key
+
+    def iterflatten_values(self, levels=-1):
+        """Returns an iterator with of values of flattened dict
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+
+        Returns
+        -------
+        iterator
+        """
+        levels = self._wrap_level(levels)
+        if levels == self._levels - 1:
+            return iter(self._values[self._start:self._stop])
+        return (val for _, val in self.iterflatten(levels, named=False))
+
+    def flatten(self, levels=-1, named=True, flattened_name=None):
+        """Returns a ColumnarStructuredNestedDict with multiple levels
+        flattened into a single level of key-tuples
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+            Defaults to flattening all levels.
+        named: bool
+            Whether output key-tuples are namedtuples
+        flattened_name: str
+            Name of new flattened level. Defaults to original level
+            names joined by "___"
+
+        Returns
+        -------
+        ColumnarStructuredNestedDict
+        """
+        levels = self._wrap_level(levels)
+        if not self._level_names_is_set:
+            new_level_names = None
+        else:
+            if flattened_name is None:
+                flattened_name = FLATTENED_LEVEL_NAME_SEPARATOR.join(
+                    self.level_names[:levels + 1]
+                )
+            new_level_names = (flattened_name,) + self.level_names[levels + 1:]
+
+        key_tup_class = get_key_tuple_class(self.level_names[:levels + 1]) \
+            if named else tuple
+
+        flat_keys = []
+        flat_key_codes = {}
+        flat_codes = array.array(CODE_TYPECODE)
+        codes_ls = self._codes[:levels + 1]
+        for row in range(self._start, self._stop):
+            code_tup = tuple(codes[row] for codes in codes_ls)
+            code = flat_key_codes.get(code_tup)
+            if code is None:
+                code = flat_key_codes[code_tup] = len(flat_keys)
+                flat_keys.append(tuple.__new__(key_tup_class, [
+                    level_keys[i] for level_keys, i
+                    in zip(self._level_keys, code_tup)
+                ]))
+            flat_codes.append(code)
+
+        return self._from_columns(
+            [flat_keys] + self._level_keys[levels + 1:],
+            [dict(zip(flat_keys, range(len(flat_keys))))]
+            + self._key_codes[levels + 1:],
+            [flat_codes] + [codes[self._start:self._stop]
+                            for codes in self._codes[levels + 1:]],
+            self._values[self._start:self._stop],
+            new_level_names,
+        )
+
+    def flatten_keys(self, levels=-1, named=True):
+        """Returns a list of keys of flattened dict
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+        named: bool
+            Whether output key-tuples are namedtuples
+
+        Returns
+        -------
+        list
+        """
+        return list(self.iterflatten_keys(levels=levels, named=named))
+
+    def flatten_values(self, levels=-1):
+        """Returns a list of values of flattened dict
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+
+        Returns
+        -------
+        list
+        """
+        return list(self.iterflatten_values(levels=levels))
+
+    def unique_keys(self, named=False, sort_keys=True):
+        """Returns the unique keys in each level of the dictionary
+
+        Parameters
+        ----------
+        named: bool
+            If True, return OrderedDict of list of keys of each level. If False,
+            return a list of list of keys.
+        sort_keys: bool
+            Whether to sort each list of keys
+
+        Returns
+        -------
+        list or dict
+        """
+        unique_keys = col.OrderedDict()
+        for level_name, level_keys, codes in zip(
+                self.level_names, self._level_keys, self._codes):
+            unique_keys[level_name] = [
+                level_keys[code]
+                for code in set(codes[self._start:self._stop])
+            ]
+            if sort_keys:
+                unique_keys[level_name].sort()
+
+        if named:
+            return unique_keys
+        else:
+            return unique_keys.values()
+
+    # ==== Transformation ==== #
+
+    def stratify(self, levels=None, stratified_names=None):
+        """Increases depth by splitting up the tuple keys of the top-most level
+
+        Parameters
+        ----------
+        levels: int, default=None
+            Number of levels to stratify by. Defaults to length of first key
+            minus one.
+        stratified_names: default=None
+            Names of newly created stratified levels. Must be same length
+            as levels + 1.
+
+        Returns
+        -------
+        ColumnarStructuredNestedDict
+        """
+        if self._stop == self._start:
+            raise LevelError("Cannot infer stratify-levels")
+        top_keys = self._level_keys[0]
+        top_codes = self._codes[0][self._start:self._stop]
+        if levels is None:
+            levels = len(top_keys[top_codes[0]]) - 1
+
+        split_keys = [[] for _ in range(levels + 1)]
+        split_key_codes = [{} for _ in range(levels + 1)]
+        split_codes = [array.array(CODE_TYPECODE) for _ in range(levels + 1)]
+        code_map = {}
+        for top_code in top_codes:
+            new_code_tup = code_map.get(top_code)
+            if new_code_tup is None:
+                key_tup = top_keys[top_code]
+                if len(key_tup) < levels + 1:
+                    raise LevelError("Key {} is too short to stratify by {} "
+                                     "levels".format(key_tup, levels))
+                parts = tuple(key_tup[:levels]) + (
+                    key_tup[levels] if len(key_tup) == levels + 1
+                    else tuple(key_tup[levels:]),
+                )
+                new_code_tup = []
+                for i, part in enumerate(parts):
+                    code = split_key_codes[i].get(part)
+                    if code is None:
+                        code = split_key_codes[i][part] = len(split_keys[i])
+                        split_keys[i].append(part)
+                    new_code_tup.append(code)
+                code_map[top_code] = new_code_tup
+            for codes, code in zip(split_codes, new_code_tup):
+                codes.append(code)
+
+        remaining_names = self.level_names[1:]
+        if stratified_names:
+            assert len(stratified_names) == levels + 1
+            level_names = tuple(stratified_names) + tuple(remaining_names)
+        else:
+            candidate = tuple(self.level_names[0].split(
+                FLATTENED_LEVEL_NAME_SEPARATOR
+            ))
+            if len(candidate) == levels + 1 and self._level_names_is_set:
+                level_names = candidate + remaining_names
+            else:
+                level_names = None
+
+        new_obj = self._from_columns(
+            split_keys + self._level_keys[1:],
+            split_key_codes + self._key_codes[1:],
+            split_codes + [codes[self._start:self._stop]
+                           for codes in self._codes[1:]],
+            self._values[self._start:self._stop],
+            level_names,
+        )
+        # Distinct tuple keys can share a stratified prefix non-contiguously
+        new_obj._group_rows()
+        return new_obj
+
+    def filter_key(self, criteria_ls, filter_out=False, drop_empty=True):
+        """Filter ColumnarStructuredNestedDict by criteria.
+
+        The criteria used in the following ways, based on type:
+            1. slice(None): Keep all
+            2. function: Keep if function(key) is True
+            3. list, set: Keep if key in list/set
+            4. other: Keep if key==other
+
+        Criteria are evaluated once per unique key in each level of the
+        remaining rows, and rows are then selected by code.
+
+        Parameters
+        ----------
+        criteria_ls: list or dict
+            Filter based on criteria
+        filter_out: bool
+            Whether to filter in or out
+        drop_empty:
+            Unused. Empty nested dictionaries are always dropped
+
+        Returns
+        -------
+        ColumnarStructuredNestedDict
+        """
+        if len(criteria_ls) == 0:
+            raise KeyError("criteria_ls cannot be empty")
+
+        if isinstance(criteria_ls, dict):
+            unused = set(criteria_ls) - set(self.level_names)
+            if unused:
+                raise RuntimeError("Unused criteria for: {}".format(unused))
+            criteria_ls = [criteria_ls.get(level_name, slice(None))
+                           for level_name in self.level_names]
+
+        rows = range(self._start, self._stop)
+        for level_keys, codes, criteria in zip(
+                self._level_keys, self._codes, criteria_ls):
+            if criteria == slice(None) and not filter_out:
+                continue
+            filter_func = get_filter_func(criteria, filter_out=filter_out)
+            # Only the keys of the remaining rows are evaluated
+            keep = dict(
+                (code, filter_func(level_keys[code]))
+                for code in set(codes[row] for row in rows)
+            )
+            rows = [row for row in rows if keep[codes[row]]]
+        return self._replace_rows(rows)
+
+    def filter_values(self, criteria, filter_out=False):
+        """Filter ColumnarStructuredNestedDict values by criteria.
+
+        The criteria used in the following ways, based on type:
+            1. slice(None): Keep all
+            2. function: Keep if function(key) is True
+            3. list, set: Keep if key in list/set
+            4. other: Keep if key==other
+
+        Parameters
+        ----------
+        criteria: See above
+            Filter based on criteria
+        filter_out: bool
+            Whether to filter in or out
+
+        Returns
+        -------
+        ColumnarStructuredNestedDict
+        """
+        filter_func = get_filter_func(criteria, filter_out=filter_out)
+        values = self._values
+        return self._replace_rows([
+            row for row in range(self._start, self._stop)
+            if filter_func(values[row])
+        ])
+
+    # ==== Getters ==== #
+
+    def nested_get(self, key_list):
+        """Get value (or subtree view) at depth
+
+        Parameters
+        ----------
+        key_list: list
+            List of keys, one for each dict depth
+
+        Returns
+        -------
+        obj
+        """
+        if len(key_list) == 0:
+            raise KeyError("key_list cannot be empty")
+        pointer = self
+        for key in key_list:
+            pointer = pointer[key]
+        return pointer
+
+    def has_nested_key(self, key_list):
+        """Check if nested keys are valid
+
+        Parameters
+        ----------
+        key_list: list
+            List of keys, one for each dict depth
+
+        Returns
+        -------
+        bool
+        """
+        try:
+            self.nested_get(key_list)
+            return True
+        except KeyError:
+            return False
+
+    def _get_multiple(self, key_or_criteria_ls):
+        """Check whether list has keys or criteria"""
+        if any(map(_is_criteria, key_or_criteria_ls)):
+            return self.filter_key(criteria_ls=key_or_criteria_ls)\
+                .flatten_values(len(key_or_criteria_ls) - 1)
+        else:
+            return self.nested_get(key_or_criteria_ls)
+
+    def _set_multiple(self, key_or_criteria_ls, val):
+        """ColumnarStructuredNestedDicts are read-only"""
+        raise TypeError("{} is read-only".format(self.__class__.__name__))
+
+    @property
+    def ixkeys(self):
+        """Indexer that allows for indexing by nested key list. See
+        StructuredNestedDict.ixkeys
+
+        Returns
+        -------
+        Indexable
+        """
+        return GetSetFunctionClass(
+            get_func=self._get_multiple,
+            set_func=self._set_multiple,
+        )
+
+    @property
+    def ix(self):
+        """Indexer that allows for indexing by nested key/criteria list. See
+        StructuredNestedDict.ix
+
+        Returns
+        -------
+        Indexable
+        """
+        return GetSetAmbiguousTupleFunctionClass(
+            get_func=self._get_multiple,
+            set_func=self._set_multiple,
+        )
+
+    # ==== Conversion ==== #
+
+    def to_sndict(self):
+        """Materialize as a StructuredNestedDict
+
+        Returns
+        -------
+        StructuredNestedDict
+        """
+        return StructuredNestedDict.from_trusted(
+            NestedDict.from_flat(
+                self.iterflatten(named=False), dict_type="odict"),
+            levels=self._levels,
+            level_names=self._level_names,
+        )
+
+    # ==== Other ==== #
+
+    def __repr__(self):
+        args_string_ls = [
+            "rows={rows}".format(rows=self._stop - self._start),
+            "levels={levels}".format(levels=self._levels),
+        ]
+        if self._level_names_is_set:
+            args_string_ls.append("level_names={level_names}".format(
+                level_names=self.level_names
+            ))
+        return "{class_name}({args_string})".format(
+            class_name=self.__class__.__name__,
+            args_string=", ".join(args_string_ls),
+        )
+
+    def _wrap_level(self, level):
+        """Wrap a level argument"""
+        return _wrap_level(level, allowed_level=self.levels)
+
+
+def _iter_rows(data, levels):
+    """Stack-based DFS over a nested dict of fixed depth, yielding
+    (key-tuple, value) rows"""
+    stack = [(six.iteritems(data), ())]
+    while stack:
+        iterator, prefix = stack[-1]
+        for key, val in iterator:
+            if len(stack) < levels:
+                if not isinstance(val, dict):
+                    raise TypeError(
+                        "Expected a dict at {}".format(prefix + (key,)))
+                stack.append((six.iteritems(val), prefix + (key,)))
+                break
+            yield prefix + (key,), val
+        else:
+            stack.pop()
+
+
+csndict = ColumnarStructuredNestedDict
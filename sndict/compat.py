@@ -1,5 +1,47 @@
+import six
+
+
 def iter_to_list(x):
     if isinstance(x, list):
         return x
     else:
         return list(x)
+
+
+def import_numpy():
+    """Import numpy, which is an optional dependency"""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("numpy is required for this operation")
+    return numpy
+
+
+def open_csv(path, mode="r"):
+    """Open file for the csv module, which needs binary mode in Python 2 and
+    newline="" in Python 3"""
+    if six.PY2:
+        return open(path, mode + "b")
+    return open(path, mode, newline="")
+
+
+def import_futures():
+    """Import concurrent.futures, which needs the futures backport on
+    Python 2"""
+    try:
+        from concurrent import futures
+    except ImportError:
+        raise ImportError("concurrent.futures is required for this operation")
+    return futures
+
+
+def import_scandir():
+    """Get os.scandir, or the scandir backport on Python 2"""
+    try:
+        from os import scandir
+    except ImportError:
+        try:
+            from scandir import scandir
+        except ImportError:
+            raise ImportError("scandir is required for this operation")
+    return scandir
@@ -0,0 +1,755 @@
+import collections as col
+import json
+import mmap
+import os
+import pickle
+import six
+import struct
+import weakref
+
+from .exceptions import LevelError
+from .shared import get_filter_func
+from .structurednesteddict import (
+    StructuredNestedDict,
+    get_key_tuple_class, _wrap_level, _is_criteria,
+)
+from .utils import GetSetAmbiguousTupleFunctionClass, GetSetFunctionClass
+
+MAGIC = b"SNDFRZ01"
+HEADER_FORMAT = "<8sqq"
+INT_FORMAT = "<q"
+INT_SIZE = struct.calcsize(INT_FORMAT)
+WRITE_CHUNK_SIZE = 65536
+
+# Open FrozenFiles by absolute path, reused when views are unpickled
+_OPEN_FILES = weakref.WeakValueDictionary()
+
+
+class FrozenStructuredNestedDict(object):
+
+    def __init__(self, frozen_file, depth=0, start=0, stop=None):
+        """Read-only StructuredNestedDict backed by a memory-mapped file
+        written by StructuredNestedDict.freeze. Use open_frozen to open a
+        file.
+
+        Nothing is loaded up front: keys and values are unpickled from the
+        mapped pages as they are accessed, and lookups binary-search the
+        sorted per-level key tables. Since the file is mapped read-only,
+        processes opening the same file share its memory pages.
+
+        Parameters
+        ----------
+        frozen_file: FrozenFile
+            Opened frozen file
+        depth: int
+            Level of the file at which this view starts
+        start: int
+            First entry of the view at depth
+        stop: int
+            End of the entries of the view at depth
+        """
+        self._file = frozen_file
+        self._depth = depth
+        self._start = start
+        self._stop = frozen_file.num_entries(depth) if stop is None else stop
+
+    def _view(self, depth, start, stop):
+        return self.__class__(self._file, depth, start, stop)
+
+    # ==== Properties ==== #
+
+    @property
+    def dim(self):
+        """Dimensions of whole FrozenStructuredNestedDict
+
+        Returns
+        -------
+        tuple:
+            Tuple of widths of nested dictionaries, one per level
+        """
+        dim_ls = []
+        start, stop = self._start, self._stop
+        for depth in range(self._depth, self._file.levels):
+            dim_ls.append(stop - start)
+            if depth < self._file.levels - 1:
+                child_starts = self._file.child_starts[depth]
+                start, stop = child_starts[start], child_starts[stop]
+        return tuple(dim_ls)
+
+    @property
+    def levels(self):
+        """Number of levels
+
+        Returns
+        -------
+        int
+        """
+        return self._file.levels - self._depth
+
+    @property
+    def level_names(self):
+        """Names of levels. Defaults to ["level0", "level1", ...] is no names
+        are provided
+
+        Returns
+        -------
+        list
+        """
+        if self._file.level_names is not None:
+            return tuple(self._file.level_names[self._depth:])
+        else:
+            return ["level{i}".format(i=i)
+                    for i in range(self._depth, self._file.levels)]
+
+    @property
+    def dim_dict(self):
+        """Dimensions of whole FrozenStructuredNestedDict as dict
+
+        Returns
+        -------
+        dict
+            Dimensions keyed by level name
+        """
+        return dict(zip(self.level_names, self.dim))
+
+    # ==== Dict-like Access ==== #
+
+    def keys(self):
+        """Keys, in order
+
+        Returns
+        -------
+        list
+        """
+        key_table = self._file.key_tables[self._depth]
+        return [key_table[code] for code
+                in self._file.codes[self._depth][self._start:self._stop]]
+
+    def values(self):
+        """Values (or subtree views), in order
+
+        Returns
+        -------
+        list
+        """
+        return [self._get_value(self._depth, entry)
+                for entry in range(self._start, self._stop)]
+
+    def items(self):
+        """(key, value) pairs, in order
+
+        Returns
+        -------
+        list
+        """
+        return [(key_tup[0], val) for key_tup, val
+                in self.iterflatten(levels=0, named=False)]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __getitem__(self, key):
+        entry = self._find(key)
+        if entry is None:
+            raise KeyError(key)
+        return self._get_value(self._depth, entry)
+
+    def get(self, key, default=None):
+        entry = self._find(key)
+        if entry is None:
+            return default
+        return self._get_value(self._depth, entry)
+
+    def _find(self, key):
+        """Binary-search for the entry of key in this view, or None"""
+        frozen_file = self._file
+        code = frozen_file.key_tables[self._depth].index(key)
+        if code is None:
+            return None
+        codes = frozen_file.codes[self._depth]
+        sorted_entries = frozen_file.sorted_entries[self._depth]
+        low, high = self._start, self._stop
+        while low < high:
+            mid = (low + high) // 2
+            mid_code = codes[sorted_entries[mid]]
+            if mid_code < code:
+                low = mid + 1
+            elif mid_code > code:
+                high = mid
+            else:
+                return sorted_entries[mid]
+        return None
+
+    def _get_value(self, depth, entry):
+        """Value of entry, or view of its children"""
+        frozen_file = self._file
+        if depth == frozen_file.levels - 1:
+            return frozen_file.values[entry]
+        child_starts = frozen_file.child_starts[depth]
+        return self._view(depth + 1, child_starts[entry],
+                          child_starts[entry + 1])
+
+    # ==== Iterators ==== #
+
+    def iterflatten(self, levels=-1, named=True):
+        """Returns an iterator with multiple levels flattened. If not all
+        levels are flattened, values are views of the remaining levels
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+            Defaults to flattening all levels.
+        named: bool
+            Whether output key-tuples are namedtuples
+
+        Returns
+        -------
+        iterator
+        """
+        levels = self._wrap_level(levels)
+        key_tup_class = get_key_tuple_class(self.level_names[:levels + 1]) \
+            if named else tuple
+        for key_tup, (depth, entry) in self._iter_entries(levels):
+            yield tuple.__new__(key_tup_class, key_tup), \
+                self._get_value(depth, entry)
+
+    def _iter_entries(self, levels, filter_func_ls=()):
+        """Stack-based DFS yielding (key-tuple, (depth, entry)) for entries
+        levels below the top of the view, optionally filtering keys with a
+        function per level"""
+        frozen_file = self._file
+        bottom = self._depth + levels
+
+        def iter_range(depth, start, stop):
+            # Codes of siblings are read in bulk
+            return six.moves.zip(range(start, stop),
+                                 frozen_file.codes[depth][start:stop])
+
+        stack = [(iter_range(self._depth, self._start, self._stop), ())]
+        while stack:
+            iterator, prefix = stack[-1]
+            depth = self._depth + len(prefix)
+            level = len(prefix)
+            key_table = frozen_file.key_tables[depth]
+            filter_func = filter_func_ls[level] \
+                if level < len(filter_func_ls) else None
+            for entry, code in iterator:
+                key = key_table[code]
+                if filter_func is not None and not filter_func(key):
+                    continue
+                if depth < bottom:
+                    child_starts = frozen_file.child_starts[depth]
+                    stack.append((
+                        iter_range(depth + 1, child_starts[entry],
+                                   child_starts[entry + 1]),
+                        prefix + (key,),
+                    ))
+                    break
+                yield prefix + (key,), (depth, entry)
+            else:
+                stack.pop()
+
+    def iterflatten_keys(self, levels=-1, named=True):
+        """Returns an iterator with of keys of flattened dict
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+        named: bool
+            Whether output key-tuples are namedtuples
+
+        Returns
+        -------
+        iterator
+        """
+        return (key for key, _ in self.iterflatten(levels, named))
+
+    def iterflatten_values(self, levels=-1):
+        """Returns an iterator with of values of flattened dict
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+
+        Returns
+        -------
+        iterator
+        """
+        return (val for _, val in self.iterflatten(levels, named=False))
+
+    def flatten_values(self, levels=-1):
+        """Returns a list of values of flattened dict
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+
+        Returns
+        -------
+        list
+        """
+        return list(self.iterflatten_values(levels=levels))
+
+    def unique_keys(self, named=False, sort_keys=True):
+        """Returns the unique keys in each level of the dictionary. For a
+        whole file, these are read directly from the key tables
+
+        Parameters
+        ----------
+        named: bool
+            If True, return OrderedDict of list of keys of each level. If False,
+            return a list of list of keys.
+        sort_keys: bool
+            Whether to sort each list of keys
+
+        Returns
+        -------
+        list or dict
+        """
+        frozen_file = self._file
+        unique_keys = col.OrderedDict()
+        start, stop = self._start, self._stop
+        for depth, level_name in zip(
+                range(self._depth, frozen_file.levels), self.level_names):
+            key_table = frozen_file.key_tables[depth]
+            codes = frozen_file.codes[depth]
+            if self._depth == 0:
+                key_codes = range(len(key_table))
+            else:
+                key_codes = sorted(set(codes[start:stop]))
+            # Key tables are sorted, so keys in code order are sorted
+            unique_keys[level_name] = [key_table[code] for code in key_codes]
+            if depth < frozen_file.levels - 1:
+                child_starts = frozen_file.child_starts[depth]
+                start, stop = child_starts[start], child_starts[stop]
+
+        if named:
+            return unique_keys
+        else:
+            return unique_keys.values()
+
+    # ==== Getters ==== #
+
+    def nested_get(self, key_list):
+        """Get value (or subtree view) at depth
+
+        Parameters
+        ----------
+        key_list: list
+            List of keys, one for each dict depth
+
+        Returns
+        -------
+        obj
+        """
+        if len(key_list) == 0:
+            raise KeyError("key_list cannot be empty")
+        pointer = self
+        for key in key_list:
+            pointer = pointer[key]
+        return pointer
+
+    def has_nested_key(self, key_list):
+        """Check if nested keys are valid
+
+        Parameters
+        ----------
+        key_list: list
+            List of keys, one for each dict depth
+
+        Returns
+        -------
+        bool
+        """
+        try:
+            self.nested_get(key_list)
+            return True
+        except KeyError:
+            return False
+
+    def _get_multiple(self, key_or_criteria_ls):
+        """Check whether list has keys or criteria"""
+        if any(map(_is_criteria, key_or_criteria_ls)):
+            filter_func_ls = [get_filter_func(criteria)
+                              for criteria in key_or_criteria_ls]
+            return [
+                self._get_value(depth, entry)
+                for _, (depth, entry) in self._iter_entries(
+                    len(key_or_criteria_ls) - 1, filter_func_ls)
+            ]
+        else:
+            return self.nested_get(key_or_criteria_ls)
+
+    def _set_multiple(self, key_or_criteria_ls, val):
+        """FrozenStructuredNestedDicts are read-only"""
+        raise TypeError("{} is read-only".format(self.__class__.__name__))
+
+    @property
+    def ixkeys(self):
+        """Indexer that allows for indexing by nested key list. See
+        StructuredNestedDict.ixkeys
+
+        Returns
+        -------
+        Indexable
+        """
+        return GetSetFunctionClass(
+            get_func=self._get_multiple,
+            set_func=self._set_multiple,
+        )
+
+    @property
+    def ix(self):
+        """Indexer that allows for indexing by nested key/criteria list. See
+        StructuredNestedDict.ix
+
+        Returns
+        -------
+        Indexable
+        """
+        return GetSetAmbiguousTupleFunctionClass(
+            get_func=self._get_multiple,
+            set_func=self._set_multiple,
+        )
+
+    # ==== Conversion ==== #
+
+    def to_sndict(self):
+        """Materialize as a StructuredNestedDict
+
+        Returns
+        -------
+        StructuredNestedDict
+        """
+        if self.levels == 1:
+            data = zip(self.keys(), self.values())
+        else:
+            data = [(key, val.to_sndict())
+                    for key, val in zip(self.keys(), self.values())]
+        return StructuredNestedDict.from_trusted(
+            data,
+            levels=self.levels,
+            level_names=self.level_names
+            if self._file.level_names is not None else None,
+        )
+
+    def close(self):
+        """Close the underlying memory-mapped file, shared by all views"""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # ==== Other ==== #
+
+    def __reduce__(self):
+        # Refer to the file, rather than copying the data. Unpickling reuses
+        # the file if it is already open in the unpickling process
+        return _reopen, (self._file.path, self._depth, self._start, self._stop)
+
+    def __repr__(self):
+        args_string_ls = [
+            "path={path}".format(path=repr(self._file.path)),
+            "levels={levels}".format(levels=self.levels),
+        ]
+        if self._file.level_names is not None:
+            args_string_ls.append("level_names={level_names}".format(
+                level_names=self.level_names
+            ))
+        return "{class_name}({args_string})".format(
+            class_name=self.__class__.__name__,
+            args_string=", ".join(args_string_ls),
+        )
+
+    def _wrap_level(self, level):
+        """Wrap a level argument"""
+        return _wrap_level(level, allowed_level=self.levels)
+
+
+class FrozenFile(object):
+
+    def __init__(self, path):
+        """Memory-mapped frozen StructuredNestedDict file
+
+        Parameters
+        ----------
+        path: str
+            Path to file written by StructuredNestedDict.freeze
+        """
+        self.path = path
+        self.closed = False
+        with open(path, "rb") as f:
+            self.file_id = _get_file_id(os.fstat(f.fileno()))
+            # The mapping stays valid after the file is closed
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, metadata_offset, metadata_length = struct.unpack_from(
+            HEADER_FORMAT, self._mmap, 0)
+        if magic != MAGIC:
+            raise IOError("{} is not a frozen StructuredNestedDict".format(
+                path))
+        metadata = json.loads(self._mmap[
+            metadata_offset:metadata_offset + metadata_length
+        ].decode("utf-8"))
+        sections = metadata["sections"]
+
+        def get_int_array(name):
+            return MappedIntArray(self._mmap, *sections[name])
+
+        def get_pickle_table(name, cache):
+            offsets = get_int_array(name + "_offsets")
+            return MappedPickleTable(self._mmap, offsets,
+                                     sections[name + "_blob"][0], cache)
+
+        self.levels = metadata["levels"]
+        self.level_names = metadata["level_names"]
+        self.codes = [get_int_array("codes{}".format(i))
+                      for i in range(self.levels)]
+        self.sorted_entries = [get_int_array("sorted_entries{}".format(i))
+                               for i in range(self.levels)]
+        self.child_starts = [get_int_array("child_starts{}".format(i))
+                             for i in range(self.levels - 1)]
+        self.key_tables = [get_pickle_table("keys{}".format(i), cache=True)
+                           for i in range(self.levels)]
+        self.values = get_pickle_table("values", cache=False)
+
+    def num_entries(self, depth):
+        return len(self.codes[depth])
+
+    def close(self):
+        if not self.closed:
+            self._mmap.close()
+            self.closed = True
+
+
+class MappedIntArray(object):
+
+    def __init__(self, buf, offset, length):
+        """Array of 64-bit integers, read from buffer on access
+
+        Parameters
+        ----------
+        buf: mmap
+        offset: int
+            Byte offset of first element
+        length: int
+            Number of elements
+        """
+        self._buf = buf
+        self._offset = offset
+        self._length = length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self._length)
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            # Read whole slice with a single unpack
+            return list(struct.unpack_from(
+                "<{}q".format(max(stop - start, 0)), self._buf,
+                self._offset + start * INT_SIZE))
+        if not 0 <= i < self._length:
+            raise IndexError(i)
+        return struct.unpack_from(
+            INT_FORMAT, self._buf, self._offset + i * INT_SIZE)[0]
+
+    def __len__(self):
+        return self._length
+
+
+class MappedPickleTable(object):
+
+    def __init__(self, buf, offsets, blob_offset, cache=False):
+        """Table of pickled objects, unpickled from buffer on access
+
+        Parameters
+        ----------
+        buf: mmap
+        offsets: MappedIntArray
+            Offset of each object in blob, followed by the end of blob
+        blob_offset: int
+            Byte offset of blob
+        cache: bool
+            Whether to keep unpickled objects
+        """
+        self._buf = buf
+        self._offsets = offsets
+        self._blob_offset = blob_offset
+        self._cache = {} if cache else None
+
+    def __getitem__(self, i):
+        if self._cache is not None and i in self._cache:
+            return self._cache[i]
+        start = self._blob_offset + self._offsets[i]
+        stop = self._blob_offset + self._offsets[i + 1]
+        obj = pickle.loads(self._buf[start:stop])
+        if self._cache is not None:
+            self._cache[i] = obj
+        return obj
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def index(self, key):
+        """Binary-search a sorted table for key
+
+        Returns
+        -------
+        int or None
+            Position of key, or None if it is not in the table
+        """
+        low, high = 0, len(self)
+        try:
+            while low < high:
+                mid = (low + high) // 2
+                mid_key = self[mid]
+                if mid_key == key:
+                    return mid
+                elif mid_key < key:
+                    low = mid + 1
+                else:
+                    high = mid
+        except TypeError:
+            # Key is not comparable with keys of this level
+            return None
+        return None
+
+
+def freeze(sndict, path):
+    """Write StructuredNestedDict to a frozen file, to be opened with
+    open_frozen.
+
+    Entries of each level are laid out in BFS order, so that the children of
+    each entry are a contiguous range of the next level, given by offset
+    arrays. Each level has a sorted table of its unique keys, and entries
+    store codes into that table alongside, for each range of siblings, the
+    order of entries by key. Keys must therefore be sortable within each
+    level. Keys and values are pickled.
+
+    Parameters
+    ----------
+    sndict: StructuredNestedDict
+    path: str
+    """
+    levels = sndict.levels
+    level_names = list(sndict.level_names) \
+        if sndict._level_names_is_set else None
+
+    sections = col.OrderedDict()
+    with open(path, "wb") as f:
+        f.write(struct.pack(HEADER_FORMAT, MAGIC, 0, 0))
+
+        nodes = [sndict]
+        for depth in range(levels):
+            keys = []
+            children = []
+            child_starts = [0]
+            for node in nodes:
+                if not isinstance(node, StructuredNestedDict):
+                    raise LevelError("Expected a StructuredNestedDict at "
+                                     "level {}".format(depth))
+                for key, val in six.iteritems(node):
+                    keys.append(key)
+                    children.append(val)
+                child_starts.append(len(keys))
+            if depth > 0:
+                _write_int_section(f, sections,
+                                   "child_starts{}".format(depth - 1),
+                                   child_starts)
+
+            try:
+                key_table = sorted(set(keys))
+            except TypeError:
+                raise TypeError("Keys of level {} must be sortable to freeze"
+                                "".format(depth))
+            key_codes = dict((key, code) for code, key in enumerate(key_table))
+            codes = [key_codes[key] for key in keys]
+            sorted_entries = []
+            for start, stop in zip(child_starts[:-1], child_starts[1:]):
+                sorted_entries.extend(
+                    sorted(range(start, stop), key=codes.__getitem__))
+
+            _write_int_section(f, sections, "codes{}".format(depth), codes)
+            _write_int_section(f, sections, "sorted_entries{}".format(depth),
+                               sorted_entries)
+            _write_pickle_section(f, sections, "keys{}".format(depth),
+                                  key_table)
+            nodes = children
+        _write_pickle_section(f, sections, "values", nodes)
+
+        metadata_offset = f.tell()
+        metadata = json.dumps({
+            "levels": levels,
+            "level_names": level_names,
+            "sections": sections,
+        }).encode("utf-8")
+        f.write(metadata)
+        f.seek(0)
+        f.write(struct.pack(HEADER_FORMAT, MAGIC, metadata_offset,
+                            len(metadata)))
+
+
+def open_frozen(path):
+    """Open a file written by StructuredNestedDict.freeze
+
+    Parameters
+    ----------
+    path: str
+
+    Returns
+    -------
+    FrozenStructuredNestedDict
+    """
+    frozen_file = FrozenFile(path)
+    _OPEN_FILES[os.path.abspath(path)] = frozen_file
+    return FrozenStructuredNestedDict(frozen_file)
+
+
+def _reopen(path, depth, start, stop):
+    """Unpickle a view, reusing the mapping of the file if it is still open
+    and has not been rewritten since"""
+    abs_path = os.path.abspath(path)
+    frozen_file = _OPEN_FILES.get(abs_path)
+    if frozen_file is None or frozen_file.closed \
+            or frozen_file.file_id != _get_file_id(os.stat(abs_path)):
+        frozen_file = FrozenFile(path)
+        _OPEN_FILES[abs_path] = frozen_file
+    return FrozenStructuredNestedDict(frozen_file, depth, start, stop)
+
+
+def _get_file_id(stat_result):
+    """Identity of the contents of a file, to detect rewrites"""
+    return stat_result.st_ino, stat_result.st_size, stat_result.st_mtime
+
+
+def _write_int_section(f, sections, name, values):
+    """Write list of ints as a section of 64-bit integers"""
+    sections[name] = [f.tell(), len(values)]
+    for i in range(0, len(values), WRITE_CHUNK_SIZE):
+        chunk = values[i:i + WRITE_CHUNK_SIZE]
+        f.write(struct.pack("<{}q".format(len(chunk)), *chunk))
+
+
+def _write_pickle_section(f, sections, name, objs):
+    """Write list of objects as a section of offsets and a blob of pickles"""
+    offsets = [0]
+    blob_offset = f.tell()
+    for obj in objs:
+        f.write(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+        offsets.append(f.tell() - blob_offset)
+    sections[name + "_blob"] = [blob_offset, offsets[-1]]
+    # Keep integer sections aligned
+    f.write(b"\0" * (-f.tell() % INT_SIZE))
+    _write_int_section(f, sections, name + "_offsets", offsets)
@@ -0,0 +1,138 @@
+import six
+
+from .shared import is_lookup_criteria
+
+
+class LevelKeyIndex(object):
+
+    def __init__(self, levels):
+        """Inverted index of a StructuredNestedDict: for each level, maps each
+        key to the set of parent paths (key-tuples from the root) whose
+        dictionaries contain it
+
+        Parameters
+        ----------
+        levels: int
+            Number of levels
+        """
+        self._levels = levels
+        self._level_paths = [dict() for _ in range(levels)]
+
+    def add(self, parent_path, key, value=None, value_levels=0):
+        """Add key under parent_path, along with every nested key of value
+
+        Parameters
+        ----------
+        parent_path: tuple
+            Keys leading to the dictionary containing key
+        key: object
+            Key being added
+        value: StructuredNestedDict, optional
+            Value set under key
+        value_levels: int
+            Number of levels of value to index
+        """
+        stack = [(parent_path, key, value, value_levels)]
+        while stack:
+            path, key, value, value_levels = stack.pop()
+            level_paths = self._level_paths[len(path)]
+            if key in level_paths:
+                level_paths[key].add(path)
+            else:
+                level_paths[key] = {path}
+            if value_levels > 0:
+                sub_path = path + (key,)
+                for sub_key, sub_value in six.iteritems(value):
+                    stack.append(
+                        (sub_path, sub_key, sub_value, value_levels - 1))
+
+    def remove(self, parent_path, key, value=None, value_levels=0):
+        """Remove key under parent_path, along with every nested key of value
+
+        Parameters
+        ----------
+        parent_path: tuple
+            Keys leading to the dictionary containing key
+        key: object
+            Key being removed
+        value: StructuredNestedDict, optional
+            Value that was set under key
+        value_levels: int
+            Number of levels of value that were indexed
+        """
+        stack = [(parent_path, key, value, value_levels)]
+        while stack:
+            path, key, value, value_levels = stack.pop()
+            level_paths = self._level_paths[len(path)]
+            paths = level_paths.get(key)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del level_paths[key]
+            if value_levels > 0:
+                sub_path = path + (key,)
+                for sub_key, sub_value in six.iteritems(value):
+                    stack.append(
+                        (sub_path, sub_key, sub_value, value_levels - 1))
+
+    def keys(self, level):
+        """Keys present at level
+
+        Parameters
+        ----------
+        level: int
+
+        Returns
+        -------
+        list
+        """
+        return list(self._level_paths[level])
+
+    def parent_paths(self, level, key):
+        """Paths of dictionaries at level that contain key
+
+        Parameters
+        ----------
+        level: int
+        key: object
+
+        Returns
+        -------
+        set
+        """
+        return self._level_paths[level].get(key, set())
+
+    def allowed_prefixes(self, criteria_ls):
+        """Compute, for each level up to the deepest level with a key or
+        list/set criteria, the set of key-tuple prefixes that can lead to a
+        match. Returns None if no criteria can be looked up.
+
+        Parameters
+        ----------
+        criteria_ls: list
+            Criteria, one per level
+
+        Returns
+        -------
+        list or None
+            List of sets of key-tuples, one per level
+        """
+        deepest = None
+        for level, criteria in enumerate(criteria_ls):
+            if is_lookup_criteria(criteria):
+                deepest = level
+        if deepest is None:
+            return None
+
+        criteria = criteria_ls[deepest]
+        if not isinstance(criteria, (list, set)):
+            criteria = [criteria]
+
+        allowed = [set() for _ in range(deepest + 1)]
+        level_paths = self._level_paths[deepest]
+        for key in criteria:
+            for path in level_paths.get(key, ()):
+                full_path = path + (key,)
+                for i in range(deepest + 1):
+                    allowed[i].add(full_path[:i + 1])
+        return allowed
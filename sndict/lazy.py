@@ -0,0 +1,209 @@
+import collections as col
+import six
+
+from .nesteddict import NestedDict
+from .shared import get_filter_func
+from .structurednesteddict import get_key_tuple_class
+
+MAP_OP = "map"
+FILTER_OP = "filter"
+
+
+class LazyStructuredNestedDict(object):
+
+    def __init__(self, source, key_criteria=(), value_ops=()):
+        """Lazy transformation pipeline over a StructuredNestedDict
+
+        Operations are only recorded, and are run in a single traversal of
+        the source when the pipeline is collected. Key filters do not depend
+        on values, so they are all applied first, while descending, and
+        pruned subtrees are never visited. Value maps and filters are then
+        fused and applied to each remaining value in order. No intermediate
+        StructuredNestedDict is built.
+
+        Parameters
+        ----------
+        source: StructuredNestedDict
+        key_criteria: tuple
+            (criteria_ls, filter_out) pairs of filter_key calls
+        value_ops: tuple
+            (MAP_OP or FILTER_OP, function) pairs, in order
+        """
+        self._source = source
+        self._key_criteria = tuple(key_criteria)
+        self._value_ops = tuple(value_ops)
+
+    def _extend(self, key_criteria=(), value_ops=()):
+        return self.__class__(
+            self._source,
+            key_criteria=self._key_criteria + tuple(key_criteria),
+            value_ops=self._value_ops + tuple(value_ops),
+        )
+
+    # ==== Recorded Operations ==== #
+
+    def filter_key(self, criteria_ls, filter_out=False):
+        """Filter by key criteria. See StructuredNestedDict.filter_key
+
+        Parameters
+        ----------
+        criteria_ls: list or dict
+            Filter based on criteria
+        filter_out: bool
+            Whether to filter in or out
+
+        Returns
+        -------
+        LazyStructuredNestedDict
+        """
+        criteria_ls = self._source._resolve_criteria_ls(criteria_ls)
+        return self._extend(key_criteria=[(criteria_ls, filter_out)])
+
+    def filter_values(self, criteria, filter_out=False):
+        """Filter values by criteria. See StructuredNestedDict.filter_values
+
+        Parameters
+        ----------
+        criteria: See StructuredNestedDict.filter_values
+            Filter based on criteria
+        filter_out: bool
+            Whether to filter in or out
+
+        Returns
+        -------
+        LazyStructuredNestedDict
+        """
+        filter_func = get_filter_func(criteria, filter_out=filter_out)
+        return self._extend(value_ops=[(FILTER_OP, filter_func)])
+
+    def map_values(self, val_func):
+        """Apply transformation to values
+
+        Parameters
+        ----------
+        val_func: function
+            Function to transform values
+
+        Returns
+        -------
+        LazyStructuredNestedDict
+        """
+        return self._extend(value_ops=[(MAP_OP, val_func)])
+
+    # ==== Execution ==== #
+
+    def collect(self, drop_empty=True):
+        """Run the pipeline
+
+        Parameters
+        ----------
+        drop_empty: bool
+            Whether to drop empty nested dictionaries (nested dictionaries
+            with all elements filtered out)
+
+        Returns
+        -------
+        StructuredNestedDict
+        """
+        source = self._source
+        data = NestedDict.from_flat(
+            self._iter_pipeline(emit_nodes=not drop_empty),
+            dict_type="odict",
+        )
+        return source.from_trusted(
+            data,
+            levels=source.levels,
+            level_names=source._level_names if source._level_names_is_set
+            else None,
+        )
+
+    def iterflatten(self, named=True):
+        """Run the pipeline, yielding (key-tuple, value) pairs without
+        building a StructuredNestedDict
+
+        Parameters
+        ----------
+        named: bool
+            Whether to use namedtuples for key-tuples
+
+        Returns
+        -------
+        generator
+        """
+        if not named:
+            return self._iter_pipeline()
+        key_tup_class = get_key_tuple_class(self._source.level_names)
+        return (
+            (tuple.__new__(key_tup_class, key_tup), val)
+            for key_tup, val in self._iter_pipeline()
+        )
+
+    def _iter_pipeline(self, emit_nodes=False):
+        """Single DFS over the source. If emit_nodes, every nested dictionary
+        that passes the key filters is also yielded, as an empty
+        OrderedDict, before its contents"""
+        levels = self._source.levels
+        level_func_ls = self._get_level_filter_funcs()
+        if emit_nodes:
+            allowed_prefixes_ls = []
+        else:
+            allowed_prefixes_ls = self._get_allowed_prefixes()
+        value_ops = self._value_ops
+
+        stack = [(six.iteritems(self._source), ())]
+        while stack:
+            iterator, prefix = stack[-1]
+            depth = len(prefix)
+            filter_func_ls = level_func_ls[depth]
+            level_allowed_ls = [
+                allowed_prefixes[depth]
+                for allowed_prefixes in allowed_prefixes_ls
+                if depth < len(allowed_prefixes)
+            ]
+            for key, val in iterator:
+                if not all(filter_func(key) for filter_func in filter_func_ls):
+                    continue
+                key_tup = prefix + (key,)
+                if any(key_tup not in level_allowed
+                       for level_allowed in level_allowed_ls):
+                    continue
+                if depth + 1 < levels:
+                    if emit_nodes:
+                        yield key_tup, col.OrderedDict()
+                    stack.append((six.iteritems(val), key_tup))
+                    break
+
+                keep = True
+                for op, func in value_ops:
+                    if op == MAP_OP:
+                        val = func(val)
+                    elif not func(val):
+                        keep = False
+                        break
+                if keep:
+                    yield key_tup, val
+            else:
+                stack.pop()
+
+    def _get_level_filter_funcs(self):
+        """Combine the criteria of all filter_key calls into a list of
+        filter functions per level"""
+        level_func_ls = [[] for _ in range(self._source.levels)]
+        for criteria_ls, filter_out in self._key_criteria:
+            for level, criteria in enumerate(criteria_ls):
+                if criteria == slice(None) and not filter_out:
+                    continue
+                level_func_ls[level].append(
+                    get_filter_func(criteria, filter_out=filter_out))
+        return level_func_ls
+
+    def _get_allowed_prefixes(self):
+        """Key-tuple prefixes allowed by each filter_key call, if the source
+        has a key index"""
+        allowed_prefixes_ls = []
+        for criteria_ls, filter_out in self._key_criteria:
+            allowed_prefixes = self._source._allowed_prefixes(
+                criteria_ls, filter_out)
+            if allowed_prefixes is not None:
+                allowed_prefixes_ls.append(allowed_prefixes)
+        return allowed_prefixes_ls
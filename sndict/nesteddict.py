@@ -1,6 +1,9 @@
 import collections as col
 import six
 
+from .parallel import (
+    map_values_by_top_key, is_parallel, map_chunk, filter_chunk,
+)
 from .shared import get_filter_func
 from .utils import (
     GetSetFunctionClass, GetSetAmbiguousTupleFunctionClass,
@@ -25,10 +28,14 @@ class NestedDict(col.OrderedDict):
         """Initialize from a dict keyed by tuples
         Each tuple-element is taken as a key for each level in the NestedDict
 
+        Keeps a cursor on the most recently used path, so that each entry only
+        descends from the first key that differs from the previous entry. This
+        is fastest for sorted input, but any order is accepted.
+
         Parameters
         ----------
-        data: dict, list
-            Dictionary keyed by tuples
+        data: dict, or iterable
+            Dictionary keyed by tuples, or iterable of (key-tuple, value) pairs
         dict_type: ['ndict', 'dict', 'odict']
             Dict-type in string format, for initializing dicts at depth if they
             don't exist yet
@@ -39,15 +46,37 @@ class NestedDict(col.OrderedDict):
         """
         if isinstance(data, dict):
             iterdata = six.iteritems(data)
-        elif isinstance(data, list):
-            iterdata = data
         else:
-            raise TypeError("from_flat requires a dict or list, not {}"
-                            "".format(type(data)))
+            try:
+                iterdata = iter(data)
+            except TypeError:
+                raise TypeError("from_flat requires a dict or iterable, not {}"
+                                "".format(type(data)))
 
+        dict_class = cls._resolve_dict_type(dict_type)
         new_dict = cls()
+        path = []
+        cursor = [new_dict]
         for key_list, val in iterdata:
-            new_dict.nested_set(key_list, val, dict_type=dict_type)
+            cls._check_key_list(key_list)
+            depth = len(key_list) - 1
+
+            # Reuse the shared prefix with the previous entry
+            i = 0
+            max_shared = min(depth, len(path))
+            while i < max_shared and path[i] == key_list[i]:
+                i += 1
+            del path[i:]
+            del cursor[i + 1:]
+
+            dict_pointer = cursor[-1]
+            for key in key_list[i:depth]:
+                if key not in dict_pointer:
+                    dict_pointer[key] = dict_class()
+                dict_pointer = dict_pointer[key]
+                path.append(key)
+                cursor.append(dict_pointer)
+            dict_pointer[key_list[-1]] = val
         return new_dict
 
     # ==== Iterators ==== #
@@ -69,17 +98,24 @@ class NestedDict(col.OrderedDict):
         return self._iterflatten(self, max_depth=max_depth)
 
     @classmethod
-    def _iterflatten(cls, dictionary, max_depth=None, depth=1):
-        """DFS method for flattening a NestedDict"""
-        assert depth > 0
-        for key, val in six.iteritems(dictionary):
-            if isinstance(val, dict) \
-                    and (max_depth is None or depth < max_depth):
-                for partial_key_tup, sub_val in NestedDict._iterflatten(
-                        val, max_depth=max_depth, depth=depth+1):
-                    yield (key,) + partial_key_tup, sub_val
+    def _iterflatten(cls, dictionary, max_depth=None):
+        """Stack-based DFS method for flattening a NestedDict
+
+        Keeps one (items-iterator, key-prefix) frame per open level instead of
+        one generator per level, so each leaf is yielded in a single step.
+        """
+        stack = [(six.iteritems(dictionary), ())]
+        while stack:
+            iterator, prefix = stack[-1]
+            depth = len(stack)
+            for key, val in iterator:
+                if isinstance(val, dict) \
+                        and (max_depth is None or depth < max_depth):
+                    stack.append((six.iteritems(val), prefix + (key,)))
+                    break
+                yield prefix + (key,), val
             else:
-                yield (key, ), val
+                stack.pop()
 
     def iterflatten_keys(self, max_depth=None):
         """Iterate over a flattened NestedDict, and expose only keys.
@@ -163,25 +199,74 @@ class NestedDict(col.OrderedDict):
 
     # ==== Dict Transformation ==== #
 
-    def map_values(self, val_func):
+    def map_values(self, val_func, workers=None, executor=None):
         """Apply transformations to keys and values
 
+        If workers or executor is given, values are transformed in parallel,
+        in one chunk per top-level key. With worker processes, val_func and
+        the values must be picklable.
+
         Parameters
         ----------
         val_func: function
             Function to transform values
+        workers: int, optional
+            Number of worker processes
+        executor: concurrent.futures.Executor, optional
+            Executor to use instead, e.g. a ThreadPoolExecutor for functions
+            that release the GIL
 
         Returns
         -------
         NestedDict
         """
-        new_dict = self.__class__()
-        for key, val in self.iterflatten():
-            new_dict.nested_set(key, val_func(val), dict_type="ndict")
+        new_dict = self._new_empty()
+        if is_parallel(workers, executor):
+            pairs = list(self.iterflatten())
+            new_values = map_values_by_top_key(
+                map_chunk, (val_func,), pairs,
+                workers=workers, executor=executor,
+            )
+            for (key, _), new_val in zip(pairs, new_values):
+                new_dict.nested_set(key, new_val, dict_type="ndict")
+        else:
+            for key, val in self.iterflatten():
+                new_dict.nested_set(key, val_func(val), dict_type="ndict")
 
         return new_dict
 
-    def filter_values(self, criteria, filter_out=False):
+    def async_map_values(self, coro_func, concurrency=8, callback=None):
+        """Apply a coroutine function to values, awaiting up to concurrency
+        calls at a time. Requires Python 3.5+
+
+        Parameters
+        ----------
+        coro_func: function
+            Coroutine function to transform values
+        concurrency: int
+            Maximum number of coro_func calls awaited at a time
+        callback: function, optional
+            Called as callback(key-tuple, new value) as each value completes.
+            If it returns an awaitable, it is awaited
+
+        Returns
+        -------
+        coroutine
+            Coroutine returning the NestedDict, with keys in original order
+        """
+        from .asyncmap import map_values
+
+        def build(pairs):
+            new_dict = self._new_empty()
+            for key, new_val in pairs:
+                new_dict.nested_set(key, new_val, dict_type="ndict")
+            return new_dict
+
+        return map_values(list(self.iterflatten()), coro_func,
+                          concurrency, callback, build)
+
+    def filter_values(self, criteria, filter_out=False,
+                      workers=None, executor=None):
         """Filter NestedDict values by criteria.
 
         The criteria used in the following ways, based on type:
@@ -196,16 +281,30 @@ class NestedDict(col.OrderedDict):
             Filter based on criteria
         filter_out: bool
             Whether to filter in or out
+        workers: int, optional
+            Number of worker processes. See map_values
+        executor: concurrent.futures.Executor, optional
+            Executor to use instead. See map_values
 
         Returns
         -------
         NestedDict
         """
-        filter_func = get_filter_func(criteria, filter_out=filter_out)
-        new_dict = self.__class__()
-        for key, val in self.iterflatten():
-            if filter_func(val):
-                new_dict.nested_set(key, val, dict_type="ndict")
+        new_dict = self._new_empty()
+        if is_parallel(workers, executor):
+            pairs = list(self.iterflatten())
+            keep_ls = map_values_by_top_key(
+                filter_chunk, (criteria, filter_out), pairs,
+                workers=workers, executor=executor,
+            )
+            for (key, val), keep in zip(pairs, keep_ls):
+                if keep:
+                    new_dict.nested_set(key, val, dict_type="ndict")
+        else:
+            filter_func = get_filter_func(criteria, filter_out=filter_out)
+            for key, val in self.iterflatten():
+                if filter_func(val):
+                    new_dict.nested_set(key, val, dict_type="ndict")
 
         return new_dict
 
@@ -450,6 +549,10 @@ class NestedDict(col.OrderedDict):
             return string_
         return _dfs_print(self, 0, indent)
 
+    def _new_empty(self):
+        """Create an empty NestedDict for results derived from this one"""
+        return self.__class__()
+
     @staticmethod
     def _resolve_dict_type(dict_type):
         """Resolve dict type based on string
@@ -0,0 +1,71 @@
+import itertools
+
+from .compat import import_futures
+from .shared import get_filter_func
+
+
+def map_values_by_top_key(chunk_func, chunk_args, pairs,
+                          workers=None, executor=None):
+    """Apply chunk_func to the values of (key-tuple, value) pairs in
+    parallel, with one chunk per top-level key, and reassemble the results in
+    the original order
+
+    Parameters
+    ----------
+    chunk_func: function
+        Module-level function called as chunk_func(*chunk_args, values) for
+        each chunk, and returning one result per value
+    chunk_args: tuple
+        Leading arguments to chunk_func
+    pairs: list
+        List of (key-tuple, value) pairs, grouped by top-level key
+    workers: int, optional
+        Number of worker processes of a new ProcessPoolExecutor
+    executor: concurrent.futures.Executor, optional
+        Executor to run chunks on, e.g. a ThreadPoolExecutor for functions
+        that release the GIL. Takes precedence over workers
+
+    Returns
+    -------
+    list
+        One result per pair
+    """
+    chunks = [
+        [val for _, val in group]
+        for _, group in itertools.groupby(pairs, key=_get_top_key)
+    ]
+    owns_executor = executor is None
+    if owns_executor:
+        executor = import_futures().ProcessPoolExecutor(max_workers=workers)
+    try:
+        future_ls = [
+            executor.submit(chunk_func, *(tuple(chunk_args) + (chunk,)))
+            for chunk in chunks
+        ]
+        return list(itertools.chain.from_iterable(
+            future.result() for future in future_ls
+        ))
+    finally:
+        if owns_executor:
+            executor.shutdown()
+
+
+def is_parallel(workers, executor):
+    """Whether workers/executor options ask for parallel execution"""
+    return executor is not None or workers is not None
+
+
+def map_chunk(val_func, values):
+    """Chunk function for map_values"""
+    return [val_func(val) for val in values]
+
+
+def filter_chunk(criteria, filter_out, values):
+    """Chunk function for filter_values. The filter function is built in the
+    worker, as the ones built for non-function criteria cannot be pickled"""
+    filter_func = get_filter_func(criteria, filter_out=filter_out)
+    return [bool(filter_func(val)) for val in values]
+
+
+def _get_top_key(pair):
+    return pair[0][0]
@@ -18,3 +18,11 @@ def get_filter_func(criteria, filter_out=False):
         filter_func = negate(filter_func)
 
     return filter_func
+
+
+def is_lookup_criteria(criteria):
+    """Check if criteria selects keys by value (a key, or a list/set of keys),
+    so that matching keys can be looked up directly rather than tested"""
+    if isinstance(criteria, (slice, types.FunctionType)):
+        return False
+    return True
@@ -0,0 +1,865 @@
+import collections as col
+import itertools
+import json
+import pickle
+import six
+import sqlite3
+import types
+
+from .columnar import _iter_rows
+from .nesteddict import NestedDict
+from .exceptions import LevelError
+from .shared import get_filter_func
+from .structurednesteddict import (
+    StructuredNestedDict,
+    get_key_tuple_class, _wrap_level, _is_criteria,
+)
+from .utils import (
+    GetSetAmbiguousTupleFunctionClass, GetSetFunctionClass,
+    list_is_unique,
+)
+
+SQL_KEY_TYPES = six.integer_types + (float, six.text_type, six.binary_type)
+MAX_IN_PARAMS = 500
+DATA_TABLE = "sndict_data"
+META_TABLE = "sndict_meta"
+
+
+class SQLiteStructuredNestedDict(object):
+
+    def __init__(self, path=":memory:", data=None, levels=None,
+                 level_names=None):
+        """StructuredNestedDict stored out-of-core in a SQLite database
+
+        Each value is stored (pickled) in a row alongside its keys, with one
+        indexed column per level. Key criteria in filter_key/ix are pushed
+        down into SQL WHERE clauses where possible (keys, and lists/sets of
+        keys), while function criteria are evaluated in Python, once per
+        unique key. Subtrees and filtered results are returned as views that
+        share the same database.
+
+        Keys must be ints, floats, strings or bytes. Keys are ordered as in
+        a StructuredNestedDict built by setting the rows in insertion order,
+        i.e. each nested dictionary is positioned by its first inserted row.
+        Setting the value of an existing key, or replacing an existing
+        subtree with nested_set, keeps its position.
+
+        Note: Empty nested dictionaries have no rows, and are dropped.
+
+        Parameters
+        ----------
+        path: str
+            Path to SQLite database file. Defaults to an in-memory database.
+            If the file already holds a StructuredNestedDict, it is opened
+            and levels/level_names are read from it.
+        data: StructuredNestedDict, or dict, optional
+            Nested dictionary to insert
+        levels: int
+            Number of levels. Defaults to that of data if data is a
+            StructuredNestedDict
+        level_names: list
+            List of level names
+        """
+        if isinstance(data, StructuredNestedDict):
+            if levels is None:
+                levels = data.levels
+            if level_names is None and data._level_names_is_set:
+                level_names = data.level_names
+
+        conn = sqlite3.connect(path)
+        stored_metadata = _read_metadata(conn)
+        if stored_metadata is not None:
+            stored_levels, stored_level_names = stored_metadata
+            if levels is not None and levels != stored_levels:
+                raise LevelError("Database has {} levels, not {}".format(
+                    stored_levels, levels))
+            levels, level_names = stored_levels, stored_level_names
+        else:
+            if levels is None:
+                levels = len(level_names) if level_names is not None else 1
+            if level_names is not None:
+                assert len(level_names) == levels
+                assert list_is_unique(level_names)
+                level_names = tuple(level_names)
+            _create_tables(conn, levels, level_names)
+
+        self._init_view(conn, levels, level_names)
+        if data:
+            self.update_flat(_iter_rows(data, levels))
+
+    def _init_view(self, conn, total_levels, level_names, prefix=(),
+                   conditions=(), residuals=()):
+        self._conn = conn
+        self._total_levels = total_levels
+        self._level_names_is_set = level_names is not None
+        self._level_names = level_names
+        self._prefix = tuple(prefix)
+        self._conditions = tuple(conditions)
+        self._residuals = tuple(residuals)
+        self._offset = len(self._prefix)
+        self._levels = total_levels - self._offset
+
+    def _view(self, prefix=None, conditions=(), residuals=()):
+        """View sharing the same database, optionally with a longer prefix
+        of fixed keys and additional criteria"""
+        new_obj = self.__class__.__new__(self.__class__)
+        new_obj._init_view(
+            self._conn, self._total_levels, self._level_names,
+            prefix=self._prefix if prefix is None else prefix,
+            conditions=self._conditions + tuple(conditions),
+            residuals=self._residuals + tuple(residuals),
+        )
+        return new_obj
+
+    # ==== Properties ==== #
+
+    @property
+    def dim(self):
+        """Dimensions of whole SQLiteStructuredNestedDict
+
+        Returns
+        -------
+        tuple:
+            Tuple of widths of nested dictionaries, one per level
+        """
+        if self._residuals:
+            prefix_sets = [set() for _ in range(self._levels)]
+            for row in self._iter_rows(ordered=False):
+                key_tup = row[self._offset:self._total_levels]
+                for i, prefix_set in enumerate(prefix_sets):
+                    prefix_set.add(key_tup[:i + 1])
+            return tuple(len(prefix_set) for prefix_set in prefix_sets)
+
+        where_sql, params = self._get_where()
+        dim_ls = []
+        for i in range(self._levels):
+            columns = _column_list(self._offset, self._offset + i + 1)
+            dim_ls.append(self._conn.execute(
+                "SELECT COUNT(*) FROM (SELECT DISTINCT {columns} FROM {table}"
+                "{where})".format(
+                    columns=columns, table=DATA_TABLE, where=where_sql),
+                params,
+            ).fetchone()[0])
+        return tuple(dim_ls)
+
+    @property
+    def levels(self):
+        """Number of levels
+
+        Returns
+        -------
+        int
+        """
+        return self._levels
+
+    @property
+    def level_names(self):
+        """Names of levels. Defaults to ["level0", "level1", ...] is no names
+        are provided
+
+        Returns
+        -------
+        list
+        """
+        if self._level_names_is_set:
+            return tuple(self._level_names[self._offset:])
+        else:
+            return ["level{i}".format(i=i)
+                    for i in range(self._offset, self._total_levels)]
+
+    @property
+    def dim_dict(self):
+        """Dimensions of whole SQLiteStructuredNestedDict as dict
+
+        Returns
+        -------
+        dict
+            Dimensions keyed by level name
+        """
+        return dict(zip(self.level_names, self.dim))
+
+    # ==== Dict-like Access ==== #
+
+    def keys(self):
+        """Top-level keys, in order
+
+        Returns
+        -------
+        list
+        """
+        return [prefix[0] for prefix in self._iter_prefixes(1)]
+
+    def values(self):
+        """Top-level values (or subtree views), in order
+
+        Returns
+        -------
+        list
+        """
+        return [val for _, val in self.items()]
+
+    def items(self):
+        """Top-level (key, value) pairs, in order
+
+        Returns
+        -------
+        list
+        """
+        return [(key_tup[0], val) for key_tup, val
+                in self.iterflatten(levels=0, named=False)]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return sum(1 for _ in self._iter_prefixes(1, ordered=False))
+
+    def __contains__(self, key):
+        # Keys of other types cannot be stored, or bound as parameters
+        return _is_sql_key(key) and self._has_rows(self._prefix + (key,))
+
+    def __getitem__(self, key):
+        if not _is_sql_key(key):
+            raise KeyError(key)
+        full_key = self._prefix + (key,)
+        if self._levels == 1:
+            for row in self._iter_rows(prefix=full_key, ordered=False):
+                return _loads(row[-1])
+        elif self._has_rows(full_key):
+            return self._view(prefix=full_key)
+        raise KeyError(key)
+
+    # ==== Iterators ==== #
+
+    def iterflatten(self, levels=-1, named=True):
+        """Returns an iterator with multiple levels flattened. If not all
+        levels are flattened, values are views of the remaining levels
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+            Defaults to flattening all levels.
+        named: bool
+            Whether output key-tuples are namedtuples
+
+        Returns
+        -------
+        iterator
+        """
+        levels = self._wrap_level(levels)
+        key_tup_class = get_key_tuple_class(self.level_names[:levels + 1]) \
+            if named else tuple
+
+        if levels == self._levels - 1:
+            offset, stop = self._offset, self._total_levels
+            for row in self._iter_rows():
+                yield tuple.__new__(key_tup_class, row[offset:stop]), \
+                    _loads(row[-1])
+        else:
+            for key_tup in self._iter_prefixes(levels + 1):
+                yield tuple.__new__(key_tup_class, key_tup), \
+                    self._view(prefix=self._prefix + key_tup)
+
+    def iterflatten_keys(self, levels=-1, named=True):
+        """Returns an iterator with of keys of flattened dict
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+        named: bool
+            Whether output key-tuples are namedtuples
+
+        Returns
+        -------
+        iterator
+        """
+        return (key for key, _ in self.iterflatten(levels, named))
+
+    def iterflatten_values(self, levels=-1):
+        """Returns an iterator with of values of flattened dict
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+
+        Returns
+        -------
+        iterator
+        """
+        return (val for _, val in self.iterflatten(levels, named=False))
+
+    def flatten_values(self, levels=-1):
+        """Returns a list of values of flattened dict
+
+        Parameters
+        ----------
+        levels: int, default=-1
+            Number of levels to flatten by.
+
+        Returns
+        -------
+        list
+        """
+        return list(self.iterflatten_values(levels=levels))
+
+    def unique_keys(self, named=False, sort_keys=True):
+        """Returns the unique keys in each level of the dictionary
+
+        Parameters
+        ----------
+        named: bool
+            If True, return OrderedDict of list of keys of each level. If False,
+            return a list of list of keys.
+        sort_keys: bool
+            Whether to sort each list of keys
+
+        Returns
+        -------
+        list or dict
+        """
+        columns = range(self._offset, self._total_levels)
+        if self._residuals:
+            key_sets = [set() for _ in columns]
+            for row in self._iter_rows(ordered=False):
+                for key_set, column in zip(key_sets, columns):
+                    key_set.add(row[column])
+            key_lists = [list(key_set) for key_set in key_sets]
+        else:
+            where_sql, params = self._get_where()
+            key_lists = [
+                [row[0] for row in self._conn.execute(
+                    "SELECT DISTINCT k{column} FROM {table}{where}".format(
+                        column=column, table=DATA_TABLE, where=where_sql),
+                    params,
+                )]
+                for column in columns
+            ]
+
+        unique_keys = col.OrderedDict()
+        for level_name, key_list in zip(self.level_names, key_lists):
+            if sort_keys:
+                key_list.sort()
+            unique_keys[level_name] = key_list
+
+        if named:
+            return unique_keys
+        else:
+            return unique_keys.values()
+
+    # ==== Transformation ==== #
+
+    def filter_key(self, criteria_ls, filter_out=False, drop_empty=True):
+        """Filter SQLiteStructuredNestedDict by criteria.
+
+        The criteria used in the following ways, based on type:
+            1. slice(None): Keep all
+            2. function: Keep if function(key) is True
+            3. list, set: Keep if key in list/set
+            4. other: Keep if key==other
+
+        Keys, and lists/sets of keys, are pushed down into the SQL query.
+        Functions are evaluated in Python, once per unique key.
+
+        Parameters
+        ----------
+        criteria_ls: list or dict
+            Filter based on criteria
+        filter_out: bool
+            Whether to filter in or out
+        drop_empty:
+            Unused. Empty nested dictionaries are always dropped
+
+        Returns
+        -------
+        SQLiteStructuredNestedDict
+            View with the criteria applied
+        """
+        if len(criteria_ls) == 0:
+            raise KeyError("criteria_ls cannot be empty")
+
+        if isinstance(criteria_ls, dict):
+            unused = set(criteria_ls) - set(self.level_names)
+            if unused:
+                raise RuntimeError("Unused criteria for: {}".format(unused))
+            criteria_ls = [criteria_ls.get(level_name, slice(None))
+                           for level_name in self.level_names]
+
+        conditions = []
+        residuals = []
+        for level, criteria in enumerate(criteria_ls):
+            column = self._offset + level
+            if criteria == slice(None) and not filter_out:
+                continue
+            condition = _criteria_to_sql(column, criteria, filter_out)
+            if condition is not None:
+                conditions.append(condition)
+            else:
+                residuals.append((column, _memoize(
+                    get_filter_func(criteria, filter_out=filter_out))))
+        return self._view(conditions=conditions, residuals=residuals)
+
+    # ==== Getters and Setters ==== #
+
+    def nested_get(self, key_list):
+        """Get value (or subtree view) at depth
+
+        Parameters
+        ----------
+        key_list: list
+            List of keys, one for each dict depth
+
+        Returns
+        -------
+        obj
+        """
+        if len(key_list) == 0:
+            raise KeyError("key_list cannot be empty")
+        elif len(key_list) > self._levels \
+                or not all(_is_sql_key(key) for key in key_list):
+            raise KeyError(key_list)
+        full_key = self._prefix + tuple(key_list)
+        if len(key_list) == self._levels:
+            for row in self._iter_rows(prefix=full_key, ordered=False):
+                return _loads(row[-1])
+        elif self._has_rows(full_key):
+            return self._view(prefix=full_key)
+        raise KeyError(key_list)
+
+    def has_nested_key(self, key_list):
+        """Check if nested keys are valid
+
+        Parameters
+        ----------
+        key_list: list
+            List of keys, one for each dict depth
+
+        Returns
+        -------
+        bool
+        """
+        try:
+            self.nested_get(key_list)
+            return True
+        except KeyError:
+            return False
+
+    def nested_set(self, key_list, value):
+        """Set a value within nested dicts. If fewer keys than levels are
+        given, value must be a nested dictionary, and replaces the whole
+        subtree
+
+        Parameters
+        ----------
+        key_list: list
+            List of keys, one for each dict depth
+        value: obj
+            Value to set
+        """
+        if len(key_list) == 0:
+            raise KeyError("key_list cannot be empty")
+        full_key = self._prefix + tuple(key_list)
+        if len(key_list) == self._levels:
+            self.update_flat([(tuple(key_list), value)])
+        elif len(key_list) < self._levels:
+            if not isinstance(value, dict):
+                raise LevelError("Expected a dict at {}".format(key_list))
+            rows = [
+                (full_key[self._offset:] + key_tup, val) for key_tup, val
+                in _iter_rows(value, self._levels - len(key_list))
+            ]
+            prefix_sql, params = _prefix_to_sql(full_key)
+            # Replace the subtree in a single transaction. The first new row
+            # takes the first rowid of the old subtree, which keeps the
+            # subtree in position
+            with self._conn:
+                first_rowid = self._conn.execute(
+                    "SELECT MIN(rowid) FROM {table} WHERE {where}".format(
+                        table=DATA_TABLE, where=prefix_sql), params,
+                ).fetchone()[0]
+                self._conn.execute("DELETE FROM {table} WHERE {where}".format(
+                    table=DATA_TABLE, where=prefix_sql), params)
+                insert_params = self._iter_insert_params(rows)
+                if first_rowid is not None:
+                    for row in itertools.islice(insert_params, 1):
+                        self._conn.execute(
+                            "INSERT INTO {table} (rowid, {columns}, value) "
+                            "VALUES (?, {params})".format(
+                                table=DATA_TABLE,
+                                columns=_column_list(0, self._total_levels),
+                                params=", ".join(["?"] * len(row))),
+                            (first_rowid,) + row,
+                        )
+                _upsert_rows(self._conn, insert_params, self._total_levels)
+        else:
+            raise KeyError(key_list)
+
+    def update_flat(self, data):
+        """Insert or replace values from a dict keyed by tuples, or an
+        iterable of (key-tuple, value) pairs, in a single transaction.
+        Replaced values keep their position
+
+        Parameters
+        ----------
+        data: dict, or iterable
+            Flat data keyed by tuples, relative to this view
+        """
+        if isinstance(data, dict):
+            data = six.iteritems(data)
+        with self._conn:
+            _upsert_rows(self._conn, self._iter_insert_params(data),
+                         self._total_levels)
+
+    def _iter_insert_params(self, data):
+        for key_tup, val in data:
+            full_key = self._prefix + tuple(key_tup)
+            if len(full_key) != self._total_levels:
+                raise LevelError("Key {} does not have {} levels".format(
+                    key_tup, self._levels))
+            _check_keys(full_key)
+            yield full_key + (_dumps(val),)
+
+    def _get_multiple(self, key_or_criteria_ls):
+        """Check whether list has keys or criteria"""
+        if any(map(_is_criteria, key_or_criteria_ls)):
+            return self.filter_key(criteria_ls=key_or_criteria_ls)\
+                .flatten_values(len(key_or_criteria_ls) - 1)
+        else:
+            return self.nested_get(key_or_criteria_ls)
+
+    def _set_multiple(self, key_or_criteria_ls, val):
+        """Set value at nested keys. Criteria are not supported"""
+        if any(map(_is_criteria, key_or_criteria_ls)):
+            raise TypeError("Setting by criteria is not supported by {}"
+                            "".format(self.__class__.__name__))
+        self.nested_set(key_or_criteria_ls, val)
+
+    @property
+    def ixkeys(self):
+        """Indexer that allows for indexing by nested key list. See
+        StructuredNestedDict.ixkeys
+
+        Returns
+        -------
+        Indexable
+        """
+        return GetSetFunctionClass(
+            get_func=self._get_multiple,
+            set_func=self._set_multiple,
+        )
+
+    @property
+    def ix(self):
+        """Indexer that allows for indexing by nested key/criteria list. See
+        StructuredNestedDict.ix
+
+        Returns
+        -------
+        Indexable
+        """
+        return GetSetAmbiguousTupleFunctionClass(
+            get_func=self._get_multiple,
+            set_func=self._set_multiple,
+        )
+
+    # ==== Conversion ==== #
+
+    def to_sndict(self):
+        """Materialize as a StructuredNestedDict
+
+        Returns
+        -------
+        StructuredNestedDict
+        """
+        return StructuredNestedDict.from_trusted(
+            NestedDict.from_flat(
+                self.iterflatten(named=False), dict_type="odict"),
+            levels=self._levels,
+            level_names=self.level_names if self._level_names_is_set
+            else None,
+        )
+
+    def close(self):
+        """Close the underlying database connection, shared by all views"""
+        self._conn.close()
+
+    # ==== Queries ==== #
+
+    def _get_where(self, prefix=None):
+        """WHERE clause and parameters for the prefix and pushed-down
+        criteria"""
+        prefix = self._prefix if prefix is None else prefix
+        clauses = []
+        params = []
+        if prefix:
+            prefix_sql, prefix_params = _prefix_to_sql(prefix)
+            clauses.append(prefix_sql)
+            params.extend(prefix_params)
+        for clause, clause_params in self._conditions:
+            clauses.append(clause)
+            params.extend(clause_params)
+        if not clauses:
+            return "", params
+        return " WHERE " + " AND ".join(clauses), params
+
+    def _get_order(self, depth):
+        """FROM clause, ORDER BY terms and parameters that order key-tuples of
+        the first depth levels as nested dictionaries: by the first row
+        (lowest rowid) of each key-tuple prefix. First rows are found among
+        all rows of the view's prefix, so criteria do not change the order"""
+        if self._prefix:
+            prefix_sql, prefix_params = _prefix_to_sql(self._prefix)
+            prefix_where = " WHERE " + prefix_sql
+        else:
+            prefix_where, prefix_params = "", []
+        from_sql = "{table} AS t".format(table=DATA_TABLE)
+        order_ls = []
+        params = []
+        last_level = self._offset + depth - 1
+        for level in range(self._offset, last_level + 1):
+            if level == self._total_levels - 1 or \
+                    (level == last_level and not self._conditions):
+                # Full key-tuples each have a single row, and without
+                # criteria the rows of each key-tuple include its first row
+                order_ls.append("t.rowid")
+            else:
+                from_sql += _first_rowid_join_sql(level, prefix_where)
+                order_ls.append("p{level}.first_rowid".format(level=level))
+                params.extend(prefix_params)
+        return from_sql, order_ls, params
+
+    def _iter_rows(self, prefix=None, ordered=True):
+        """Iterate over full rows (all keys, then pickled value), applying
+        residual criteria. If ordered, rows are ordered as nested
+        dictionaries (see _get_order)"""
+        where_sql, params = self._get_where(prefix)
+        columns = _column_list(0, self._total_levels)
+        if ordered:
+            from_sql, order_ls, order_params = self._get_order(self._levels)
+            cursor = self._conn.execute(
+                "SELECT {columns}, value FROM {from_}{where} ORDER BY {order}"
+                "".format(columns=columns, from_=from_sql, where=where_sql,
+                          order=", ".join(order_ls)),
+                order_params + params,
+            )
+        else:
+            cursor = self._conn.execute(
+                "SELECT {columns}, value FROM {table}{where}".format(
+                    columns=columns, table=DATA_TABLE, where=where_sql),
+                params,
+            )
+        residuals = self._residuals
+        if not residuals:
+            return cursor
+        return (
+            row for row in cursor
+            if all(filter_func(row[column])
+                   for column, filter_func in residuals)
+        )
+
+    def _iter_prefixes(self, depth, ordered=True):
+        """Iterate over unique key-tuples of the first depth levels, ordered
+        as nested dictionaries if ordered (see _get_order)"""
+        offset = self._offset
+        if self._residuals:
+            seen = set()
+            for row in self._iter_rows(ordered=ordered):
+                key_tup = row[offset:offset + depth]
+                if key_tup not in seen:
+                    seen.add(key_tup)
+                    yield key_tup
+            return
+
+        columns = _column_list(offset, offset + depth)
+        where_sql, params = self._get_where()
+        if ordered:
+            from_sql, order_ls, order_params = self._get_order(depth)
+            cursor = self._conn.execute(
+                "SELECT {columns} FROM {from_}{where} GROUP BY {columns} "
+                "ORDER BY {order}".format(
+                    columns=columns, from_=from_sql, where=where_sql,
+                    order=", ".join("MIN({})".format(term)
+                                    for term in order_ls)),
+                order_params + params,
+            )
+        else:
+            cursor = self._conn.execute(
+                "SELECT DISTINCT {columns} FROM {table}{where}".format(
+                    columns=columns, table=DATA_TABLE, where=where_sql),
+                params,
+            )
+        for row in cursor:
+            yield tuple(row)
+
+    def _has_rows(self, prefix):
+        """Whether any row matches prefix and criteria"""
+        for _ in self._iter_rows(prefix=prefix, ordered=False):
+            return True
+        return False
+
+    # ==== Other ==== #
+
+    def __repr__(self):
+        args_string_ls = [
+            "levels={levels}".format(levels=self._levels),
+        ]
+        if self._level_names_is_set:
+            args_string_ls.append("level_names={level_names}".format(
+                level_names=self.level_names
+            ))
+        return "{class_name}({args_string})".format(
+            class_name=self.__class__.__name__,
+            args_string=", ".join(args_string_ls),
+        )
+
+    def _wrap_level(self, level):
+        """Wrap a level argument"""
+        return _wrap_level(level, allowed_level=self.levels)
+
+
+def _create_tables(conn, levels, level_names):
+    """Create metadata and data tables, with an index on every level
+    column"""
+    with conn:
+        conn.execute("CREATE TABLE {table} (name TEXT PRIMARY KEY, value TEXT)"
+                     "".format(table=META_TABLE))
+        conn.executemany(
+            "INSERT INTO {table} VALUES (?, ?)".format(table=META_TABLE),
+            [("levels", json.dumps(levels)),
+             ("level_names", json.dumps(level_names))],
+        )
+        conn.execute("CREATE TABLE {table} ({columns}, value BLOB)".format(
+            table=DATA_TABLE,
+            columns=", ".join("k{} NOT NULL".format(i) for i in range(levels)),
+        ))
+        # The unique index also serves lookups on the first level
+        conn.execute("CREATE UNIQUE INDEX {table}_keys ON {table} ({columns})"
+                     "".format(table=DATA_TABLE,
+                               columns=_column_list(0, levels)))
+        for i in range(1, levels):
+            conn.execute("CREATE INDEX {table}_k{i} ON {table} (k{i})".format(
+                table=DATA_TABLE, i=i))
+
+
+def _read_metadata(conn):
+    """Read (levels, level_names) from database, or None if the database
+    does not hold a StructuredNestedDict"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (META_TABLE,),
+    ).fetchone()
+    if exists is None:
+        return None
+    metadata = dict(conn.execute(
+        "SELECT name, value FROM {table}".format(table=META_TABLE)))
+    level_names = json.loads(metadata["level_names"])
+    if level_names is not None:
+        level_names = tuple(level_names)
+    return json.loads(metadata["levels"]), level_names
+
+
+def _column_list(start, stop):
+    return ", ".join("k{}".format(i) for i in range(start, stop))
+
+
+def _first_rowid_join_sql(level, where_sql):
+    """JOIN clause adding the first rowid of each key-tuple prefix of levels
+    0 to level, as p<level>.first_rowid, to rows of table alias t"""
+    keys = range(level + 1)
+    return (
+        " JOIN (SELECT {aliases}, MIN(rowid) AS first_rowid FROM {table}"
+        "{where} GROUP BY {columns}) AS p{level} ON {on}".format(
+            aliases=", ".join("k{i} AS p{level}_k{i}".format(
+                i=i, level=level) for i in keys),
+            table=DATA_TABLE,
+            where=where_sql,
+            columns=_column_list(0, level + 1),
+            level=level,
+            on=" AND ".join("t.k{i} = p{level}.p{level}_k{i}".format(
+                i=i, level=level) for i in keys),
+        )
+    )
+
+
+def _upsert_rows(conn, rows, num_keys):
+    """Insert rows of keys and pickled value, updating the value of rows
+    whose keys exist in place, so that they keep their rowid (and position).
+    Must be run inside a transaction"""
+    insert_sql = "INSERT INTO {table} VALUES ({params})".format(
+        table=DATA_TABLE, params=", ".join(["?"] * (num_keys + 1)))
+    if sqlite3.sqlite_version_info >= (3, 24, 0):
+        conn.executemany(
+            insert_sql + " ON CONFLICT ({columns}) DO UPDATE SET "
+            "value = excluded.value".format(
+                columns=_column_list(0, num_keys)),
+            rows,
+        )
+        return
+    # No UPSERT in older SQLite versions
+    update_sql = "UPDATE {table} SET value = ? WHERE {where}".format(
+        table=DATA_TABLE, where=_prefix_to_sql(range(num_keys))[0])
+    for row in rows:
+        cursor = conn.execute(update_sql, row[-1:] + row[:-1])
+        if cursor.rowcount == 0:
+            conn.execute(insert_sql, row)
+
+
+def _prefix_to_sql(prefix):
+    return " AND ".join("k{} = ?".format(i) for i in range(len(prefix))), \
+        list(prefix)
+
+
+def _criteria_to_sql(column, criteria, filter_out):
+    """Translate criteria to a (clause, params) WHERE condition, or None if
+    it has to be evaluated in Python"""
+    if isinstance(criteria, (slice, types.FunctionType)):
+        return None
+    elif isinstance(criteria, (list, set)):
+        if len(criteria) > MAX_IN_PARAMS \
+                or not all(_is_sql_key(key) for key in criteria):
+            return None
+        return "k{column} {not_}IN ({params})".format(
+            column=column,
+            not_="NOT " if filter_out else "",
+            params=", ".join(["?"] * len(criteria)),
+        ), list(criteria)
+    elif _is_sql_key(criteria):
+        return "k{column} {op} ?".format(
+            column=column, op="!=" if filter_out else "=",
+        ), [criteria]
+    return None
+
+
+def _is_sql_key(key):
+    return isinstance(key, SQL_KEY_TYPES) and not isinstance(key, bool)
+
+
+def _check_keys(key_tup):
+    for key in key_tup:
+        if not _is_sql_key(key):
+            raise TypeError("Keys must be ints, floats, strings or bytes, "
+                            "not {}".format(type(key)))
+
+
+def _memoize(filter_func):
+    """Cache filter results, so each unique key is only evaluated once"""
+    cache = {}
+
+    def memoized_filter_func(key):
+        if key not in cache:
+            cache[key] = filter_func(key)
+        return cache[key]
+    return memoized_filter_func
+
+
+def _dumps(value):
+    return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def _loads(blob):
+    return pickle.loads(bytes(blob))
+
+
+sqlsndict = SQLiteStructuredNestedDict
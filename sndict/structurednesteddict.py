@@ -1,21 +1,34 @@
 import collections as col
+import csv
+import itertools
+import operator
 import six
 import types
 import warnings
+import weakref
 
+from .aggregation import get_accumulator_factory, get_func_name
 from .nesteddict import NestedDict
 from .exceptions import LevelError
+from .keyindex import LevelKeyIndex
+from .parallel import (
+    map_values_by_top_key, is_parallel, map_chunk, filter_chunk,
+)
 from .shared import get_filter_func
 from .utils import (
     GetSetFunctionClass, GetSetAmbiguousTupleFunctionClass,
-    list_add, list_index, list_is_unique,
-    tuple_constructor,
+    list_index, list_is_unique,
     dict_to_string, get_str_func,
     replace_none, identity,
 )
-from .compat import iter_to_list
+from .compat import iter_to_list, import_numpy, open_csv
 
 FLATTENED_LEVEL_NAME_SEPARATOR = "___"
+_KEY_TUPLE_CLASSES = {}
+# Weak references to StructuredNestedDicts with a key index, by id, so that
+# mutations only look for indexed ancestors if any exist. A plain dict, as
+# checking if a WeakValueDictionary is empty is comparatively slow
+_INDEXED_SNDICTS = {}
 
 
 class StructuredNestedDict(col.OrderedDict):
@@ -53,6 +66,14 @@ class StructuredNestedDict(col.OrderedDict):
             self._level_names_is_set = True
             self._level_names = level_names
 
+        # Cached dimensions, computed on access and reset to None by changes
+        # to self or to any nested dictionary. Nested dictionaries keep a weak
+        # reference to the dictionary containing them, and their key in it
+        self._dim = None
+        self._parent = None
+        self._parent_key = None
+        self._key_index = None
+
         # Initialize superclass
         super(self.__class__, self).__init__(*args, **kwargs)
 
@@ -95,6 +116,166 @@ class StructuredNestedDict(col.OrderedDict):
         else:
             raise RuntimeError("Don't supply both levels and level_names")
 
+    @classmethod
+    def from_records(cls, records, by, value=None, level_names=None):
+        """Initialize by streaming records straight into the nested
+        structure, without materializing the records or an intermediate
+        flat dictionary
+
+        Records sharing key prefixes with the previous record reuse the same
+        path, so input that is sorted or grouped by the level columns is
+        fastest, but any order is accepted. If multiple records have the same
+        keys, the last one is kept.
+
+        Parameters
+        ----------
+        records: iterable
+            Iterable of records (e.g. dicts, or lists/tuples)
+        by: list
+            Level columns: for each level, a field of the record (dict key or
+            index), or a function applied to the record
+        value: optional
+            Field of the record, or function applied to the record, to use
+            as value. Defaults to the whole record
+        level_names: list, optional
+            List of level names. Defaults to by, if every field in by is a
+            string
+
+        Returns
+        -------
+        StructuredNestedDict
+        """
+        levels = len(by)
+        if levels == 0:
+            raise LevelError("by cannot be empty")
+        key_func_ls = [_get_field_getter(field) for field in by]
+        val_func = identity if value is None else _get_field_getter(value)
+        if level_names is None \
+                and all(isinstance(field, six.string_types) for field in by):
+            level_names = list(by)
+
+        new_dict = cls(levels=levels, level_names=level_names)
+        path = []
+        cursor = [new_dict]
+        for record in records:
+            key_ls = [key_func(record) for key_func in key_func_ls]
+
+            # Reuse the shared prefix with the previous record
+            i = 0
+            max_shared = min(levels - 1, len(path))
+            while i < max_shared and path[i] == key_ls[i]:
+                i += 1
+            del path[i:]
+            del cursor[i + 1:]
+
+            for key in key_ls[i:levels - 1]:
+                parent = cursor[-1]
+                child = dict.get(parent, key)
+                if child is None:
+                    child = parent._add_child(key)
+                path.append(key)
+                cursor.append(child)
+            cursor[-1][key_ls[-1]] = val_func(record)
+        return new_dict
+
+    @classmethod
+    def from_csv(cls, path_or_file, by, value=None, converter=None,
+                 level_names=None, **csv_kwargs):
+        """Initialize by streaming rows of a CSV file with a header row
+
+        Parameters
+        ----------
+        path_or_file: str or file
+            Path to, or opened, CSV file
+        by: list
+            Names of level columns
+        value: str or list, optional
+            Name of value column, or list of names of value columns (values
+            are then tuples). Defaults to an OrderedDict of all non-level
+            columns
+        converter: function, optional
+            Function applied to each value, e.g. float
+        level_names: list, optional
+            List of level names. Defaults to by
+        csv_kwargs: dict
+            Keyword arguments passed to csv.reader
+
+        Returns
+        -------
+        StructuredNestedDict
+        """
+        if isinstance(path_or_file, six.string_types):
+            with open_csv(path_or_file) as f:
+                return cls.from_csv(
+                    f, by=by, value=value, converter=converter,
+                    level_names=level_names, **csv_kwargs
+                )
+
+        reader = csv.reader(path_or_file, **csv_kwargs)
+        header = next(reader)
+        by_indices = [header.index(column) for column in by]
+        if value is None:
+            value_columns = [column for column in header if column not in by]
+            value_indices = [header.index(column) for column in value_columns]
+            val_func = lambda row: col.OrderedDict(
+                zip(value_columns, [row[i] for i in value_indices]))
+        elif isinstance(value, (list, tuple)):
+            value_indices = [header.index(column) for column in value]
+            val_func = lambda row: tuple([row[i] for i in value_indices])
+        else:
+            val_func = operator.itemgetter(header.index(value))
+        if converter is not None:
+            get_val = val_func
+            val_func = lambda row: converter(get_val(row))
+
+        return cls.from_records(
+            reader, by=by_indices, value=val_func,
+            level_names=replace_none(level_names, list(by)),
+        )
+
+    @classmethod
+    def from_trusted(cls, data, levels=1, level_names=None):
+        """Initialize from data that is already well-formed, skipping the
+        type-checks and re-wrapping done by __setitem__
+
+        Intended for internal/expert use: data must have dicts at every
+        level but the last. StructuredNestedDicts with matching metadata are
+        attached as-is, unless they already belong to another
+        StructuredNestedDict, in which case they are copied. Other dicts are
+        wrapped without validation.
+
+        Parameters
+        ----------
+        data: dict, or list
+            Nested dictionary, or list of (key, value) pairs
+        levels: int
+            Number of levels
+        level_names: list
+            List of level names
+
+        Returns
+        -------
+        StructuredNestedDict
+        """
+        new_dict = cls(levels=levels, level_names=level_names)
+        iterdata = six.iteritems(data) if isinstance(data, dict) else data
+        odict_setitem = col.OrderedDict.__setitem__
+
+        if levels == 1:
+            for key, val in iterdata:
+                odict_setitem(new_dict, key, val)
+        else:
+            child_level_names = level_names[1:] \
+                if level_names is not None else None
+            parent_ref = weakref.ref(new_dict)
+            for key, val in iterdata:
+                if not new_dict._is_child(val) or val._has_parent():
+                    val = cls.from_trusted(val, levels - 1, child_level_names)
+                odict_setitem(new_dict, key, val)
+                val._parent = parent_ref
+                val._parent_key = key
+        return new_dict
+
     # ==== Properties ==== #
 
     @property
@@ -106,12 +287,14 @@ class StructuredNestedDict(col.OrderedDict):
         tuple:
             Tuple of widths of nested dictionaries, one per level
         """
-        if self.levels == 1:
-            return len(self),
-        dim_list = [[0] * (self._levels - 1)]
-        for sub_dict in self.values():
-            dim_list.append(sub_dict.dim)
-        return (len(self),) + tuple(list_add(dim_list))
+        if self._dim is None:
+            dim = [len(self)] + [0] * (self._levels - 1)
+            if self._levels > 1:
+                for sub_dict in six.itervalues(self):
+                    for i, width in enumerate(sub_dict.dim):
+                        dim[i + 1] += width
+            self._dim = dim
+        return tuple(self._dim)
 
     @property
     def levels(self):
@@ -146,7 +329,7 @@ class StructuredNestedDict(col.OrderedDict):
         dict
             Dimensions keyed by level name
         """
-        return dict(zip(self.level_names, self._dim))
+        return dict(zip(self.level_names, self.dim))
 
     # ==== Iterators ==== #
 
@@ -177,32 +360,31 @@ class StructuredNestedDict(col.OrderedDict):
         StructuredNestedDict
         """
         levels = self._wrap_level(levels)
-        if levels is None:
-            levels = self.levels - 1
-        else:
-            levels = self._wrap_level(levels)
-
-        if named:
-            key_tup_class = self.get_named_tuple(levels=levels + 1)
-        else:
-            key_tup_class = tuple_constructor
-        for key_ls, val in self._iterflatten(levels=levels):
-            yield key_tup_class(*key_ls), val
+        if not named:
+            return self._iterflatten(levels)
+        key_tup_class = self.get_named_tuple(levels=levels + 1)
+        return (
+            (tuple.__new__(key_tup_class, key_tup), val)
+            for key_tup, val in self._iterflatten(levels)
+        )
 
     def _iterflatten(self, levels):
-        """Underlying iterator for flattening"""
+        """Underlying stack-based iterator for flattening"""
         levels = self._wrap_level(levels)
 
         # flatten 0 = nothing, flatten 1 = 1
-        for key, val in six.iteritems(self):
-            # TODO: stop levels from being too deep
-            if levels > 0:
-                if not isinstance(val, StructuredNestedDict):
-                    raise LevelError()
-                for partial_key_tup, sub_val in val._iterflatten(levels - 1):
-                    yield (key,) + partial_key_tup, sub_val
+        stack = [(six.iteritems(self), ())]
+        while stack:
+            iterator, prefix = stack[-1]
+            for key, val in iterator:
+                if len(stack) <= levels:
+                    if not isinstance(val, StructuredNestedDict):
+                        raise LevelError()
+                    stack.append((six.iteritems(val), prefix + (key,)))
+                    break
+                yield prefix + (key,), val
             else:
-                yield (key,), val
+                stack.pop()
 
     def iterflatten_keys(self, levels=-1, named=True):
         """Returns an iterator with of keys of flattened dict
@@ -301,7 +483,7 @@ class StructuredNestedDict(col.OrderedDict):
                 )
             new_level_names = (flattened_name,) + self.level_names[levels + 1:]
 
-        return self.__class__(
+        return self.from_trusted(
             self.iterflatten(levels=levels, named=named),
             levels=self.levels - levels,
             level_names=new_level_names,
@@ -380,6 +562,13 @@ class StructuredNestedDict(col.OrderedDict):
         """
         unique_keys = col.OrderedDict()
 
+        if self._key_index is not None:
+            for level, level_name in enumerate(self.level_names):
+                unique_keys[level_name] = self._key_index.keys(level)
+                if sort_keys:
+                    unique_keys[level_name].sort()
+            return unique_keys if named else unique_keys.values()
+
         this_level_dicts = [self]
         for level, level_name in enumerate(self.level_names):
             level_key_set = set()
@@ -424,9 +613,13 @@ class StructuredNestedDict(col.OrderedDict):
 
         # stratify 0 = nothing, stratify 1 = 1
         new_dict = col.OrderedDict()
+        has_remaining_keys = False
+        has_short_keys = False
         for key_tup, val in six.iteritems(self):
             stratified_keys = key_tup[:levels + 1]
             remaining_keys = key_tup[levels + 1:]
+            if len(stratified_keys) < levels + 1:
+                has_short_keys = True
 
             dict_pointer = new_dict
             for key in stratified_keys[:-1]:
@@ -437,6 +630,7 @@ class StructuredNestedDict(col.OrderedDict):
             final_key = stratified_keys[-1]
 
             if len(remaining_keys):
+                has_remaining_keys = True
                 dict_pointer[final_key] = col.OrderedDict()
                 dict_pointer[final_key][remaining_keys] = val
             else:
@@ -457,7 +651,14 @@ class StructuredNestedDict(col.OrderedDict):
             else:
                 level_names = None
 
-        return self.__class__(
+        if has_remaining_keys or has_short_keys:
+            # Extra nesting from remaining keys, and values left where nested
+            # dicts are expected by short keys, need to be validated
+            return self.__class__(
+                new_dict, levels=levels + self.levels,
+                level_names=level_names,
+            )
+        return self.from_trusted(
             new_dict, levels=levels + self.levels,
             level_names=level_names,
         )
@@ -484,6 +685,215 @@ class StructuredNestedDict(col.OrderedDict):
             for key, val in self.iteritems()
         ])
 
+    def to_columnar(self):
+        """Convert to a read-only, column-oriented
+        ColumnarStructuredNestedDict
+
+        Returns
+        -------
+        ColumnarStructuredNestedDict
+        """
+        from .columnar import ColumnarStructuredNestedDict
+        return ColumnarStructuredNestedDict(self)
+
+    def lazy(self):
+        """Start a lazy transformation pipeline. Operations are recorded and
+        only run, in a single traversal, on collect()
+
+        Returns
+        -------
+        LazyStructuredNestedDict
+        """
+        from .lazy import LazyStructuredNestedDict
+        return LazyStructuredNestedDict(self)
+
+    def freeze(self, path):
+        """Write to a compact, read-only binary file, which can be opened
+        near-instantly with sndict.open_frozen and shared between processes
+        through mmap. Keys of each level must be sortable.
+
+        Parameters
+        ----------
+        path: str
+            Path to write to
+        """
+        from .frozen import freeze
+        freeze(self, path)
+
+    def to_ndarray(self, fill_value=float("nan"), dtype=None, sort_keys=True,
+                   return_keys=False):
+        """Convert to a dense numpy array with one axis per level. Axis labels
+        are the unique keys of each level (see unique_keys)
+
+        Requires numpy
+
+        Parameters
+        ----------
+        fill_value: object
+            Value for cells with no corresponding value
+        dtype: numpy dtype, optional
+            Defaults to a dtype that fits both values and fill_value. If only
+            one of values and fill_value are strings, defaults to object
+            instead of converting the other to strings
+        sort_keys: bool
+            Whether to sort axis labels
+        return_keys: bool
+            Whether to also return the axis labels
+
+        Returns
+        -------
+        numpy.ndarray, or (numpy.ndarray, list)
+        """
+        numpy = import_numpy()
+        level_keys = [list(keys) for keys in
+                      self.unique_keys(sort_keys=sort_keys)]
+        key_positions = [dict(zip(keys, range(len(keys))))
+                         for keys in level_keys]
+
+        coord_ls = [[] for _ in range(self.levels)]
+        values = []
+        for key_tup, val in self._iterflatten(self.levels - 1):
+            for coords, positions, key in zip(coord_ls, key_positions,
+                                              key_tup):
+                coords.append(positions[key])
+            values.append(val)
+
+        value_arr = numpy.asarray(values, dtype=dtype)
+        fill_is_text = numpy.asarray(fill_value).dtype.kind in "SU"
+        if dtype is None:
+            dtype = numpy.result_type(value_arr, numpy.asarray(fill_value))
+            if dtype.kind in "SU" and \
+                    (value_arr.dtype.kind not in "SU" or not fill_is_text):
+                dtype = numpy.dtype(object)
+                value_arr = numpy.asarray(values, dtype=dtype)
+        elif numpy.dtype(dtype).kind in "SU" and not fill_is_text:
+            raise ValueError(
+                "fill_value {!r} cannot be represented in dtype {}".format(
+                    fill_value, numpy.dtype(dtype)))
+        arr = numpy.full([len(keys) for keys in level_keys], fill_value,
+                         dtype=dtype)
+        if len(values):
+            arr[tuple(numpy.asarray(coords) for coords in coord_ls)] = \
+                value_arr
+
+        if return_keys:
+            return arr, level_keys
+        return arr
+
+    @classmethod
+    def from_ndarray(cls, arr, level_keys, level_names=None, drop_value=None):
+        """Initialize from a numpy array with one axis per level
+
+        Requires numpy
+
+        Parameters
+        ----------
+        arr: numpy.ndarray
+            Array of values
+        level_keys: list
+            List of axis labels (keys) for each axis
+        level_names: list
+            List of level names
+        drop_value: object, optional
+            If supplied, cells equal to drop_value (including NaN, if
+            drop_value is NaN) are left out
+
+        Returns
+        -------
+        StructuredNestedDict
+        """
+        numpy = import_numpy()
+        arr = numpy.asarray(arr)
+        if len(level_keys) != arr.ndim or \
+                tuple(map(len, level_keys)) != arr.shape:
+            raise LevelError("level_keys do not match array shape {}".format(
+                arr.shape))
+
+        data = six.moves.zip(itertools.product(*level_keys),
+                             arr.ravel().tolist())
+        if drop_value is not None:
+            if drop_value != drop_value:
+                # NaN is the only value not equal to itself
+                keep = arr == arr
+            else:
+                keep = arr != drop_value
+            data = itertools.compress(data, keep.ravel().tolist())
+
+        return cls.from_trusted(
+            NestedDict.from_flat(data, dict_type="odict"),
+            levels=arr.ndim,
+            level_names=level_names,
+        )
+
+    def iter_records(self):
+        """Returns an iterator of flat records, one per value, each a tuple of
+        the keys at every level followed by the value
+
+        Returns
+        -------
+        generator
+        """
+        return (key_tup + (val,) for key_tup, val in self._iterflatten(-1))
+
+    def to_columns(self, value_name="value", as_ndarray=False):
+        """Export as columns, with one column of keys per level and a column
+        of values, in a single traversal
+
+        Parameters
+        ----------
+        value_name: str
+            Name of value column
+        as_ndarray: bool
+            Whether to convert each column to a numpy array (requires numpy)
+
+        Returns
+        -------
+        OrderedDict
+            Columns keyed by level names, followed by value_name
+        """
+        key_columns = [[] for _ in range(self.levels)]
+        value_column = []
+        appenders = [column.append for column in key_columns]
+        append_value = value_column.append
+        for key_tup, val in self._iterflatten(-1):
+            for append, key in zip(appenders, key_tup):
+                append(key)
+            append_value(val)
+
+        columns = col.OrderedDict(zip(self.level_names, key_columns))
+        columns[value_name] = value_column
+        if as_ndarray:
+            numpy = import_numpy()
+            for name, column in list(columns.items()):
+                columns[name] = numpy.array(column)
+        return columns
+
+    def to_csv(self, path_or_file, value_name="value", header=True,
+               **csv_kwargs):
+        """Write as CSV, with one column per level and a column of values.
+        Rows are written as they are traversed
+
+        Parameters
+        ----------
+        path_or_file: str or file
+            Path to, or opened, CSV file
+        value_name: str
+            Name of value column in header
+        header: bool
+            Whether to write a header row
+        csv_kwargs: dict
+            Keyword arguments passed to csv.writer
+        """
+        if isinstance(path_or_file, six.string_types):
+            with open_csv(path_or_file, "w") as f:
+                return self.to_csv(f, value_name=value_name, header=header,
+                                   **csv_kwargs)
+
+        writer = csv.writer(path_or_file, **csv_kwargs)
+        if header:
+            writer.writerow(list(self.level_names) + [value_name])
+        writer.writerows(self.iter_records())
+
     def rearrange(self, level_ls=None, level_name_ls=None):
         """Rearrange levels of StructuredNestedDict
         Only supply either level_ls or level_name_ls.
@@ -534,22 +944,29 @@ class StructuredNestedDict(col.OrderedDict):
         return self._rearrange(level_ls)
 
     def _rearrange(self, level_ls):
-        """Underlying method for rearranging levels"""
+        """Underlying method for rearranging levels. Collects the rearranged
+        nesting as plain dicts in a single traversal of the rearranged
+        levels, then builds the result without revalidation"""
         num_levels = len(level_ls)
 
-        new_dict = col.OrderedDict()
-        for key_tup, val in self.iterflatten(num_levels - 1):
-            new_dict[tuple(list_index(key_tup, level_ls))] = val
-
         if self._level_names_is_set:
             new_level_names = tuple(list_index(self.level_names, level_ls))\
                 + self.level_names[num_levels:]
         else:
             new_level_names = None
 
-        return self.__class__(new_dict, levels=self.levels - num_levels + 1)\
-            .stratify((len(level_ls)) - 1)\
-            .replace_metadata(level_names=new_level_names, levels=self.levels)
+        new_data = col.OrderedDict()
+        last_level = level_ls[-1]
+        for key_tup, val in self.iterflatten(num_levels - 1, named=False):
+            dict_pointer = new_data
+            for i in level_ls[:-1]:
+                sub_dict = dict_pointer.get(key_tup[i])
+                if sub_dict is None:
+                    sub_dict = dict_pointer[key_tup[i]] = col.OrderedDict()
+                dict_pointer = sub_dict
+            dict_pointer[key_tup[last_level]] = val
+        return self.from_trusted(new_data, levels=self.levels,
+                                 level_names=new_level_names)
 
     def swap_levels(self, level_a, level_b):
         """Swap two levels in a StructuredNestedDict
@@ -600,21 +1017,28 @@ class StructuredNestedDict(col.OrderedDict):
         assert set(kwargs.keys()) <= {"levels", "level_names"}
         return self.__class__(self, **kwargs)
 
-    def replace_data(self, data):
+    def replace_data(self, data, trusted=False):
         """Return new StructuredNestedDict with different data but same metadata
 
         Parameters
         ----------
         data: dict, or list
             Nested dictionary
+        trusted: bool
+            If True, data is assumed to be well-formed and is not validated.
+            See StructuredNestedDict.from_trusted
 
         Returns
         -------
         StructuredNestedDict
         """
+        level_names = self._level_names if self._level_names_is_set else None
+        if trusted:
+            return self.from_trusted(
+                data, levels=self.levels, level_names=level_names,
+            )
         return self.__class__(
-            data, levels=self.levels,
-            level_names=self._level_names if self._level_names_is_set else None,
+            data, levels=self.levels, level_names=level_names,
         )
 
     def sort_keys(self, cmp=None, key=None, reverse=False):
@@ -636,7 +1060,7 @@ class StructuredNestedDict(col.OrderedDict):
         return self.replace_data([
             (key, self[key])
             for key in sorted(self.keys(), key=key, reverse=reverse)
-        ])
+        ], trusted=True)
 
     def sort_values(self, key=None, reverse=False):
         """Sort values of StructuredNestedDict (top-level only)
@@ -661,11 +1085,16 @@ class StructuredNestedDict(col.OrderedDict):
         return self.replace_data([
             (key, val)
             for key, val in sorted(self.items(), key=key, reverse=reverse)
-        ])
+        ], trusted=True)
 
-    def map(self, key_func=None, val_func=None, at_level=-1, warn=False):
+    def map(self, key_func=None, val_func=None, at_level=-1, warn=False,
+            workers=None, executor=None):
         """Apply transformations to keys and values
 
+        If workers or executor is given, val_func is applied in parallel, in
+        one chunk per top-level key. With worker processes, val_func and the
+        values must be picklable.
+
         Parameters
         ----------
         key_func: function, optional
@@ -676,6 +1105,11 @@ class StructuredNestedDict(col.OrderedDict):
             Level to transform keys at
         warn: bool
             Warn if dimensions of dictionary have been changed
+        workers: int, optional
+            Number of worker processes
+        executor: concurrent.futures.Executor, optional
+            Executor to use instead, e.g. a ThreadPoolExecutor for functions
+            that release the GIL
 
         Returns
         -------
@@ -683,17 +1117,27 @@ class StructuredNestedDict(col.OrderedDict):
         """
         at_level = self._wrap_level(at_level)
         key_func = replace_none(key_func, identity)
-        val_func = replace_none(val_func, identity)
         new_dict = self.replace_data({})
-        for key, val in self.iterflatten(levels=at_level, named=False):
-            new_dict.nested_set(key_func(key), val_func(val))
+        if val_func is not None and is_parallel(workers, executor):
+            pairs = list(self._iterflatten(at_level))
+            new_values = map_values_by_top_key(
+                map_chunk, (val_func,), pairs,
+                workers=workers, executor=executor,
+            )
+            for (key, _), new_val in zip(pairs, new_values):
+                new_dict.nested_set(key_func(key), new_val)
+        else:
+            val_func = replace_none(val_func, identity)
+            for key, val in self._iterflatten(at_level):
+                new_dict.nested_set(key_func(key), val_func(val))
 
-        assert new_dict.dim[-1] == self.dim[-1]
-        if warn and new_dict.dim != self.dim:
+        new_dim, old_dim = new_dict.dim, self.dim
+        assert new_dim[-1] == old_dim[-1]
+        if warn and new_dim != old_dim:
             warnings.warn(
                 "Empty high-level dicts may have been dropped, "
                 "dimensions changes from {} to {}".format(
-                    new_dict.dim, self.dim,
+                    new_dim, old_dim,
                 ))
 
         return new_dict
@@ -714,7 +1158,7 @@ class StructuredNestedDict(col.OrderedDict):
         """
         return self.map(key_func=key_func, at_level=at_level)
 
-    def map_values(self, val_func, at_level=-1):
+    def map_values(self, val_func, at_level=-1, workers=None, executor=None):
         """Apply transformations to keys and values
 
         Parameters
@@ -723,12 +1167,372 @@ class StructuredNestedDict(col.OrderedDict):
             Function to transform values
         at_level: int
             Level to transform values at
+        workers: int, optional
+            Number of worker processes. See map
+        executor: concurrent.futures.Executor, optional
+            Executor to use instead. See map
 
         Returns
         -------
         StructuredNestedDict
         """
-        return self.map(val_func=val_func, at_level=at_level)
+        return self.map(val_func=val_func, at_level=at_level,
+                        workers=workers, executor=executor)
+
+    def async_map_values(self, coro_func, concurrency=8, callback=None,
+                         at_level=-1):
+        """Apply a coroutine function to values, awaiting up to concurrency
+        calls at a time. Requires Python 3.5+
+
+        Parameters
+        ----------
+        coro_func: function
+            Coroutine function to transform values
+        concurrency: int
+            Maximum number of coro_func calls awaited at a time
+        callback: function, optional
+            Called as callback(key-tuple, new value) as each value completes.
+            If it returns an awaitable, it is awaited
+        at_level: int
+            Level to transform values at
+
+        Returns
+        -------
+        coroutine
+            Coroutine returning the StructuredNestedDict, with keys in
+            original order
+        """
+        from .asyncmap import map_values
+
+        def build(pairs):
+            new_dict = self.replace_data({})
+            for key, new_val in pairs:
+                new_dict.nested_set(key, new_val)
+            return new_dict
+
+        pairs = list(self._iterflatten(self._wrap_level(at_level)))
+        return map_values(pairs, coro_func, concurrency, callback, build)
+
+    def aggregate(self, funcs, by=None):
+        """Aggregate values over all levels not in `by`, in a single traversal
+
+        Aggregation functions are either names of built-in accumulators,
+        which never hold more than a running state per group:
+            "sum", "count", "min", "max", "mean", "var" (sample variance)
+        or the equivalent builtins sum/len/min/max. Any other function is
+        applied to the list of values of each group.
+
+        Parameters
+        ----------
+        funcs: str, function or list
+            Aggregation function, or list of aggregation functions
+        by: list, optional
+            Levels (ints or level names) to group by, in their order in the
+            result. Defaults to aggregating over all levels
+
+        Returns
+        -------
+        StructuredNestedDict, or aggregated value if by is empty
+            If funcs is a list, each aggregated value is an OrderedDict keyed
+            by function name
+        """
+        by_ls = [self._resolve_level(level) for level in replace_none(by, [])]
+        assert list_is_unique(by_ls)
+
+        if isinstance(funcs, (list, tuple)):
+            factory_ls = [get_accumulator_factory(func) for func in funcs]
+            func_names = [get_func_name(func) for func in funcs]
+
+            def get_result(accumulators):
+                return col.OrderedDict(zip(func_names, [
+                    accumulator.result() for accumulator in accumulators
+                ]))
+        else:
+            factory_ls = [get_accumulator_factory(funcs)]
+
+            def get_result(accumulators):
+                return accumulators[0].result()
+
+        groups = col.OrderedDict()
+        for key_tup, val in self._iterflatten(self.levels - 1):
+            group_key = tuple(key_tup[i] for i in by_ls)
+            accumulators = groups.get(group_key)
+            if accumulators is None:
+                accumulators = [factory() for factory in factory_ls]
+                groups[group_key] = accumulators
+            for accumulator in accumulators:
+                accumulator.add(val)
+
+        if not by_ls:
+            return get_result(groups.get(
+                (), [factory() for factory in factory_ls]))
+
+        if self._level_names_is_set:
+            new_level_names = tuple(self.level_names[i] for i in by_ls)
+        else:
+            new_level_names = None
+        return self.from_trusted(
+            NestedDict.from_flat(
+                ((group_key, get_result(accumulators))
+                 for group_key, accumulators in six.iteritems(groups)),
+                dict_type="odict",
+            ),
+            levels=len(by_ls),
+            level_names=new_level_names,
+        )
+
+    def reduce(self, func="sum", level=-1):
+        """Collapse one or more levels by aggregating values across them.
+        See StructuredNestedDict.aggregate for supported functions
+
+        Parameters
+        ----------
+        func: str or function
+            Aggregation function
+        level: int, str or list
+            Level (int or level name), or list of levels, to collapse
+
+        Returns
+        -------
+        StructuredNestedDict, or aggregated value if all levels are collapsed
+        """
+        if not isinstance(level, (list, tuple)):
+            level = [level]
+        collapsed = set(self._resolve_level(level_) for level_ in level)
+        return self.aggregate(func, by=[
+            i for i in range(self.levels) if i not in collapsed
+        ])
+
+    def join(self, other, how="inner", fill_value=None, fill_key=None):
+        """Join with another StructuredNestedDict on levels with shared level
+        names. A hash table is built on whichever side has fewer values.
+
+        The levels of the result are the levels of this StructuredNestedDict,
+        followed by the levels of `other` that are not shared. Values are
+        (value, other_value) tuples, in the order of this
+        StructuredNestedDict, with unmatched values of `other` last (for
+        how="outer").
+
+        Parameters
+        ----------
+        other: StructuredNestedDict
+        how: ["inner", "left", "outer"]
+            Type of join
+        fill_value: object
+            Value used in place of a missing value from either side
+        fill_key: object
+            Key used in place of a missing key for a level from only one side
+
+        Returns
+        -------
+        StructuredNestedDict
+        """
+        if how not in ("inner", "left", "outer"):
+            raise KeyError("Unknown join type: {}".format(how))
+
+        left_names = list(self.level_names)
+        right_names = list(other.level_names)
+        shared_names = [name for name in left_names if name in right_names]
+        left_shared_ls = [left_names.index(name) for name in shared_names]
+        right_shared_ls = [right_names.index(name) for name in shared_names]
+        right_extra_ls = [i for i, name in enumerate(right_names)
+                          if name not in shared_names]
+        missing_right_keys = (fill_key,) * len(right_extra_ls)
+
+        def get_unmatched_right_key(shared_key, right_extra_keys):
+            return tuple(
+                shared_key[shared_names.index(name)]
+                if name in shared_names else fill_key
+                for name in left_names
+            ) + right_extra_keys
+
+        def iter_joined():
+            if other.dim[-1] <= self.dim[-1]:
+                # Build on other, probe with self
+                table = col.OrderedDict()
+                for key_tup, val in other._iterflatten(other.levels - 1):
+                    shared_key = tuple(key_tup[i] for i in right_shared_ls)
+                    table.setdefault(shared_key, []).append(
+                        (tuple(key_tup[i] for i in right_extra_ls), val))
+                matched = set()
+                for key_tup, val in self._iterflatten(self.levels - 1):
+                    shared_key = tuple(key_tup[i] for i in left_shared_ls)
+                    matches = table.get(shared_key)
+                    if matches:
+                        matched.add(shared_key)
+                        for right_extra_keys, other_val in matches:
+                            yield key_tup + right_extra_keys, (val, other_val)
+                    elif how != "inner":
+                        yield key_tup + missing_right_keys, (val, fill_value)
+                unmatched_right = (
+                    (shared_key, entry)
+                    for shared_key, entries in six.iteritems(table)
+                    if shared_key not in matched
+                    for entry in entries
+                )
+            else:
+                # Build on self, probe with other
+                left_rows = list(self._iterflatten(self.levels - 1))
+                table = {}
+                for i, (key_tup, _) in enumerate(left_rows):
+                    shared_key = tuple(key_tup[j] for j in left_shared_ls)
+                    table.setdefault(shared_key, []).append(i)
+                row_matches = {}
+                unmatched_right = []
+                for key_tup, val in other._iterflatten(other.levels - 1):
+                    shared_key = tuple(key_tup[i] for i in right_shared_ls)
+                    entry = (tuple(key_tup[i] for i in right_extra_ls), val)
+                    if shared_key in table:
+                        for i in table[shared_key]:
+                            row_matches.setdefault(i, []).append(entry)
+                    elif how == "outer":
+                        unmatched_right.append((shared_key, entry))
+                for i, (key_tup, val) in enumerate(left_rows):
+                    if i in row_matches:
+                        for right_extra_keys, other_val in row_matches[i]:
+                            yield key_tup + right_extra_keys, (val, other_val)
+                    elif how != "inner":
+                        yield key_tup + missing_right_keys, (val, fill_value)
+
+            if how == "outer":
+                for shared_key, (right_extra_keys, other_val) \
+                        in unmatched_right:
+                    yield get_unmatched_right_key(
+                        shared_key, right_extra_keys,
+                    ), (fill_value, other_val)
+
+        new_level_names = left_names + [right_names[i]
+                                        for i in right_extra_ls]
+        return self.from_trusted(
+            NestedDict.from_flat(iter_joined(), dict_type="odict"),
+            levels=len(new_level_names),
+            level_names=new_level_names
+            if self._level_names_is_set or other._level_names_is_set
+            else None,
+        )
+
+    # ==== Elementwise Operations ==== #
+
+    def _binary_op(self, other, op, reflected=False):
+        """Apply a binary operator elementwise against a scalar or another
+        StructuredNestedDict.
+
+        StructuredNestedDicts are aligned by key path on level names. If one
+        operand's level names are a subset of the other's, it is broadcast
+        across the missing levels. Values present in only one operand are
+        dropped. If numpy is available and values are numeric, the operator
+        is applied on numpy arrays (so numpy semantics apply, e.g. for
+        division by zero)."""
+        if isinstance(other, StructuredNestedDict):
+            self_names = set(self.level_names)
+            other_names = set(other.level_names)
+            if other_names <= self_names:
+                base, lookup = self, other
+            elif self_names <= other_names:
+                base, lookup = other, self
+                reflected = not reflected
+            else:
+                raise LevelError("Cannot align levels {} and {}".format(
+                    self.level_names, other.level_names))
+
+            base_names = list(base.level_names)
+            positions = [base_names.index(name)
+                         for name in lookup.level_names]
+            key_ls, base_values, lookup_values = [], [], []
+            for key_tup, val in base._iterflatten(base.levels - 1):
+                try:
+                    lookup_val = lookup.nested_get(
+                        [key_tup[i] for i in positions])
+                except KeyError:
+                    continue
+                key_ls.append(key_tup)
+                base_values.append(val)
+                lookup_values.append(lookup_val)
+            other = lookup_values
+        elif isinstance(other, dict):
+            return NotImplemented
+        else:
+            base = self
+            key_ls, base_values = [], []
+            for key_tup, val in self._iterflatten(self.levels - 1):
+                key_ls.append(key_tup)
+                base_values.append(val)
+
+        if reflected:
+            new_values = _apply_elementwise(op, other, base_values)
+        else:
+            new_values = _apply_elementwise(op, base_values, other)
+        return base.from_trusted(
+            NestedDict.from_flat(zip(key_ls, new_values), dict_type="odict"),
+            levels=base.levels,
+            level_names=base._level_names if base._level_names_is_set
+            else None,
+        )
+
+    def __add__(self, other):
+        return self._binary_op(other, operator.add)
+
+    def __radd__(self, other):
+        return self._binary_op(other, operator.add, reflected=True)
+
+    def __sub__(self, other):
+        return self._binary_op(other, operator.sub)
+
+    def __rsub__(self, other):
+        return self._binary_op(other, operator.sub, reflected=True)
+
+    def __mul__(self, other):
+        return self._binary_op(other, operator.mul)
+
+    def __rmul__(self, other):
+        return self._binary_op(other, operator.mul, reflected=True)
+
+    def __truediv__(self, other):
+        return self._binary_op(other, operator.truediv)
+
+    def __rtruediv__(self, other):
+        return self._binary_op(other, operator.truediv, reflected=True)
+
+    __div__ = __truediv__
+    __rdiv__ = __rtruediv__
+
+    def __lt__(self, other):
+        return self._binary_op(other, operator.lt)
+
+    def __le__(self, other):
+        return self._binary_op(other, operator.le)
+
+    def __gt__(self, other):
+        return self._binary_op(other, operator.gt)
+
+    def __ge__(self, other):
+        return self._binary_op(other, operator.ge)
+
+    def eq(self, other):
+        """Elementwise equality. (== keeps its dict meaning)
+
+        Parameters
+        ----------
+        other: object or StructuredNestedDict
+
+        Returns
+        -------
+        StructuredNestedDict
+        """
+        return self._binary_op(other, operator.eq)
+
+    def ne(self, other):
+        """Elementwise inequality. (!= keeps its dict meaning)
+
+        Parameters
+        ----------
+        other: object or StructuredNestedDict
+
+        Returns
+        -------
+        StructuredNestedDict
+        """
+        return self._binary_op(other, operator.ne)
 
     # ==== Getters, Setters and Selectors ==== #
 
@@ -755,6 +1559,20 @@ class StructuredNestedDict(col.OrderedDict):
         -------
         StructuredNestedDict
         """
+        criteria_ls = self._resolve_criteria_ls(criteria_ls)
+        filter_func_ls = [
+            get_filter_func(criteria, filter_out=filter_out)
+            for criteria in criteria_ls
+        ]
+        allowed_prefixes = None
+        if drop_empty:
+            allowed_prefixes = self._allowed_prefixes(criteria_ls, filter_out)
+        return self._filter_key(self, filter_func_ls, drop_empty,
+                                allowed_prefixes)
+
+    def _resolve_criteria_ls(self, criteria_ls):
+        """Resolve criteria for filter_key, given either as a list or as a
+        dict keyed by level name, to a list with one criteria per level"""
         if len(criteria_ls) == 0:
             raise KeyError("criteria_ls cannot be empty")
 
@@ -769,36 +1587,43 @@ class StructuredNestedDict(col.OrderedDict):
                 raise RuntimeError("Unused criteria for: {}".format(
                     criteria_ls.keys()
                 ))
-            criteria_ls = new_criteria_dict.values()
-
-        filter_func_ls = [
-            get_filter_func(criteria, filter_out=filter_out)
-            for criteria in criteria_ls
-        ]
-        return self._filter_key(self, filter_func_ls, drop_empty)
+            criteria_ls = list(new_criteria_dict.values())
+        return criteria_ls
 
     @classmethod
-    def _filter_key(cls, obj, filter_func_ls, drop_empty):
-        """Underlying method for filter_key"""
+    def _filter_key(cls, obj, filter_func_ls, drop_empty,
+                    allowed_prefixes=None, prefix=()):
+        """Underlying method for filter_key. If allowed_prefixes is given,
+        only subtrees whose key-tuples are in allowed_prefixes are visited"""
         if not filter_func_ls or not isinstance(obj, StructuredNestedDict):
             return obj
 
         filter_func = filter_func_ls[0]
+        if allowed_prefixes is not None \
+                and len(prefix) < len(allowed_prefixes):
+            level_allowed = allowed_prefixes[len(prefix)]
+        else:
+            level_allowed = None
 
         new_dict = col.OrderedDict()
         for key, val in six.iteritems(obj):
+            if level_allowed is not None \
+                    and prefix + (key,) not in level_allowed:
+                continue
             if not filter_func(key):
                 continue
-            new_val = cls._filter_key(val, filter_func_ls[1:], drop_empty)
+            new_val = cls._filter_key(val, filter_func_ls[1:], drop_empty,
+                                      allowed_prefixes, prefix + (key,))
             if drop_empty and isinstance(new_val, StructuredNestedDict) \
                     and len(new_val) == 0:
                 continue
             new_dict[key] = new_val
 
-        return obj.replace_data(new_dict)
+        return obj.replace_data(new_dict, trusted=True)
 
     def filter_values(self, criteria, filter_out=False,
-                      level=None, drop_empty=False):
+                      level=None, drop_empty=False,
+                      workers=None, executor=None):
         """Filter StructuredNestedDict values by criteria.
 
         The criteria used in the following ways, based on type:
@@ -816,13 +1641,27 @@ class StructuredNestedDict(col.OrderedDict):
         drop_empty:
             Whether to drop empty nested dictionaries (nested dictionaries
             with all elements filtered out)
+        workers: int, optional
+            Number of worker processes. See map
+        executor: concurrent.futures.Executor, optional
+            Executor to use instead. See map
 
         Returns
         -------
         StructuredNestedDict
         """
-        filter_func = get_filter_func(criteria, filter_out=filter_out)
         level = replace_none(level, self.levels - 1)
+        if is_parallel(workers, executor):
+            keep_ls = map_values_by_top_key(
+                filter_chunk, (criteria, filter_out),
+                list(self._iterflatten(level)),
+                workers=workers, executor=executor,
+            )
+            # _filter_values visits values in the same DFS order
+            keep_iter = iter(keep_ls)
+            filter_func = lambda val: next(keep_iter)
+        else:
+            filter_func = get_filter_func(criteria, filter_out=filter_out)
 
         return self._filter_values(self, filter_func, level, drop_empty)
 
@@ -835,7 +1674,7 @@ class StructuredNestedDict(col.OrderedDict):
                 (key, val)
                 for (key, val) in six.iteritems(obj)
                 if filter_func(val)
-            ])
+            ], trusted=True)
         else:
             new_dict = col.OrderedDict()
             for key, val in six.iteritems(obj):
@@ -845,7 +1684,43 @@ class StructuredNestedDict(col.OrderedDict):
                     continue
                 new_dict[key] = new_val
 
-            return obj.replace_data(new_dict)
+            return obj.replace_data(new_dict, trusted=True)
+
+    def build_index(self):
+        """Build a per-level inverted index of keys, mapping each key to the
+        paths of the dictionaries that contain it. The index is kept in sync
+        as the StructuredNestedDict is modified, and is used by unique_keys,
+        ix and filter_key (with drop_empty=True) to skip non-matching
+        subtrees
+        """
+        key_index = LevelKeyIndex(self._levels)
+        for key, value in six.iteritems(self):
+            key_index.add((), key, value, self._levels - 1)
+        self._key_index = key_index
+        sndict_id = id(self)
+        _INDEXED_SNDICTS[sndict_id] = weakref.ref(
+            self, lambda _: _INDEXED_SNDICTS.pop(sndict_id, None))
+
+    def drop_index(self):
+        """Remove the key index built by build_index"""
+        self._key_index = None
+        _INDEXED_SNDICTS.pop(id(self), None)
+
+    @property
+    def has_index(self):
+        """Whether a key index has been built
+
+        Returns
+        -------
+        bool
+        """
+        return self._key_index is not None
+
+    def _allowed_prefixes(self, criteria_ls, filter_out):
+        """Key-tuple prefixes that can lead to a match, from the key index"""
+        if self._key_index is None or filter_out:
+            return None
+        return self._key_index.allowed_prefixes(list(criteria_ls))
 
     def nested_set(self, key_list, value):
         """Set a value within nested dicts, creating StructuredNestedDict at
@@ -863,9 +1738,13 @@ class StructuredNestedDict(col.OrderedDict):
         self._check_key_list(key_list)
         dict_pointer = self
         for key in key_list[:-1]:
-            if key not in dict_pointer:
+            if key in dict_pointer:
+                dict_pointer = dict_pointer[key]
+            elif dict_pointer.levels > 1:
+                dict_pointer = dict_pointer._add_child(key)
+            else:
                 dict_pointer[key] = self.__class__()
-            dict_pointer = dict_pointer[key]
+                dict_pointer = dict_pointer[key]
         dict_pointer[key_list[-1]] = value
 
     def nested_setdefault(self, key_list, default=None):
@@ -929,8 +1808,16 @@ class StructuredNestedDict(col.OrderedDict):
         """Check whether list has keys or criteria (i.e. if any of the criteria
         lead to special filtering/getting functions"""
         if any(map(_is_criteria, key_or_criteria_ls)):
-            return self.filter_key(criteria_ls=key_or_criteria_ls)\
-                .flatten_values(len(key_or_criteria_ls) - 1)
+            # Subtrees without matches only yield empty dicts, which are
+            # dropped when flattening, so the key index can be used to prune
+            return self._filter_key(
+                self,
+                [get_filter_func(criteria)
+                 for criteria in key_or_criteria_ls],
+                drop_empty=False,
+                allowed_prefixes=self._allowed_prefixes(
+                    key_or_criteria_ls, filter_out=False),
+            ).flatten_values(len(key_or_criteria_ls) - 1)
         else:
             return self.nested_get(key_or_criteria_ls)
 
@@ -1016,13 +1903,13 @@ class StructuredNestedDict(col.OrderedDict):
         )
 
     def __setitem__(self, key, value):
-        if self.levels > 1:
-            if isinstance(value, StructuredNestedDict) \
-                    and value.levels == self.levels - 1 \
-                    and value.level_names[1:] == self.level_names[1:]:
+        if self._levels > 1:
+            if self._is_child(value):
                 # If dictionary is already StructuredNestedDict, and it looks
-                # like we expect it to, skip overhead of initializing anew
-                pass
+                # like we expect it to, copy it without validating it anew.
+                # Inserted dictionaries are always copied, so that changes to
+                # value do not affect self, or vice versa
+                value = value._copy()
             elif isinstance(value, dict):
                 value = StructuredNestedDict(
                     value, levels=self.levels - 1,
@@ -1036,7 +1923,147 @@ class StructuredNestedDict(col.OrderedDict):
                     "Inserted item needs to be a StructuredNestedDict "
                     "with level={}".format(self.levels - 1))
 
-        super(self.__class__, self).__setitem__(key, value)
+            old_value = dict.get(self, key)
+            super(self.__class__, self).__setitem__(key, value)
+            if old_value is not None:
+                old_value._parent = None
+            value._parent = weakref.ref(self)
+            value._parent_key = key
+        elif key in self:
+            # Replacing a value leaves dimensions and keys unchanged
+            super(self.__class__, self).__setitem__(key, value)
+            return
+        else:
+            old_value = None
+            super(self.__class__, self).__setitem__(key, value)
+        if self._dim is not None:
+            self._invalidate_dim()
+        if _INDEXED_SNDICTS:
+            self._index_set(key, old_value, value)
+
+    def __delitem__(self, key):
+        old_value = col.OrderedDict.__getitem__(self, key)
+        super(self.__class__, self).__delitem__(key)
+        if self.levels > 1:
+            old_value._parent = None
+        if self._dim is not None:
+            self._invalidate_dim()
+        if not _INDEXED_SNDICTS:
+            return
+        for ancestor, path in self._iter_indexed_ancestors():
+            ancestor._key_index.remove(path, key, old_value, self._levels - 1)
+
+    def pop(self, key, *args):
+        if key in self:
+            value = col.OrderedDict.__getitem__(self, key)
+            del self[key]
+            return value
+        elif args:
+            return args[0]
+        raise KeyError(key)
+
+    def popitem(self, last=True):
+        if not self:
+            raise KeyError("dictionary is empty")
+        key = next(reversed(self)) if last else next(iter(self))
+        return key, self.pop(key)
+
+    def clear(self):
+        if _INDEXED_SNDICTS:
+            for ancestor, path in self._iter_indexed_ancestors():
+                for key, value in six.iteritems(self):
+                    ancestor._key_index.remove(
+                        path, key, value, self._levels - 1)
+        if self.levels > 1:
+            for value in six.itervalues(self):
+                value._parent = None
+        super(self.__class__, self).clear()
+        if self._dim is not None:
+            self._invalidate_dim()
+
+    def __reduce__(self):
+        # Serialize the whole tree at once, as level metadata, the keys of
+        # each level in BFS order, the number of keys of each nested
+        # dictionary and the values. Parent references and the key index are
+        # rebuilt on unpickling
+        level_keys = [list(self.keys())]
+        child_sizes = []
+        nodes = list(self.values())
+        for _ in range(1, self._levels):
+            keys = []
+            sizes = []
+            children = []
+            for node in nodes:
+                sizes.append(len(node))
+                for key, val in six.iteritems(node):
+                    keys.append(key)
+                    children.append(val)
+            level_keys.append(keys)
+            child_sizes.append(sizes)
+            nodes = children
+        return _rebuild_sndict, (
+            self.__class__, self._levels,
+            self._level_names if self._level_names_is_set else None,
+            self._key_index is not None,
+            level_keys, child_sizes, nodes,
+        )
+
+    def __setstate__(self, state):
+        # Only used for pickles written before the compact format
+        has_key_index = state.pop("_key_index", False)
+        vars(self).update(state)
+        self._dim = None
+        self._parent = None
+        self._parent_key = None
+        if self.levels > 1:
+            parent_ref = weakref.ref(self)
+            for key, value in list(six.iteritems(self)):
+                if value._has_parent():
+                    # Shared with another nested dictionary
+                    value = value._copy()
+                    col.OrderedDict.__setitem__(self, key, value)
+                value._parent = parent_ref
+                value._parent_key = key
+        self._key_index = None
+        if has_key_index:
+            self.build_index()
+
+    def _index_set(self, key, old_value, value):
+        """Update key indices of self and ancestors, after value has been set
+        under key, replacing old_value (None if key is new)"""
+        for ancestor, path in self._iter_indexed_ancestors():
+            if old_value is not None:
+                ancestor._key_index.remove(
+                    path, key, old_value, self._levels - 1)
+            ancestor._key_index.add(path, key, value, self._levels - 1)
+
+    def _invalidate_dim(self):
+        """Reset cached dimensions of self and of all containing dictionaries.
+        Dimensions are only cached once those of all nested dictionaries are,
+        so the walk stops at the first dictionary without cached dimensions"""
+        node = self
+        while node is not None and node._dim is not None:
+            node._dim = None
+            node = node._get_parent()
+
+    def _get_parent(self):
+        """Get the StructuredNestedDict containing this one, if any"""
+        return self._parent() if self._parent is not None else None
+
+    def _has_parent(self):
+        """Check if this StructuredNestedDict is contained in another"""
+        return self._get_parent() is not None
+
+    def _iter_indexed_ancestors(self):
+        """Iterate over (ancestor, path) for this StructuredNestedDict and all
+        of its ancestors that have a key index, where path is the key-tuple
+        leading from the ancestor to this StructuredNestedDict"""
+        node, path = self, ()
+        while node is not None:
+            if node._key_index is not None:
+                yield node, path
+            path = (node._parent_key,) + path
+            node = node._get_parent()
 
     def to_tree_string(self, indent=" - ",
                        key_mode="str",
@@ -1087,7 +2114,7 @@ class StructuredNestedDict(col.OrderedDict):
         -------
         class
         """
-        return col.namedtuple("KeyTuple", self.level_names[:levels])
+        return get_key_tuple_class(self.level_names[:levels])
 
     @staticmethod
     def _resolve_dict_type(dict_type):
@@ -1122,11 +2149,76 @@ class StructuredNestedDict(col.OrderedDict):
         if len(key_list) == 0:
             raise KeyError("key_list cannot be empty")
 
+    def _is_child(self, value):
+        """Check if value is a StructuredNestedDict with the metadata expected
+        of a child"""
+        return isinstance(value, StructuredNestedDict) \
+            and value.levels == self.levels - 1 \
+            and value._level_names_is_set == self._level_names_is_set \
+            and (not self._level_names_is_set or
+                 value.level_names == self.level_names[1:])
+
+    def _copy(self):
+        """Copy nested dictionaries, sharing values"""
+        return self.from_trusted(
+            six.iteritems(self), levels=self.levels,
+            level_names=self._level_names if self._level_names_is_set
+            else None,
+        )
+
+    def _new_child(self):
+        """Create an empty StructuredNestedDict with the metadata of a child"""
+        return self.__class__(
+            levels=self.levels - 1,
+            level_names=self.level_names[1:]
+            if self._level_names_is_set else None,
+        )
+
+    def _add_child(self, key):
+        """Add an empty child under a new key, without the validation and
+        copying done by __setitem__, and return it"""
+        child = self._new_child()
+        col.OrderedDict.__setitem__(self, key, child)
+        child._parent = weakref.ref(self)
+        child._parent_key = key
+        if self._dim is not None:
+            self._invalidate_dim()
+        if _INDEXED_SNDICTS:
+            self._index_set(key, None, child)
+        return child
+
+    def _resolve_level(self, level):
+        """Resolve a level int or level name to a level int"""
+        if isinstance(level, int):
+            return self._wrap_level(level)
+        return self.level_names.index(level)
+
     def _wrap_level(self, level):
         """Wrap a level argument"""
         return _wrap_level(level, allowed_level=self.levels)
 
 
+def get_key_tuple_class(level_names):
+    """Get namedtuple class for key-tuples with given level names. Classes are
+    cached, so repeated calls with the same level names are cheap
+
+    Parameters
+    ----------
+    level_names: list
+        Field names of the namedtuple
+
+    Returns
+    -------
+    class
+    """
+    level_names = tuple(level_names)
+    key_tup_class = _KEY_TUPLE_CLASSES.get(level_names)
+    if key_tup_class is None:
+        key_tup_class = col.namedtuple("KeyTuple", level_names)
+        _KEY_TUPLE_CLASSES[level_names] = key_tup_class
+    return key_tup_class
+
+
 def _wrap_level(level, allowed_level):
     """Wrap levels given a maximum allowed level"""
     if level < 0:
@@ -1142,6 +2234,91 @@ def _wrap_level(level, allowed_level):
     return wrapped_level
 
 
+def _rebuild_sndict(cls, levels, level_names, has_key_index,
+                    level_keys, child_sizes, values):
+    """Rebuild StructuredNestedDict from the output of
+    StructuredNestedDict.__reduce__, bottom-up, one level at a time
+
+    Every nested dictionary is new, so instead of going through __init__ and
+    from_trusted, each copies the attributes of a template with the
+    metadata of its level"""
+    odict_setitem = col.OrderedDict.__setitem__
+    nodes = values
+    for depth in range(levels - 1, -1, -1):
+        template_vars = vars(cls(
+            levels=levels - depth,
+            level_names=level_names[depth:] if level_names is not None
+            else None,
+        ))
+        keys = level_keys[depth]
+        sizes = child_sizes[depth - 1] if depth > 0 else [len(keys)]
+        new_nodes = []
+        start = 0
+        for size in sizes:
+            stop = start + size
+            node = cls.__new__(cls)
+            col.OrderedDict.__init__(node)
+            vars(node).update(template_vars)
+            for key, val in zip(keys[start:stop], nodes[start:stop]):
+                odict_setitem(node, key, val)
+            if depth < levels - 1:
+                parent_ref = weakref.ref(node)
+                for key, val in zip(keys[start:stop], nodes[start:stop]):
+                    val._parent = parent_ref
+                    val._parent_key = key
+            new_nodes.append(node)
+            start = stop
+        nodes = new_nodes
+    new_dict = nodes[0]
+    if has_key_index:
+        new_dict.build_index()
+    return new_dict
+
+
+def _get_field_getter(field):
+    """Function to get field from record, unless field is already a
+    function"""
+    if callable(field):
+        return field
+    return operator.itemgetter(field)
+
+
+def _apply_elementwise(op, left, right):
+    """Apply binary operator elementwise, where either left or right may be a
+    scalar instead of a list. Float and complex values are batched through
+    numpy, if available. Other values, such as ints (which numpy would wrap
+    around) and bools, always use the Python operators"""
+    if _is_float_values(left) and _is_float_values(right):
+        try:
+            numpy = import_numpy()
+        except ImportError:
+            numpy = None
+        if numpy is not None:
+            # Errors fall back to Python, e.g. to raise ZeroDivisionError
+            try:
+                with numpy.errstate(all="raise"):
+                    return op(numpy.asarray(left),
+                              numpy.asarray(right)).tolist()
+            except (ArithmeticError, TypeError, ValueError):
+                pass
+
+    if not isinstance(left, list):
+        return [op(left, right_val) for right_val in right]
+    elif not isinstance(right, list):
+        return [op(left_val, right) for left_val in left]
+    return [op(left_val, right_val)
+            for left_val, right_val in zip(left, right)]
+
+
+def _is_float_values(values):
+    """Check if a value, or list of values, only contains floats or complex
+    numbers"""
+    value_types = set(map(type, values)) if isinstance(values, list) \
+        else {type(values)}
+    return all(issubclass(value_type, (float, complex))
+               for value_type in value_types)
+
+
 def _is_criteria(key_or_criteria):
     """Check if argument is a key or filter-criteria"""
     if key_or_criteria == slice(None):
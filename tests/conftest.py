@@ -0,0 +1,27 @@
+import pytest
+import sys
+
+from sndict.compat import import_futures
+
+# async def is a SyntaxError before Python 3.5, so these cannot be collected
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append("test_asyncmap.py")
+
+
+@pytest.fixture
+def real_futures():
+    """concurrent.futures, skipping tests if it is not available"""
+    try:
+        return import_futures()
+    except ImportError:
+        pytest.skip("concurrent.futures is not available")
+
+
+@pytest.fixture
+def futures(real_futures, monkeypatch):
+    """concurrent.futures, with worker processes replaced by threads, so that
+    workers= options are tested without spawning processes"""
+    monkeypatch.setattr(real_futures, "ProcessPoolExecutor",
+                        real_futures.ThreadPoolExecutor)
+    return real_futures
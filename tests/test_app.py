@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import pytest
+
+from sndict import app
+from sndict.nesteddict import NestedDict
+from sndict.utils import list_equal
+
+
+@pytest.fixture
+def base_path(tmpdir):
+    for rel_path, content in [
+        ("b.txt", "bb"),
+        ("a.py", "a"),
+        ("sub/c.py", "ccc"),
+        ("sub/deeper/d.txt", "dddd"),
+        (".git/config", "x"),
+    ]:
+        path = tmpdir.join(*rel_path.split("/"))
+        path.dirpath().ensure(dir=True)
+        path.write(content)
+    tmpdir.join("empty").ensure(dir=True)
+    return str(tmpdir)
+
+
+@pytest.mark.parametrize("workers", [None, 4])
+def test_directory_tree(base_path, workers):
+    tree = app.directory_tree(base_path, workers=workers)
+    assert list_equal(tree.keys(), [".git", "a.py", "b.txt", "sub"])
+    assert list_equal(tree.flatten_keys(), [
+        (".git", "config"), ("a.py",), ("b.txt",),
+        ("sub", "c.py"), ("sub", "deeper", "d.txt"),
+    ])
+    assert tree["sub"]["deeper"]["d.txt"] == os.path.join(
+        base_path, "sub", "deeper", "d.txt")
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_directory_tree_options(base_path, workers):
+    tree = app.directory_tree(base_path, workers=workers, stat=True,
+                              max_depth=2, exclude=[".git"])
+    assert list_equal(tree.flatten_keys(),
+                      [("a.py",), ("b.txt",), ("sub", "c.py")])
+    info = tree["sub"]["c.py"]
+    assert info.size == 3
+    assert info.mtime == os.stat(info.path).st_mtime
+
+    tree = app.directory_tree(base_path, workers=workers, include=["*.py"],
+                              exclude=["sub/deeper"])
+    assert list_equal(tree.flatten_keys(), [("a.py",), ("sub", "c.py")])
+
+
+def _bump_mtime(path):
+    # Some filesystems have coarse mtimes, so make changes visible explicitly
+    mtime = os.stat(path).st_mtime + 10
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_directory_tree_snapshot(base_path, workers):
+    snapshot = app.DirectoryTreeSnapshot(base_path, workers=workers)
+    assert snapshot.tree == app.directory_tree(base_path)
+    assert snapshot.refresh() == app.DirectoryTreeDiff(added=[], removed=[])
+
+    os.remove(os.path.join(base_path, "sub", "deeper", "d.txt"))
+    _bump_mtime(os.path.join(base_path, "sub", "deeper"))
+    os.makedirs(os.path.join(base_path, "empty", "new"))
+    with open(os.path.join(base_path, "empty", "new", "e.txt"), "w") as f:
+        f.write("e")
+    with open(os.path.join(base_path, "0.txt"), "w") as f:
+        f.write("0")
+    _bump_mtime(os.path.join(base_path, "empty"))
+    _bump_mtime(base_path)
+
+    diff = snapshot.refresh()
+    assert diff.added == [os.path.join(base_path, "0.txt"),
+                          os.path.join(base_path, "empty", "new", "e.txt")]
+    assert diff.removed == [os.path.join(base_path, "sub", "deeper", "d.txt")]
+    assert snapshot.tree == app.directory_tree(base_path)
+    assert list_equal(snapshot.tree.keys(),
+                      [".git", "0.txt", "a.py", "b.txt", "empty", "sub"])
+
+    shutil.rmtree(os.path.join(base_path, "sub"))
+    _bump_mtime(base_path)
+    diff = snapshot.refresh()
+    assert diff.removed == [os.path.join(base_path, "sub", "c.py")]
+    assert snapshot.tree == app.directory_tree(base_path)
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_directory_rollup(base_path, workers):
+    for stat in [False, True]:
+        tree = app.directory_tree(base_path, stat=stat)
+        rollup = app.directory_rollup(tree, workers=workers)
+        assert list_equal(rollup.keys(), [
+            (), (".git",), ("sub",), ("sub", "deeper"),
+        ])
+        assert rollup[()].size == 11
+        assert rollup[()].count == 5
+        assert rollup[("sub",)][:2] == (7, 2)
+        assert rollup[("sub", "deeper")].mtime == os.stat(
+            os.path.join(base_path, "sub", "deeper", "d.txt")).st_mtime
+        assert rollup[()].mtime == max(
+            stats.mtime for stats in rollup.values())
+
+    largest = app.largest_directories(rollup, n=2, max_depth=1)
+    assert list_equal([rel_path for rel_path, _ in largest], [(), ("sub",)])
+    assert app.largest_directories(rollup, n=1, by="count")[0][0] == ()
+
+
+@pytest.mark.parametrize("workers", [None, 4])
+def test_find_duplicates(base_path, workers):
+    for rel_path, content in [
+        ("copy.txt", "bb"),
+        ("other.txt", "xy"),
+        ("sub/long_1.txt", "abcdef"),
+        ("sub/long_2.txt", "abcdef"),
+        ("sub/long_3.txt", "abcxyz"),
+    ]:
+        with open(os.path.join(base_path, *rel_path.split("/")), "w") as f:
+            f.write(content)
+    bb_digest = hashlib.sha256(b"bb").hexdigest()
+    abcdef_digest = hashlib.sha256(b"abcdef").hexdigest()
+
+    for stat in [False, True]:
+        tree = app.directory_tree(base_path, stat=stat)
+        for prefix_size in [None, 2, 3, 100]:
+            duplicates = app.find_duplicates(
+                tree, workers=workers, prefix_size=prefix_size,
+                chunk_size=4,
+            )
+            assert list_equal(duplicates.level_names, ["digest", "path"])
+            assert list_equal(
+                duplicates.keys(), sorted([bb_digest, abcdef_digest]))
+            assert list_equal(duplicates[bb_digest].keys(), [
+                os.path.join(base_path, "b.txt"),
+                os.path.join(base_path, "copy.txt"),
+            ])
+            assert list_equal(duplicates[abcdef_digest].values(), [6, 6])
+
+    tree = app.directory_tree(os.path.join(base_path, "sub", "deeper"))
+    assert len(app.find_duplicates(tree, algorithm="md5")) == 0
+
+
+def test_lazy_directory_tree(base_path):
+    tree = app.lazy_directory_tree(base_path, exclude=[".git"])
+    assert not tree.is_listed
+    assert "unlisted" in repr(tree)
+
+    sub = tree["sub"]
+    assert tree.is_listed
+    assert not sub.is_listed
+    assert list_equal(tree.keys(), ["a.py", "b.txt", "empty", "sub"])
+    assert tree.nested_get(["sub", "c.py"]) == os.path.join(
+        base_path, "sub", "c.py")
+    assert sub.is_listed
+    assert not sub["deeper"].is_listed
+    assert tree.ix["sub", "deeper", "d.txt"].endswith("d.txt")
+    assert len(tree["empty"]) == 0
+    assert list_equal(tree.flatten_keys(), [
+        ("a.py",), ("b.txt",), ("sub", "c.py"), ("sub", "deeper", "d.txt"),
+    ])
+
+    # Cached until invalidated
+    with open(os.path.join(base_path, "sub", "e.txt"), "w") as f:
+        f.write("e")
+    assert "e.txt" not in tree["sub"]
+    deeper = tree.ix["sub", "deeper"]
+    tree.invalidate()
+    assert "e.txt" in tree["sub"]
+    assert tree.ix["sub", "deeper"] is deeper
+
+    tree = app.lazy_directory_tree(base_path, stat=True, ttl=0)
+    assert tree["b.txt"].size == 2
+    with open(os.path.join(base_path, "f.txt"), "w") as f:
+        f.write("f")
+    assert "f.txt" in tree
+
+    loaded = pickle.loads(pickle.dumps(tree))
+    assert not loaded.is_listed
+    assert list_equal(loaded.keys(), tree.keys())
+
+
+def test_lazy_directory_tree_derived(base_path):
+    eager = app.directory_tree(base_path)
+    # directory_tree drops empty directories
+    tree = app.lazy_directory_tree(base_path, exclude=["empty"])
+    assert tree == eager
+    assert not tree != eager
+    assert eager == app.lazy_directory_tree(base_path, exclude=["empty"])
+    assert app.lazy_directory_tree(base_path, exclude=["empty"]) == tree
+    assert tree != app.lazy_directory_tree(os.path.join(base_path, "sub"))
+    assert json.loads(json.dumps(tree.convert("dict"))) \
+        == eager.convert("dict")
+
+    tree = app.lazy_directory_tree(base_path)
+    for derived in [tree.map_values(len), tree.filter_values(lambda x: True),
+                    tree.copy()]:
+        assert type(derived) is NestedDict
+    assert tree.map_values(len).nested_get(["sub", "c.py"]) \
+        == len(os.path.join(base_path, "sub", "c.py"))
+    assert tree.filter_values(lambda x: x.endswith(".py")).flatten_keys() \
+        == [("a.py",), ("sub", "c.py")]
+
+    tree = app.lazy_directory_tree(base_path)
+    for write in [
+        lambda: tree.__setitem__("new.txt", "new"),
+        lambda: tree.nested_set(["sub", "new.txt"], "new"),
+        lambda: tree.update({"new.txt": "new"}),
+        lambda: tree.setdefault("new.txt", "new"),
+        lambda: tree.pop("a.py"),
+        lambda: tree.clear(),
+    ]:
+        with pytest.raises(TypeError):
+            write()
+    with pytest.raises(TypeError):
+        del tree["a.py"]
+    assert "a.py" in tree
+    assert "new.txt" not in tree["sub"]
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+
+from sndict.nesteddict import NestedDict
+from sndict.structurednesteddict import StructuredNestedDict
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def test_nesteddict_async_map_values(loop):
+    ndict = NestedDict([
+        ("a", NestedDict([("x", 1), ("y", 2)])),
+        ("b", 3),
+    ])
+
+    async def increment(x):
+        await asyncio.sleep(0)
+        return x + 1
+
+    incremented = loop.run_until_complete(
+        ndict.async_map_values(increment, concurrency=2))
+    assert incremented == ndict.map_values(lambda x: x + 1)
+
+
+def test_sndict_async_map_values(loop):
+    sales = StructuredNestedDict({
+        "north": {"mon": 3, "tue": 1},
+        "south": {"mon": 2},
+    }, level_names=["region", "day"])
+    running = []
+    max_running = []
+    completed = []
+
+    async def slow_double(x):
+        running.append(x)
+        max_running.append(len(running))
+        await asyncio.sleep(0.001 * x)
+        running.remove(x)
+        return x * 2
+
+    doubled = loop.run_until_complete(sales.async_map_values(
+        slow_double, concurrency=2,
+        callback=lambda key, val: completed.append((key, val)),
+    ))
+    assert doubled == sales.map_values(lambda x: x * 2)
+    assert doubled.level_names == ("region", "day")
+    assert max(max_running) == 2
+    # Completion order differs from key order
+    assert completed[0] == (("north", "tue"), 2)
+    assert len(completed) == 3
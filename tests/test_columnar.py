@@ -0,0 +1,146 @@
+import collections as col
+import pytest
+
+from sndict.columnar import ColumnarStructuredNestedDict
+from sndict.structurednesteddict import StructuredNestedDict, LevelError
+from sndict.utils import list_equal
+
+from tests.test_structurednesteddict import dict_a, dict_c
+
+
+def test_dim():
+    csndict_a = ColumnarStructuredNestedDict(dict_a, levels=3)
+    # Empty nested dictionaries are dropped
+    assert csndict_a.dim == (2, 3, 5)
+    assert ColumnarStructuredNestedDict(dict_c, levels=3).dim == (2, 3, 9)
+    assert ColumnarStructuredNestedDict(dict_a, levels=2).dim == (2, 3)
+
+
+def test_from_flat():
+    csndict = ColumnarStructuredNestedDict.from_flat([
+        (("b", 1), "b1"),
+        (("a", 1), "a1"),
+        (("b", 2), "b2"),
+        (("a", 1), "a1_new"),
+    ], level_names=["x", "y"])
+    assert list_equal(csndict.keys(), ["b", "a"])
+    assert list_equal(
+        csndict.flatten_keys(named=False),
+        [("b", 1), ("b", 2), ("a", 1)],
+    )
+    assert list_equal(csndict.flatten_values(), ["b1", "b2", "a1_new"])
+
+
+def test_iterflatten():
+    named_sndict_a = StructuredNestedDict(
+        dict_a, levels=3, level_names=["a", "b", "c"])
+    csndict_a = named_sndict_a.to_columnar()
+    assert list_equal(
+        csndict_a.flatten_keys(),
+        named_sndict_a.flatten_keys(),
+    )
+    assert csndict_a.flatten_keys()[0].c == "key1_1_1"
+    assert list_equal(
+        csndict_a.flatten_keys(1, named=False),
+        [('key1', 'key1_1'), ('key2', 'key2_1'), ('key2', 'key2_2')],
+    )
+    assert list_equal(
+        [view.dim for view in csndict_a.flatten_values(1)],
+        [(2,), (2,), (1,)],
+    )
+
+
+def test_flatten_and_stratify():
+    csndict_a = StructuredNestedDict(
+        dict_a, levels=3, level_names=["a", "b", "c"]).to_columnar()
+    flattened = csndict_a.flatten(1)
+    assert flattened.level_names == ("a___b", "c")
+    assert flattened.dim == (3, 5)
+    stratified = flattened.stratify(1)
+    assert stratified.level_names == ("a", "b", "c")
+    assert stratified.dim == csndict_a.dim
+    assert list_equal(
+        stratified.flatten_values(), csndict_a.flatten_values())
+    with pytest.raises(LevelError):
+        csndict_a.flatten(3)
+
+
+def test_unique_keys():
+    csndict_c = ColumnarStructuredNestedDict(dict_c, levels=3)
+    assert list_equal(
+        map(tuple, csndict_c.unique_keys()),
+        [('key1', 'key2'),
+         ('keyX_1', 'keyX_2'),
+         ('keyX_X_1', 'keyX_X_2', 'keyX_X_3', 'keyX_X_4', 'keyX_X_5')],
+    )
+
+
+def test_filter_key():
+    csndict_c = ColumnarStructuredNestedDict(dict_c, levels=3)
+    assert list_equal(
+        csndict_c.filter_key({"level1": "keyX_1"}).flatten_values(),
+        ['val1_1_1', 'val1_1_2', 'val2_1_1', 'val2_1_2'],
+    )
+    assert list_equal(
+        csndict_c.filter_key([["key2"], slice(None), lambda _: _ > "keyX_X_3"])
+            .flatten_values(),
+        ['val2_2_4', 'val2_2_5'],
+    )
+    assert list_equal(
+        csndict_c.filter_values(lambda _: _.endswith("1")).flatten_values(),
+        ['val1_1_1', 'val2_1_1', 'val2_2_1'],
+    )
+
+
+def test_getters():
+    csndict_c = ColumnarStructuredNestedDict(dict_c, levels=3)
+    assert csndict_c.ix["key2", "keyX_2", "keyX_X_3"] == "val2_2_3"
+    assert csndict_c["key2"]["keyX_2"].dim == (5,)
+    assert "key1" in csndict_c
+    assert not csndict_c.has_nested_key(["key1", "keyX_2"])
+    assert list_equal(
+        csndict_c.ix[:, "keyX_1", "keyX_X_2"],
+        ["val1_1_2", "val2_1_2"],
+    )
+    with pytest.raises(TypeError):
+        csndict_c.ix["key1", "keyX_1", "keyX_X_1"] = "NEW"
+
+
+def test_group_index():
+    sndict_c = StructuredNestedDict(dict_c, levels=3)
+    for csndict_c in [
+        sndict_c.to_columnar(),
+        ColumnarStructuredNestedDict.from_flat(
+            reversed(sndict_c.flatten(named=False).items()), levels=3),
+        sndict_c.to_columnar().filter_values(lambda _: True),
+    ]:
+        # Same keys under different parents resolve to their own rows
+        for key_tup, val in sndict_c.iterflatten(named=False):
+            assert csndict_c.nested_get(key_tup) == val
+            assert csndict_c[key_tup[0]][key_tup[1]][key_tup[2]] == val
+        for key in ["key1", "key2"]:
+            view = csndict_c[key]
+            assert list_equal(sorted(view.keys()),
+                              sorted(sndict_c[key].keys()))
+            assert len(view) == len(sndict_c[key])
+            assert view.dim == sndict_c[key].dim
+            for sub_key, sub_view in view.items():
+                assert sub_view.dim == sndict_c[key][sub_key].dim
+        assert not csndict_c.has_nested_key(["key1", "keyX_2"])
+        assert not csndict_c.has_nested_key(["key3"])
+
+    csndict_c = sndict_c.to_columnar()
+    seen = []
+    filtered = csndict_c["key1"].filter_key(
+        [lambda key: seen.append(key) or True])
+    assert list_equal(seen, ["keyX_1"])
+    assert filtered.dim == (1, 2)
+    assert len(csndict_c.filter_key([["key2"]])["key2"]) == 2
+
+
+def test_to_sndict():
+    sndict_c = StructuredNestedDict(dict_c, levels=3)
+    round_tripped = sndict_c.to_columnar().to_sndict()
+    assert isinstance(round_tripped, StructuredNestedDict)
+    assert list_equal(round_tripped.flatten(), sndict_c.flatten())
+    assert round_tripped.dim == (2, 3, 9)
@@ -0,0 +1,105 @@
+import pickle
+import pytest
+
+import sndict
+from sndict.structurednesteddict import StructuredNestedDict
+from sndict.utils import list_equal
+
+from tests.test_structurednesteddict import dict_a, dict_c
+
+
+@pytest.fixture
+def frozen_c(tmpdir):
+    path = str(tmpdir.join("c.sndict"))
+    StructuredNestedDict(dict_c, level_names=["x", "y", "z"]).freeze(path)
+    frozen = sndict.open_frozen(path)
+    yield frozen
+    frozen.close()
+
+
+def test_dim(frozen_c):
+    # Empty nested dictionaries are kept
+    assert frozen_c.dim == (3, 3, 9)
+    assert frozen_c["key2"].dim == (2, 7)
+    assert frozen_c.levels == 3
+    assert frozen_c["key2"].level_names == ("y", "z")
+    assert len(frozen_c["key3"]) == 0
+
+
+def test_iterflatten(frozen_c):
+    sndict_c = StructuredNestedDict(dict_c, levels=3)
+    assert list_equal(frozen_c.keys(), sndict_c.keys())
+    assert list_equal(frozen_c.iterflatten(named=False),
+                      sndict_c.iterflatten(named=False))
+    assert list_equal(frozen_c.iterflatten_keys(levels=1, named=False),
+                      sndict_c.iterflatten_keys(levels=1, named=False))
+    assert list(frozen_c.iterflatten())[0][0]._fields == ("x", "y", "z")
+    assert frozen_c.to_sndict() == sndict_c
+    assert list_equal(frozen_c.unique_keys(), sndict_c.unique_keys())
+    assert list_equal(frozen_c["key2"].unique_keys(),
+                      sndict_c["key2"].unique_keys())
+
+
+def test_items(frozen_c):
+    sndict_c = StructuredNestedDict(dict_c, levels=3)
+    assert list_equal(
+        [(key, val.dim) for key, val in frozen_c.items()],
+        [(key, val.dim) for key, val in sndict_c.items()],
+    )
+    assert list_equal(frozen_c["key1"]["keyX_1"].items(),
+                      sndict_c["key1"]["keyX_1"].items())
+    assert list_equal(frozen_c.values()[1].keys(), ["keyX_1", "keyX_2"])
+
+
+def test_getters(frozen_c):
+    assert frozen_c.nested_get(["key2", "keyX_2", "keyX_X_4"]) == "val2_2_4"
+    assert frozen_c["key1"]["keyX_1"]["keyX_X_2"] == "val1_1_2"
+    assert frozen_c.ix["key2", "keyX_1", "keyX_X_1"] == "val2_1_1"
+    assert list_equal(frozen_c.ix[:, "keyX_1", ["keyX_X_2"]],
+                      ["val1_1_2", "val2_1_2"])
+    assert "key3" in frozen_c and "key4" not in frozen_c and 1 not in frozen_c
+    assert not frozen_c.has_nested_key(["key1", "keyX_2"])
+    with pytest.raises(KeyError):
+        frozen_c.nested_get(["key1", "keyX_2"])
+    with pytest.raises(TypeError):
+        frozen_c.ix["key1", "keyX_1", "keyX_X_1"] = "new"
+
+
+def test_pickle(frozen_c):
+    # The mapping of a file that is open is reused
+    view = pickle.loads(pickle.dumps(frozen_c["key2"]))
+    assert view._file is frozen_c._file
+    assert list_equal(view.iterflatten(named=False),
+                      frozen_c["key2"].iterflatten(named=False))
+
+    pickled = pickle.dumps(frozen_c["key1"])
+    frozen_c.close()
+    with pickle.loads(pickled) as view:
+        assert view._file is not frozen_c._file
+        assert list_equal(view.keys(), ["keyX_1"])
+    assert view._file.closed
+
+
+def test_context_manager(tmpdir):
+    path = str(tmpdir.join("a.sndict"))
+    StructuredNestedDict(dict_a, levels=3).freeze(path)
+    with sndict.open_frozen(path) as frozen_a:
+        assert frozen_a.dim == (3, 3, 5)
+    assert frozen_a._file.closed
+    frozen_a.close()
+
+
+def test_mapped_int_array(frozen_c):
+    codes = frozen_c._file.codes[2]
+    assert list_equal(codes[:], [codes[i] for i in range(len(codes))])
+    assert list_equal(codes[2:5], [codes[2], codes[3], codes[4]])
+    assert list_equal(codes[5:2], [])
+    assert list_equal(codes[::3], [codes[0], codes[3], codes[6]])
+    assert list_equal(codes[-2:], [codes[7], codes[8]])
+
+
+def test_unsortable_keys(tmpdir):
+    path = str(tmpdir.join("a.sndict"))
+    StructuredNestedDict(dict_a, levels=2).freeze(path)
+    with pytest.raises(TypeError):
+        StructuredNestedDict({1: 1, "a": 2}).freeze(path)
@@ -1,4 +1,7 @@
 import collections as col
+import copy
+import pickle
+import pytest
 
 from sndict.nesteddict import NestedDict
 from sndict.utils import list_equal
@@ -138,3 +141,79 @@ def test_to_tree_string():
        "key1: 'val1'\nkey2:\n'-key2_1: 'val2_1'\n'-key2_2: " \
        "'val2_2'\nkey3:\n'-key3_1:\n  '-key3_1_1: 'val3_1_1'\n  " \
        "'-key3_1_2: 'val3_1_2'\n'-key3_2:\n  '-key3_2_1: 'val3_2_1'\n"
+
+
+def test_flatten_deep():
+    deep_ndict = NestedDict()
+    for i in range(3):
+        deep_ndict.nested_set(("a",) * 10 + (i,), i)
+    deep_ndict["b"] = "val_b"
+    assert list_equal(
+        deep_ndict.flatten(),
+        [(("a",) * 10 + (0,), 0),
+         (("a",) * 10 + (1,), 1),
+         (("a",) * 10 + (2,), 2),
+         (("b",), "val_b")],
+    )
+    assert list_equal(
+        deep_ndict.flatten_keys(max_depth=3),
+        [("a", "a", "a"), ("b",)],
+    )
+
+
+def test_from_flat_iterable():
+    unsorted_data = [
+        (("key_a", "key_a_b", "key_a_b_a"), 1),
+        (("key_b",), 2),
+        (("key_a", "key_a_a"), 3),
+        (("key_a", "key_a_b", "key_a_b_b"), 4),
+    ]
+    ndict = NestedDict.from_flat(iter(unsorted_data))
+    assert list_equal(ndict.flatten(), [
+        (("key_a", "key_a_b", "key_a_b_a"), 1),
+        (("key_a", "key_a_b", "key_a_b_b"), 4),
+        (("key_a", "key_a_a"), 3),
+        (("key_b",), 2),
+    ])
+    assert list_equal(
+        NestedDict.from_flat(sorted(unsorted_data)).flatten(),
+        sorted(unsorted_data),
+    )
+    assert isinstance(
+        NestedDict.from_flat(dict_data_b, dict_type="dict")["key_a"], dict)
+    with pytest.raises(TypeError):
+        NestedDict.from_flat(1)
+
+
+def test_pickle():
+    ndict = NestedDict([
+        ("a", NestedDict([("x", 1), ("y", NestedDict())])),
+        ("b", {"plain": [1, 2]}),
+        ("c", 3),
+    ])
+    loaded = pickle.loads(pickle.dumps(ndict))
+    assert loaded == ndict
+    assert list_equal(loaded.keys(), ["a", "b", "c"])
+    assert isinstance(loaded["a"]["y"], NestedDict)
+    assert type(loaded["b"]) is dict
+    assert copy.deepcopy(ndict) == ndict
+
+
+def _increment(x):
+    return x + 1
+
+
+def test_parallel_map_and_filter(futures):
+    ndict = NestedDict([
+        ("a", NestedDict([("x", 1), ("y", 2)])),
+        ("b", 3),
+    ])
+    with futures.ThreadPoolExecutor(max_workers=2) as executor:
+        assert ndict.map_values(_increment, executor=executor) \
+            == ndict.map_values(_increment)
+    assert ndict.map_values(_increment, workers=2) \
+        == ndict.map_values(_increment)
+    assert list_equal(
+        ndict.filter_values([1, 3], workers=2).flatten(),
+        [(("a", "x"), 1), (("b",), 3)],
+    )
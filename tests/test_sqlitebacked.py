@@ -0,0 +1,172 @@
+import collections as col
+import pytest
+import sqlite3
+
+from sndict.sqlitebacked import SQLiteStructuredNestedDict
+from sndict.structurednesteddict import StructuredNestedDict, LevelError
+from sndict.utils import list_equal
+
+from tests.test_structurednesteddict import dict_a, dict_c
+
+
+def test_dim():
+    sqlsndict_a = SQLiteStructuredNestedDict(data=dict_a, levels=3)
+    # Empty nested dictionaries are dropped
+    assert sqlsndict_a.dim == (2, 3, 5)
+    assert SQLiteStructuredNestedDict(data=dict_c, levels=3).dim == (2, 3, 9)
+    assert sqlsndict_a["key2"].dim == (2, 3)
+    assert len(sqlsndict_a) == 2
+
+
+def test_iterflatten():
+    sndict_c = StructuredNestedDict(dict_c, levels=3)
+    sqlsndict_c = SQLiteStructuredNestedDict(data=sndict_c)
+    assert list_equal(sqlsndict_c.iterflatten(named=False),
+                      sndict_c.iterflatten(named=False))
+    # Empty nested dictionaries are dropped
+    assert list_equal(sqlsndict_c.keys(), ["key1", "key2"])
+    assert list_equal(sqlsndict_c.iterflatten_keys(levels=1, named=False),
+                      sndict_c.iterflatten_keys(levels=1, named=False))
+    assert sqlsndict_c.to_sndict() == sndict_c.filter_key(
+        [slice(None)], drop_empty=True)
+
+
+def test_getters():
+    sqlsndict = SQLiteStructuredNestedDict(
+        data=dict_c, level_names=["x", "y", "z"])
+    assert sqlsndict.nested_get(["key1", "keyX_1", "keyX_X_2"]) == "val1_1_2"
+    assert sqlsndict["key2"]["keyX_2"]["keyX_X_3"] == "val2_2_3"
+    assert sqlsndict.ix["key2", "keyX_1", "keyX_X_1"] == "val2_1_1"
+    assert list_equal(sqlsndict["key2"].keys(), ["keyX_1", "keyX_2"])
+    assert list_equal(
+        [(key, val.dim) for key, val in sqlsndict["key2"].items()],
+        [("keyX_1", (2,)), ("keyX_2", (5,))],
+    )
+    assert list_equal(sqlsndict["key1"]["keyX_1"].items(),
+                      [("keyX_X_1", "val1_1_1"), ("keyX_X_2", "val1_1_2")])
+    assert sqlsndict["key2"].level_names == ("y", "z")
+    assert "key1" in sqlsndict and "key3" not in sqlsndict
+    assert sqlsndict.has_nested_key(["key2", "keyX_2"])
+    assert not sqlsndict.has_nested_key(["key1", "keyX_2"])
+    with pytest.raises(KeyError):
+        sqlsndict.nested_get(["key3"])
+
+    # Keys that cannot be stored are never found
+    assert ("key1", "keyX_1") not in sqlsndict
+    assert ["key1"] not in sqlsndict["key2"]
+    with pytest.raises(KeyError):
+        sqlsndict[("key1", "keyX_1")]
+    with pytest.raises(KeyError):
+        sqlsndict.nested_get(["key1", ("keyX_1",)])
+    assert not sqlsndict.has_nested_key(["key1", ["keyX_1"]])
+
+
+def test_filter_key():
+    sndict_c = StructuredNestedDict(dict_c, level_names=["x", "y", "z"])
+    sqlsndict_c = SQLiteStructuredNestedDict(data=sndict_c)
+    for criteria_ls in [
+        [["key2"], slice(None), ["keyX_X_1", "keyX_X_4"]],
+        [slice(None), lambda k: k != "keyX_1", slice(None)],
+        {"z": "keyX_X_2"},
+    ]:
+        expected = sndict_c.filter_key(dict(criteria_ls) if isinstance(
+            criteria_ls, dict) else criteria_ls, drop_empty=True)
+        filtered = sqlsndict_c.filter_key(criteria_ls)
+        assert list_equal(filtered.iterflatten(named=False),
+                          expected.iterflatten(named=False))
+        assert filtered.dim == expected.dim
+        assert list_equal(filtered.unique_keys(), expected.unique_keys())
+
+    assert list_equal(sqlsndict_c.ix[:, "keyX_1", ["keyX_X_1"]],
+                      ["val1_1_1", "val2_1_1"])
+    assert list_equal(
+        sqlsndict_c.filter_key(["key1", "keyX_1"], filter_out=True)
+        .iterflatten_keys(levels=1, named=False),
+        [("key2", "keyX_2")],
+    )
+
+
+def test_set_and_reopen(tmpdir):
+    path = str(tmpdir.join("store.sqlite"))
+    sqlsndict = SQLiteStructuredNestedDict(path, level_names=["x", "y"])
+    sqlsndict.nested_set(["a", 1], "first")
+    sqlsndict.ix["a", 2] = "second"
+    sqlsndict.nested_set(["a", 1], "updated")
+    sqlsndict.nested_set(["b"], {3: [1, 2]})
+    sqlsndict.close()
+
+    reopened = SQLiteStructuredNestedDict(path)
+    assert reopened.level_names == ("x", "y")
+    assert list_equal(reopened.iterflatten(named=False), [
+        (("a", 1), "updated"), (("a", 2), "second"), (("b", 3), [1, 2]),
+    ])
+    with pytest.raises(LevelError):
+        SQLiteStructuredNestedDict(path, levels=3)
+    with pytest.raises(TypeError):
+        reopened.nested_set([("tuple", "key"), 1], 0)
+    reopened.close()
+
+
+@pytest.mark.parametrize("sqlite_version_info", [None, (3, 8, 0)])
+def test_replace_keeps_order(monkeypatch, sqlite_version_info):
+    if sqlite_version_info is not None:
+        # Without UPSERT support
+        monkeypatch.setattr(sqlite3, "sqlite_version_info",
+                            sqlite_version_info)
+    sqlsndict = SQLiteStructuredNestedDict(
+        data=StructuredNestedDict(dict_c, levels=3))
+    flat = sqlsndict.to_sndict().flatten(named=False)
+    sqlsndict.update_flat({("key1", "keyX_1", "keyX_X_1"): "new"})
+    sqlsndict.nested_set(["key2", "keyX_1", "keyX_X_2"], "new")
+    flat[("key1", "keyX_1", "keyX_X_1")] = "new"
+    flat[("key2", "keyX_1", "keyX_X_2")] = "new"
+    assert list_equal(sqlsndict.iterflatten(named=False), flat.items())
+
+    # A failed subtree replacement leaves the subtree as it was
+    with pytest.raises(TypeError):
+        sqlsndict.nested_set(["key2"], {"keyX_3": {("bad", "key"): 0}})
+    assert list_equal(sqlsndict.iterflatten(named=False), flat.items())
+    sqlsndict.nested_set(["key2"], {"keyX_3": {"keyX_X_1": 0}})
+    assert list_equal(sqlsndict["key2"].flatten_values(), [0])
+    assert sqlsndict.dim == (2, 2, 3)
+
+    # Replaced subtrees keep their position
+    sqlsndict.nested_set(["key1"], col.OrderedDict([
+        ("keyX_2", {"keyX_X_1": 1}),
+        ("keyX_1", col.OrderedDict([("keyX_X_2", 2), ("keyX_X_1", 3)])),
+    ]))
+    assert list_equal(sqlsndict.keys(), ["key1", "key2"])
+    assert list_equal(sqlsndict.iterflatten_keys(named=False), [
+        ("key1", "keyX_2", "keyX_X_1"), ("key1", "keyX_1", "keyX_X_2"),
+        ("key1", "keyX_1", "keyX_X_1"), ("key2", "keyX_3", "keyX_X_1"),
+    ])
+    sqlsndict.close()
+
+
+def test_nested_order():
+    sqlsndict = SQLiteStructuredNestedDict(levels=3)
+    sndict = StructuredNestedDict(levels=3)
+    for key_tup in [("a", "x", 1), ("b", "y", 1), ("a", "z", 1),
+                    ("b", "x", 2), ("a", "x", 2)]:
+        sqlsndict.nested_set(list(key_tup), key_tup)
+        sndict.nested_set(list(key_tup), key_tup)
+
+    # Rows added under existing keys are grouped with them
+    assert list_equal(sqlsndict.iterflatten(named=False),
+                      sndict.iterflatten(named=False))
+    assert list_equal(sqlsndict.iterflatten_keys(levels=1, named=False),
+                      sndict.iterflatten_keys(levels=1, named=False))
+    assert list_equal(sqlsndict["a"].iterflatten(named=False),
+                      sndict["a"].iterflatten(named=False))
+    assert sqlsndict.to_sndict() == sndict
+    for criteria_ls in [
+        [slice(None), ["z", "y"]],
+        [slice(None), lambda k: k != "x"],
+        [slice(None), slice(None), 2],
+    ]:
+        filtered = sqlsndict.filter_key(criteria_ls)
+        expected = sndict.filter_key(criteria_ls, drop_empty=True)
+        assert list_equal(filtered.keys(), expected.keys())
+        assert list_equal(filtered.iterflatten(named=False),
+                          expected.iterflatten(named=False))
+    sqlsndict.close()
@@ -1,7 +1,11 @@
 import collections as col
+import copy
+import functools
+import pickle
 import pytest
 import six
 
+from sndict import structurednesteddict
 from sndict.structurednesteddict import StructuredNestedDict, LevelError
 from sndict.utils import list_equal, strip_spaces
 
@@ -80,6 +84,51 @@ def test_dim():
     assert StructuredNestedDict(dict_a, levels=3).dim == (3, 3, 5)
 
 
+def test_dim_cached():
+    named_sndict_a = StructuredNestedDict(
+        dict_a, levels=3, level_names=["a", "b", "c"])
+    assert named_sndict_a.dim_dict == {"a": 3, "b": 3, "c": 5}
+
+    named_sndict_a["key2"]["key2_2"]["key2_2_2"] = "val2_2_2"
+    assert named_sndict_a.dim == (3, 3, 6)
+    named_sndict_a["key2"].pop("key2_1")
+    assert named_sndict_a.dim == (3, 2, 4)
+    named_sndict_a["key1"].clear()
+    assert named_sndict_a.dim == (3, 1, 2)
+
+    # Inserted StructuredNestedDicts are copied
+    named_sndict_a["key3"] = named_sndict_a["key2"]
+    assert named_sndict_a.dim == (3, 2, 4)
+    named_sndict_a["key3"]["key2_3"] = {"key2_3_1": "val2_3_1"}
+    assert named_sndict_a.dim == (3, 3, 5)
+    assert list_equal(named_sndict_a["key2"].keys(), ["key2_2"])
+    del named_sndict_a["key3"]
+    named_sndict_a["key2"]["key2_3"] = {"key2_3_1": "val2_3_1"}
+    named_sndict_a["key2"]["key2_4"] = {"key2_4_1": "val2_4_1"}
+    assert named_sndict_a.dim == (2, 3, 4)
+
+    # Changes to nested dictionaries reach cached dimensions of all
+    # ancestors, until they are removed
+    sndict_a = StructuredNestedDict(dict_a, levels=3)
+    assert sndict_a.dim == (3, 3, 5)
+    nested = sndict_a["key2"]["key2_2"]
+    nested["key2_2_3"] = "val2_2_3"
+    assert sndict_a.dim == (3, 3, 6)
+    removed = sndict_a.pop("key2")
+    assert sndict_a.dim == (2, 1, 2)
+    nested["key2_2_4"] = "val2_2_4"
+    removed["key2_3"] = {"key2_3_1": "val2_3_1"}
+    assert sndict_a.dim == (2, 1, 2)
+    assert removed.dim == (3, 6)
+
+    for copied in [pickle.loads(pickle.dumps(named_sndict_a)),
+                   copy.deepcopy(named_sndict_a)]:
+        assert copied.dim == (2, 3, 4)
+        copied["key2"]["key2_5"] = {}
+        assert copied.dim == (2, 4, 4)
+        assert copied.level_names == ("a", "b", "c")
+
+
 def test_iterflatten():
     sndict = StructuredNestedDict(dict_a, levels=3)
     assert list_equal(
@@ -100,6 +149,19 @@ def test_iterflatten():
     )
 
 
+def test_named_key_tuples():
+    named_sndict_a = StructuredNestedDict(
+        dict_a, levels=3, level_names=["a", "b", "c"])
+    key_tup_class = named_sndict_a.get_named_tuple(levels=2)
+    assert key_tup_class is named_sndict_a.get_named_tuple(levels=2)
+    assert key_tup_class._fields == ("a", "b")
+
+    first_key = named_sndict_a.flatten_keys(1)[0]
+    assert isinstance(first_key, key_tup_class)
+    assert (first_key.a, first_key.b) == ("key1", "key1_1")
+    assert type(named_sndict_a.flatten_keys(named=False)[0]) is tuple
+
+
 def test_flatten():
     named_sndict_a = StructuredNestedDict(
         dict_a, levels=3, level_names=["a", "b", "c"])
@@ -137,6 +199,13 @@ def test_stratify():
     assert flattened_stratified_named_sndict_a.dim == (2, 3, 5)
     assert flattened_stratified_named_sndict_a
 
+    # Keys too short to stratify leave values where dicts are expected
+    for val in [1, "val", [("key", "val")]]:
+        with pytest.raises(TypeError):
+            StructuredNestedDict({
+                ("key1", "key1_1"): "val1_1", ("key2",): val,
+            }).stratify(1)
+
 
 def test_rearrange():
     named_sndict_a = StructuredNestedDict(
@@ -181,6 +250,40 @@ def test_swap_levels():
         ("c", "b", "a")
 
 
+def test_derived_independent():
+    # Results share values, but not nested dictionaries, with the source
+    named_sndict_c = StructuredNestedDict(
+        dict_c, levels=3, level_names=["a", "b", "c"])
+    flat = named_sndict_c.flatten(named=False)
+    for derived in [
+        named_sndict_c.swap_levels("a", "b"),
+        named_sndict_c.rearrange(level_name_ls=["b", "a"]),
+        named_sndict_c.filter_key([["key1", "key2"]]),
+        named_sndict_c.sort_keys(reverse=True),
+        named_sndict_c.filter_values(lambda x: True, level=0),
+        StructuredNestedDict(named_sndict_c, levels=3),
+    ]:
+        for key_tup in list(derived.flatten_keys(levels=-2, named=False)):
+            derived.ixkeys[key_tup]["new_key"] = "new_val"
+        assert named_sndict_c.flatten(named=False) == flat
+        assert named_sndict_c.dim == (3, 3, 9)
+
+
+def test_rearrange_partial():
+    named_sndict_c = StructuredNestedDict(
+        dict_c, levels=3, level_names=["a", "b", "c"])
+    swapped = named_sndict_c.swap_levels("a", "b")
+    assert swapped.level_names == ("b", "a", "c")
+    assert swapped.dim == (2, 3, 9)
+    assert list_equal(swapped.keys(), ["keyX_1", "keyX_2"])
+    assert list_equal(swapped["keyX_1"].keys(), ["key1", "key2"])
+    assert swapped["keyX_1"]["key2"].level_names == ("c",)
+    assert list_equal(
+        swapped.swap_levels("a", "b").flatten(),
+        named_sndict_c.flatten(),
+    )
+
+
 def test_replace_metadata():
     named_sndict_a = StructuredNestedDict(
         dict_a, levels=3, level_names=["a", "b", "c"])
@@ -348,3 +451,425 @@ def test_to_tree_string():
     if six.PY3:
         s = s.replace("type", "class")
     assert StructuredNestedDict(dict_a, levels=3).to_tree_string() == s
+
+
+def test_build_index():
+    sndict_c = StructuredNestedDict(dict_c, levels=3)
+    sndict_c.build_index()
+    assert sndict_c.has_index
+    assert list_equal(
+        map(tuple, sndict_c.unique_keys()),
+        [('key1', 'key2', 'key3'),
+         ('keyX_1', 'keyX_2'),
+         ('keyX_X_1', 'keyX_X_2', 'keyX_X_3', 'keyX_X_4', 'keyX_X_5')],
+    )
+    assert list_equal(
+        sndict_c.ix[:, ["keyX_2"], "keyX_X_1"],
+        ["val2_2_1"],
+    )
+    assert list_equal(
+        sndict_c.filter_key({"level2": ["keyX_X_3"]}, drop_empty=True)
+            .flatten_keys(named=False),
+        [("key2", "keyX_2", "keyX_X_3")],
+    )
+
+    sndict_c["key3"]["keyX_3"] = {"keyX_X_6": "val3_3_6"}
+    del sndict_c["key2"]["keyX_2"]
+    sndict_c["key1"].pop("keyX_1")
+    assert list_equal(
+        map(tuple, sndict_c.unique_keys()),
+        [('key1', 'key2', 'key3'),
+         ('keyX_1', 'keyX_3'),
+         ('keyX_X_1', 'keyX_X_2', 'keyX_X_6')],
+    )
+    assert list_equal(
+        sndict_c.ix[:, :, ["keyX_X_6", "keyX_X_1"]],
+        ["val2_1_1", "val3_3_6"],
+    )
+
+    unpickled = pickle.loads(pickle.dumps(sndict_c))
+    assert unpickled.has_index
+    assert list_equal(unpickled.unique_keys(), sndict_c.unique_keys())
+
+    # Mutations only look for indexed ancestors while any index exists
+    del unpickled
+    sndict_c.drop_index()
+    assert not structurednesteddict._INDEXED_SNDICTS
+    sndict_c["key3"].clear()
+    sndict_c.build_index()
+    assert list_equal(list(sndict_c.unique_keys())[1], ["keyX_1"])
+
+
+def test_from_trusted():
+    named_sndict_a = StructuredNestedDict.from_trusted(
+        dict_a, levels=3, level_names=["a", "b", "c"])
+    assert named_sndict_a.dim == (3, 3, 5)
+    assert named_sndict_a["key2"].level_names == ("b", "c")
+    assert named_sndict_a["key2"]["key2_1"].levels == 1
+    assert list_equal(
+        named_sndict_a.flatten_values(),
+        StructuredNestedDict(dict_a, levels=3).flatten_values(),
+    )
+
+    # Matching StructuredNestedDicts are attached as-is, unless they already
+    # belong to another StructuredNestedDict
+    child = StructuredNestedDict(dict_a["key2"], levels=2,
+                                 level_names=["b", "c"])
+    wrapped = StructuredNestedDict.from_trusted(
+        {"key2": child}, levels=3, level_names=["a", "b", "c"])
+    assert wrapped["key2"] is child
+    child["key2_3"] = {"key2_3_1": "val2_3_1"}
+    assert wrapped.dim == (1, 3, 4)
+    sorted_sndict_a = named_sndict_a.sort_keys(reverse=True)
+    assert sorted_sndict_a["key2"] is not named_sndict_a["key2"]
+    assert sorted_sndict_a["key2"] == named_sndict_a["key2"]
+
+    filtered = named_sndict_a.filter_key([["key2"], "key2_1"])
+    assert filtered.dim == (1, 1, 2)
+    assert filtered["key2"].level_names == ("b", "c")
+
+
+def test_aggregate():
+    sales = StructuredNestedDict({
+        "north": {"mon": {"a": 1, "b": 2}, "tue": {"a": 3}},
+        "south": {"mon": {"b": 4}, "wed": {"c": 5}},
+    }, level_names=["region", "day", "sku"])
+    assert sales.aggregate("sum") == 15
+    assert sales.reduce(sum, level=["region", "day", "sku"]) == 15
+
+    by_region = sales.reduce("sum", level=["day", "sku"])
+    assert by_region.level_names == ("region",)
+    assert list_equal(by_region.items(), [("north", 6), ("south", 9)])
+
+    by_sku_day = sales.aggregate(["count", "mean", max], by=["sku", "day"])
+    assert by_sku_day.level_names == ("sku", "day")
+    assert by_sku_day.dim == (3, 4)
+    assert list_equal(by_sku_day["b"].keys(), ["mon"])
+    assert by_sku_day["b"]["mon"] == col.OrderedDict(
+        [("count", 2), ("mean", 3.0), ("max", 4)])
+
+    over_region = sales.reduce("var", level="region")
+    assert over_region.level_names == ("day", "sku")
+    assert over_region["mon"]["b"] == 2.0
+    assert sales.reduce(sorted, level=0)["mon"]["b"] == [2, 4]
+
+    class Spread(object):
+        def __call__(self, values):
+            return max(values) - min(values)
+
+    top_two = functools.partial(sorted, reverse=True)
+    by_region = sales.aggregate(
+        ["sum", functools.partial(max), Spread(), top_two], by=["region"])
+    assert list_equal(by_region["south"].items(), [
+        ("sum", 9), (repr(functools.partial(max)), 5), ("Spread", 1),
+        (repr(top_two), [5, 4]),
+    ])
+
+
+def test_join():
+    store_sales = StructuredNestedDict({
+        "mon": {"s1": 10, "s2": 20},
+        "tue": {"s1": 30, "s3": 40},
+    }, level_names=["date", "store"])
+    store_skus = StructuredNestedDict({
+        "s1": {"x": "X1", "y": "Y1"},
+        "s2": {"x": "X2"},
+        "s4": {"z": "Z4"},
+    }, level_names=["store", "sku"])
+
+    for left, right in [(store_sales, store_skus), (store_skus, store_sales)]:
+        joined = left.join(right)
+        assert joined.levels == 3
+        assert joined.dim[-1] == 5
+
+    joined = store_sales.join(store_skus)
+    assert joined.level_names == ("date", "store", "sku")
+    assert list_equal(joined.flatten(named=False).items(), [
+        (("mon", "s1", "x"), (10, "X1")),
+        (("mon", "s1", "y"), (10, "Y1")),
+        (("mon", "s2", "x"), (20, "X2")),
+        (("tue", "s1", "x"), (30, "X1")),
+        (("tue", "s1", "y"), (30, "Y1")),
+    ])
+
+    # Hash table built on self instead of other
+    mon_sales = store_sales.filter_key([["mon"]])
+    assert list_equal(
+        mon_sales.join(store_skus, how="outer").flatten(named=False).items(),
+        list(joined.filter_key([["mon"]]).flatten(named=False).items())
+        + [((None, "s4", "z"), (None, "Z4"))],
+    )
+
+    left_joined = store_sales.join(store_skus, how="left")
+    assert left_joined["tue"]["s3"][None] == (40, None)
+
+    outer_joined = store_skus.join(store_sales, how="outer", fill_value=0)
+    assert outer_joined.level_names == ("store", "sku", "date")
+    assert outer_joined["s4"]["z"][None] == ("Z4", 0)
+    assert outer_joined["s3"][None]["tue"] == (0, 40)
+
+
+def test_ndarray():
+    numpy = pytest.importorskip("numpy")
+    cube = StructuredNestedDict({
+        "b": {"x": 1, "y": 2},
+        "a": {"y": 3},
+    }, level_names=["row", "col"])
+    arr, level_keys = cube.to_ndarray(return_keys=True)
+    assert level_keys == [["a", "b"], ["x", "y"]]
+    assert arr.dtype == numpy.float64
+    assert numpy.isnan(arr[0, 0])
+    assert arr[1].tolist() == [1, 2]
+    assert cube.to_ndarray(fill_value=0).dtype.kind == "i"
+
+    round_tripped = StructuredNestedDict.from_ndarray(
+        arr, level_keys, level_names=["row", "col"],
+        drop_value=float("nan"))
+    assert round_tripped.level_names == ("row", "col")
+    assert list_equal(
+        round_tripped.flatten(named=False).items(),
+        [(("a", "y"), 3.0), (("b", "x"), 1.0), (("b", "y"), 2.0)],
+    )
+    assert StructuredNestedDict.from_ndarray(arr, level_keys).dim == (2, 4)
+    with pytest.raises(LevelError):
+        StructuredNestedDict.from_ndarray(arr, [["a", "b"]])
+
+    # NaN is not converted to a string alongside string values
+    labels = cube.map_values(str)
+    arr, level_keys = labels.to_ndarray(return_keys=True)
+    assert arr.dtype == object
+    assert numpy.isnan(arr[0, 0])
+    assert labels.to_ndarray(fill_value="").dtype.kind == "U"
+    assert StructuredNestedDict.from_ndarray(
+        arr, level_keys, level_names=["row", "col"],
+        drop_value=float("nan")) == labels.sort_keys()
+    with pytest.raises(ValueError):
+        labels.to_ndarray(dtype=str)
+
+
+def test_elementwise_ops():
+    sales = StructuredNestedDict({
+        "north": {"mon": 1, "tue": 2},
+        "south": {"mon": 3, "wed": 4},
+    }, level_names=["region", "day"])
+    assert list_equal((sales * 2).flatten_values(), [2, 4, 6, 8])
+    assert list_equal((10 - sales).flatten_values(), [9, 8, 7, 6])
+    assert list_equal((sales / 2).flatten_values(), [0.5, 1.0, 1.5, 2.0])
+    assert list_equal((sales > 2).flatten_values(),
+                      [False, False, True, True])
+    assert list_equal(sales.eq(2).flatten_values(),
+                      [False, True, False, False])
+    assert sales == StructuredNestedDict(sales, level_names=["region", "day"])
+
+    costs = StructuredNestedDict({
+        "mon": {"north": 1, "south": 1},
+        "wed": {"south": 2},
+    }, level_names=["day", "region"])
+    profit = sales - costs
+    assert profit.level_names == ("region", "day")
+    assert list_equal(profit.flatten(named=False).items(), [
+        (("north", "mon"), 0), (("south", "mon"), 2), (("south", "wed"), 2),
+    ])
+
+    weights = StructuredNestedDict({"north": 10, "south": 100},
+                                   level_names=["region"])
+    for weighted in [sales * weights, weights * sales]:
+        assert weighted.level_names == ("region", "day")
+        assert list_equal(weighted.flatten_values(), [10, 20, 300, 400])
+    assert list_equal((weights / sales).flatten_values(),
+                      [10.0, 5.0, 100 / 3.0, 25.0])
+
+    # Results match the Python operators, whether or not numpy is used
+    flags = StructuredNestedDict({"a": True, "b": False})
+    assert list_equal((flags + flags).flatten_values(), [2, 0])
+    assert list_equal((flags - flags).flatten_values(), [0, 0])
+    big = StructuredNestedDict({"a": 2 ** 62, "b": -2 ** 63})
+    assert list_equal((big * 4).flatten_values(), [2 ** 64, -2 ** 65])
+    assert list_equal((big + big).flatten_values(), [2 ** 63, -2 ** 64])
+    mixed = StructuredNestedDict({"a": 1, "b": 2.5})
+    assert list_equal([type(x) for x in (mixed * mixed).flatten_values()],
+                      [int, float])
+    floats = StructuredNestedDict({"a": 1.5, "b": 2.0})
+    assert list_equal((floats * floats).flatten_values(), [2.25, 4.0])
+    with pytest.raises(ZeroDivisionError):
+        floats / 0.0
+
+    labels = StructuredNestedDict({"a": "x", "b": "y"})
+    assert list_equal((labels + "!").flatten_values(), ["x!", "y!"])
+    with pytest.raises(LevelError):
+        sales + StructuredNestedDict({"x": 1}, level_names=["store"])
+
+
+def test_lazy():
+    sales = StructuredNestedDict({
+        "north": {"mon": 1, "tue": 2},
+        "south": {"mon": 3, "wed": 4},
+        "west": {"tue": 5},
+    }, level_names=["region", "day"])
+
+    pipeline = sales.lazy() \
+        .map_values(lambda x: x * 10) \
+        .filter_key({"day": ["mon", "tue"]}) \
+        .filter_values(lambda x: x > 10) \
+        .filter_key([["north", "south"]])
+    result = pipeline.collect()
+    assert result.level_names == ("region", "day")
+    eager = sales.filter_key([["north", "south"], ["mon", "tue"]]) \
+        .map_values(lambda x: x * 10) \
+        .filter_values(lambda x: x > 10, drop_empty=True)
+    assert result == eager
+    assert list_equal(result.flatten(named=False).items(), [
+        (("north", "tue"), 20), (("south", "mon"), 30),
+    ])
+    assert list_equal(list(pipeline.iterflatten())[0][0]._fields,
+                      ["region", "day"])
+
+    kept = sales.lazy().filter_values(lambda x: x > 4).collect(
+        drop_empty=False)
+    assert list_equal(kept.keys(), ["north", "south", "west"])
+    assert list_equal(kept.flatten_values(), [5])
+
+    sales.build_index()
+    indexed = sales.lazy().filter_key([slice(None), "wed"]).collect()
+    assert list_equal(indexed.flatten(named=False).items(),
+                      [(("south", "wed"), 4)])
+
+
+def test_from_records():
+    records = [
+        {"region": "north", "day": "mon", "amount": 1},
+        {"region": "north", "day": "tue", "amount": 2},
+        {"region": "south", "day": "mon", "amount": 3},
+        {"region": "north", "day": "mon", "amount": 4},
+    ]
+    sales = StructuredNestedDict.from_records(
+        iter(records), by=["region", "day"], value="amount")
+    assert sales.level_names == ("region", "day")
+    assert sales.dim == (2, 3)
+    assert list_equal(sales.flatten(named=False).items(), [
+        (("north", "mon"), 4), (("north", "tue"), 2), (("south", "mon"), 3),
+    ])
+    sales["west"] = {"wed": 5}
+    assert sales.dim == (3, 4)
+
+    by_index = StructuredNestedDict.from_records(
+        [("a", 1, "x"), ("b", 2, "y")], by=[0, lambda row: row[1] * 10])
+    assert by_index.levels == 2
+    assert list_equal(by_index.flatten(named=False).items(), [
+        (("a", 10), ("a", 1, "x")), (("b", 20), ("b", 2, "y")),
+    ])
+
+
+def test_from_csv(tmpdir):
+    path = str(tmpdir.join("sales.csv"))
+    with open(path, "w") as f:
+        f.write("region,day,amount,note\n"
+                "north,mon,1,a\n"
+                "north,tue,2,b\n"
+                "south,mon,3,c\n")
+
+    sales = StructuredNestedDict.from_csv(
+        path, by=["region", "day"], value="amount", converter=float)
+    assert sales.level_names == ("region", "day")
+    assert list_equal(sales.flatten_values(), [1.0, 2.0, 3.0])
+
+    rows = StructuredNestedDict.from_csv(path, by=["day"])
+    assert list_equal(rows["mon"].items(),
+                      [("region", "south"), ("amount", "3"), ("note", "c")])
+
+    with open(path) as f:
+        pairs = StructuredNestedDict.from_csv(
+            f, by=["region", "day"], value=["amount", "note"])
+    assert pairs["north"]["tue"] == ("2", "b")
+
+
+def test_tabular_export(tmpdir):
+    sales = StructuredNestedDict({
+        "north": {"mon": 1, "tue": 2},
+        "south": {"mon": 3},
+    }, level_names=["region", "day"])
+    assert list_equal(sales.iter_records(), [
+        ("north", "mon", 1), ("north", "tue", 2), ("south", "mon", 3),
+    ])
+
+    columns = sales.to_columns(value_name="amount")
+    assert list_equal(columns.keys(), ["region", "day", "amount"])
+    assert list_equal(columns["region"], ["north", "north", "south"])
+    assert list_equal(columns["amount"], [1, 2, 3])
+
+    path = str(tmpdir.join("sales.csv"))
+    sales.to_csv(path, value_name="amount")
+    with open(path) as f:
+        assert f.read().splitlines() == [
+            "region,day,amount", "north,mon,1", "north,tue,2", "south,mon,3",
+        ]
+    loaded = StructuredNestedDict.from_csv(
+        path, by=["region", "day"], value="amount", converter=int)
+    assert loaded == sales
+
+
+def test_pickle():
+    sndict_a = StructuredNestedDict(dict_a, level_names=["a", "b", "c"])
+    sndict_a.build_index()
+    loaded = pickle.loads(pickle.dumps(sndict_a))
+    assert loaded == sndict_a
+    # Empty nested dictionaries are kept
+    assert loaded.dim == sndict_a.dim == (3, 3, 5)
+    assert loaded["key2"].level_names == ("b", "c")
+    assert loaded.has_index
+    assert list_equal(loaded.ix[:, :, "key2_1_2"], ["val2_1_2"])
+
+    unnamed = StructuredNestedDict(dict_c, levels=2)
+    loaded = pickle.loads(pickle.dumps(unnamed, protocol=0))
+    assert loaded == unnamed
+    assert not loaded._level_names_is_set
+    assert loaded["key2"]["keyX_1"] == dict_c["key2"]["keyX_1"]
+
+
+def _double(x):
+    return x * 2
+
+
+def test_parallel_map_and_filter(futures):
+    sales = StructuredNestedDict({
+        "north": {"mon": 1, "tue": 2},
+        "south": {"mon": 3},
+        "west": {"tue": 4, "wed": 5},
+    }, level_names=["region", "day"])
+
+    with futures.ThreadPoolExecutor(max_workers=2) as executor:
+        doubled = sales.map_values(_double, executor=executor)
+        assert doubled == sales.map_values(_double)
+        assert doubled.level_names == ("region", "day")
+        filtered = sales.filter_values(lambda x: x % 2 == 1, drop_empty=True,
+                                       executor=executor)
+        assert filtered == sales.filter_values(lambda x: x % 2 == 1,
+                                               drop_empty=True)
+        assert list_equal(filtered.keys(), ["north", "south", "west"])
+
+    assert sales.map_values(_double, workers=2) == sales.map_values(_double)
+    assert list_equal(
+        sales.filter_values([2, 3, 4], workers=2).flatten_values(), [2, 3, 4])
+
+
+def _double_sub_dict(sub_dict):
+    return sub_dict.map_values(_double)
+
+
+def test_parallel_worker_processes(real_futures):
+    sales = StructuredNestedDict({
+        "north": {"mon": 1, "tue": 2},
+        "south": {"mon": 3},
+        "west": {"tue": 4, "wed": 5},
+    }, level_names=["region", "day"])
+    doubled = sales.map_values(_double)
+
+    assert sales.map_values(_double, workers=2) == doubled
+    assert list_equal(
+        sales.filter_values([2, 3, 4], workers=2).flatten_values(), [2, 3, 4])
+    with real_futures.ProcessPoolExecutor(max_workers=2) as executor:
+        # Nested dictionaries are pickled to the workers and back
+        by_region = sales.map_values(_double_sub_dict, at_level=0,
+                                     executor=executor)
+        assert by_region == doubled
+        assert by_region.level_names == ("region", "day")